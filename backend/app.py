@@ -1,12 +1,35 @@
-from fastapi import FastAPI, UploadFile, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import pandas as pd
-import io, os
-from utils.etl_parser import generate_config, generate_dag
-from utils.transformer import transform_data
-from utils.openai_helper import get_smart_fix, generate_config_with_ai, get_transformation_suggestions
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import os
+import tempfile
+import time
+from typing import List
+from utils.openai_helper import get_smart_fix_async
+from utils.result_store import hold_result, get_page
+from utils.ingest import spool_upload
+from utils.excel import SheetRange, is_excel
+from utils.dataset_cache import cache_stats
+from utils.stage_cache import stage_cache_stats
+from utils.ai_cache import ai_cache_stats
+from utils.workflow import (
+    load_upload, run_streaming_transform, run_workflow_async, run_workflow_job, run_preview, run_dag_workflow,
+    build_response, build_job_response, SUPPORTED_EXTENSIONS
+)
+from utils.metrics import collect_timings, observe_request, render_metrics
+from utils.serialization import (
+    negotiate_format, is_format_available, iter_frames, iter_ndjson, iter_arrow, write_parquet,
+    records_json, columns_json, envelope_json, FORMATS
+)
+from utils.jobs import submit_job, get_job, cancel_job, JobQueueFull
+from utils.preview import retain_upload, claim_upload, PREVIEW_SAMPLE_ROWS
+from utils.streaming import STREAM_CHUNK_ROWS
+from utils.admission import acquire, release, estimate_memory, admission_stats, AdmissionRejected
+from utils.plan import compile_plan
+from utils.joins import spool_lookups, remove_lookups, missing_lookups, is_broadcast, join_index_stats
 
 app = FastAPI()
 
@@ -18,6 +41,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, keep the label set bounded
+        route = request.scope.get("route")
+        observe_request(request.method, route.path if route is not None else "unmatched", status, time.perf_counter() - start)
+
 # Serve frontend
 frontend_dir = os.path.join(os.path.dirname(__file__), "..", "frontend")
 app.mount("/frontend", StaticFiles(directory=frontend_dir), name="frontend")
@@ -31,57 +67,276 @@ async def generate_workflow(
     prompt: str = Form(...),
     target_format: str = Form("json"),
     file: UploadFile = None,
-    use_ai: bool = Form(False)
+    use_ai: bool = Form(False),
+    stream: bool = Form(False),
+    timings: bool = Form(False),
+    sheet: str = Form(None),
+    start_row: int = Form(0),
+    max_rows: int = Form(None),
+    preview: bool = Form(False),
+    dag: bool = Form(False),
+    lookups: List[UploadFile] = File(None)
 ):
+    path = None
+    ticket = None
+    tables = ()
+    sheet_range = SheetRange(sheet, start_row, max_rows)
     try:
-        df = None
+        step_timings = collect_timings()
+        df = key = upload = None
+        streamed = None
+        ingest = {}
         if file:
-            content = await file.read()
-            if file.filename.endswith(".csv"):
-                df = pd.read_csv(io.BytesIO(content))
-            elif file.filename.endswith((".xlsx", ".xls")):
-                df = pd.read_excel(io.BytesIO(content))
-            else:
+            # Spool to disk so the raw bytes and the parsed frame are never both in memory
+            spooled = await spool_upload(file)
+            path = spooled.path
+            # Lookup tables the prompt joins to, e.g. "join with departments on dept_id" and departments.csv
+            tables = await _spool_lookups(lookups, prompt)
+            if file.filename.endswith(SUPPORTED_EXTENSIONS):
+                # Parsing starts once the request's estimated memory fits the budget
+                rows_held = max_rows if is_excel(file.filename) else None
+                if preview:
+                    rows_held = PREVIEW_SAMPLE_ROWS
+                elif stream:
+                    rows_held = STREAM_CHUNK_ROWS
+                cost = estimate_memory(path, file.filename, spooled.size, rows_held)
+                # Small lookups are indexed whole; large ones a partition at a time
+                cost += sum(
+                    estimate_memory(table.path, table.filename, table.size, None if is_broadcast(table) else STREAM_CHUNK_ROWS)
+                    for table in tables
+                )
+                ticket = await acquire(cost)
+            if preview and file.filename.endswith(SUPPORTED_EXTENSIONS):
+                # Sampled run; the full run only happens on POST /previews/{preview_id}/run
+                response = await asyncio.to_thread(
+                    run_preview, prompt, target_format, path, file.filename, spooled.sha256, sheet_range, tables
+                )
+                response["preview"]["preview_id"] = retain_upload(
+                    path, file.filename, spooled.sha256, sheet_range, prompt, target_format, lookups=tables
+                )
+                path, tables = None, ()  # the retained upload is removed by its full run or on expiry
+                if timings:
+                    response["timings"] = step_timings
+                return response
+            if dag and file.filename.endswith(SUPPORTED_EXTENSIONS):
+                # Node by node, with checkpoints a failed run resumes from
+                workflow = await asyncio.to_thread(
+                    run_dag_workflow, prompt, target_format, path, file.filename, use_ai, spooled.sha256, sheet_range,
+                    lookups=tables
+                )
+                workflow["timings"] = step_timings
+                return build_response(workflow, include_timings=timings)
+            if stream and (file.filename.endswith(".csv") or is_excel(file.filename)):
+                # Chunked mode: peak memory is bounded by chunk size, not file size
+                streamed = await asyncio.to_thread(
+                    run_streaming_transform, path, prompt, file.filename, spooled.sha256, sheet_range, tables
+                )
+            elif not file.filename.endswith(SUPPORTED_EXTENSIONS):
                 raise HTTPException(status_code=400, detail="Unsupported file format")
+            else:
+                # Re-uploads of the same content skip parsing via the dataset cache
+                # Only the columns and rows the prompt needs are parsed when it allows
+                df, key, upload = await asyncio.to_thread(
+                    load_upload, path, file.filename, prompt, spooled.sha256, ingest, sheet_range
+                )
 
-        # Generate configuration in backend
-        if use_ai:
-            config = generate_config_with_ai(prompt, target_format)
-        else:
-            config = generate_config(prompt, target_format)
-        
-        # Generate DAG diagram
-        dag = generate_dag(prompt)
-        
-       # Transform data if file provided
-        transformed = None
-        if df is not None:
-            transformed = transform_data(df, prompt)
-
-        # Initialize AI suggestions
-        ai_suggestions = None
-        
-        # Get AI transformation suggestions if available
-        if use_ai and df is not None:
-            ai_suggestions = get_transformation_suggestions(df.columns.tolist(), prompt)
-
-        return {
-            "success": True,
-            "config": config,
-            "dag": dag,
-            "transformed_data": transformed.to_dict(orient="records") if transformed is not None else [],
-            "original_data": df.to_dict(orient="records") if df is not None else [],
-            "ai_suggestions": ai_suggestions,
-            "ai_used": use_ai
-        }
+        # AI calls and the transform run concurrently; pandas work stays off the event loop
+        workflow = await run_workflow_async(
+            prompt, target_format, df, use_ai, streamed=streamed, dataset_key=key, upload=upload, lookups=tables
+        )
+        workflow["ingest"] = ingest or None
+        workflow["timings"] = step_timings
+        return build_response(workflow, include_timings=timings)
     
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing workflow: {str(e)}")
+    finally:
+        if ticket is not None:
+            release(ticket)
+        if path:
+            os.remove(path)
+        remove_lookups(tables)
+
+async def _spool_lookups(lookups: list, prompt: str) -> tuple:
+    """Spool lookup uploads, checking that the prompt's joins each have one"""
+    for lookup in lookups or ():
+        if not lookup.filename.endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail=f"Unsupported lookup file format: {lookup.filename}")
+    tables = await spool_lookups(lookups)
+    missing = missing_lookups(compile_plan(prompt), tables)
+    if missing:
+        remove_lookups(tables)
+        raise HTTPException(status_code=400, detail=f"No lookup table uploaded for: {', '.join(missing)}")
+    return tables
+
+@app.post("/jobs")
+async def submit_workflow_job(
+    prompt: str = Form(...),
+    target_format: str = Form("json"),
+    file: UploadFile = None,
+    use_ai: bool = Form(False),
+    timings: bool = Form(False),
+    sheet: str = Form(None),
+    start_row: int = Form(0),
+    max_rows: int = Form(None),
+    dag: bool = Form(False),
+    lookups: List[UploadFile] = File(None)
+):
+    path = None
+    filename = None
+    digest = None
+    tables = ()
+    if file:
+        if not file.filename.endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(status_code=400, detail="Unsupported file format")
+        spooled = await spool_upload(file)
+        path, filename, digest = spooled.path, file.filename, spooled.sha256
+        try:
+            tables = await _spool_lookups(lookups, prompt)
+        except BaseException:
+            os.remove(path)
+            raise
+
+    def remove_files():
+        if path:
+            os.remove(path)
+        remove_lookups(tables)
+
+    try:
+        job_id = submit_job(
+            run_workflow_job, path, filename, prompt, target_format, use_ai, digest, SheetRange(sheet, start_row, max_rows),
+            dag, tables, on_done=lambda workflow: build_job_response(workflow, include_timings=timings),
+            on_cancel=remove_files if path else None
+        )
+    except JobQueueFull as e:
+        remove_files()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    return {"success": True, "job_id": job_id, "state": "queued"}
+
+@app.post("/previews/{preview_id}/run")
+async def run_full_workflow(
+    preview_id: str,
+    prompt: str = Form(None),
+    use_ai: bool = Form(False),
+    timings: bool = Form(False)
+):
+    """Run a preview's pipeline on its complete upload as a background job"""
+    upload = claim_upload(preview_id)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Preview not found or expired")
+    path = upload["path"]
+
+    try:
+        job_id = submit_job(
+            run_workflow_job, path, upload["filename"], prompt or upload["prompt"], upload["target_format"], use_ai,
+            upload["digest"], upload["sheet_range"], False, upload["lookups"],
+            on_done=lambda workflow: build_job_response(workflow, include_timings=timings),
+            on_cancel=lambda: (os.remove(path), remove_lookups(upload["lookups"]))
+        )
+    except JobQueueFull as e:
+        # Keep the upload, so the run can be requested again
+        retain_upload(path, upload["filename"], upload["digest"], upload["sheet_range"], upload["prompt"],
+                      upload["target_format"], preview_id=preview_id, lookups=upload["lookups"])
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    return {"success": True, "job_id": job_id, "state": "queued"}
+
+@app.get("/jobs/{job_id}")
+def get_workflow_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, **job}
+
+@app.delete("/jobs/{job_id}")
+def cancel_workflow_job(job_id: str):
+    if get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job_id": job_id, "cancelled": cancel_job(job_id)}
+
+@app.get("/results/{result_id}")
+def get_results(request: Request, result_id: str, dataset: str = "transformed", offset: int = 0, limit: int = None,
+                format: str = None):
+    held = hold_result(result_id)
+    if held is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    datasets, release = held
+    # Eviction must not close a dataset while it is read; streamed bodies release it when they end
+    streaming = False
+    try:
+        if dataset not in datasets:
+            raise HTTPException(status_code=400, detail=f"Unknown dataset: {dataset}")
+
+        response_format = negotiate_format(format, request.headers.get("accept"))
+        if response_format is None:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {format}. Use one of {', '.join(FORMATS)}")
+        if not is_format_available(response_format):
+            raise HTTPException(status_code=406, detail=f"The {response_format} format requires pyarrow")
+        df = datasets[dataset]
+
+        # json and columns are paged; the streamed formats default to every row from offset
+        if response_format in ("json", "columns"):
+            page = get_page(df, offset, 100 if limit is None else limit)
+            rows = page.pop("page")
+            meta = {"success": True, "result_id": result_id, "dataset": dataset, **page}
+            if response_format == "json":
+                body = envelope_json(meta, "rows", records_json(rows))
+            else:
+                body = envelope_json(meta, "data", columns_json(rows))
+            return Response(body, media_type=FORMATS[response_format])
+
+        offset = max(offset, 0)
+        limit = None if limit is None else max(limit, 0)
+        frames = iter_frames(df, offset, limit)
+        if response_format in ("ndjson", "arrow"):
+            chunks = iter_ndjson(frames) if response_format == "ndjson" else iter_arrow(frames)
+            streaming = True
+            return StreamingResponse(_released_after(chunks, release), media_type=FORMATS[response_format],
+                                     background=BackgroundTask(release))
+
+        # Parquet needs its footer written before the file can be read, so it is built on disk first
+        fd, path = tempfile.mkstemp(prefix="etl-result-", suffix=".parquet")
+        os.close(fd)
+        try:
+            write_parquet(frames, path)
+        except BaseException:
+            os.remove(path)
+            raise
+        return FileResponse(path, media_type=FORMATS["parquet"], filename=f"{dataset}.parquet",
+                            background=BackgroundTask(os.remove, path))
+    finally:
+        if not streaming:
+            release()
+
+def _released_after(chunks, release):
+    """A response body that ends its result hold when done, including when the client goes away"""
+    try:
+        yield from chunks
+    finally:
+        release()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {"success": True, "datasets": cache_stats(), "stages": stage_cache_stats(), "ai": ai_cache_stats(),
+            "join_indexes": join_index_stats()}
+
+@app.get("/admission/stats")
+def get_admission_stats():
+    return {"success": True, **admission_stats()}
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.post("/smart-fix")
 async def smart_fix(error_message: str = Form(...)):
     try:
-        suggestion = get_smart_fix(error_message)
+        suggestion = await get_smart_fix_async(error_message)
         return {"success": True, "fix_suggestion": suggestion}
     except Exception as e:
         return {"success": False, "error": f"Failed to generate fix: {str(e)}"}
@@ -0,0 +1,65 @@
+"""
+Compare two benchmark result files:
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+def _stage_rows(results: dict) -> dict:
+    rows = {}
+    for entry in results["stages"]:
+        base = (entry["shape"], entry["rows"], entry["prompt"])
+        for stage in entry["stages"]:
+            rows[base + (stage["stage"],)] = stage
+        rows[base + ("transform_data",)] = entry["transform_data"]
+    return rows
+
+def _ratio(before, after) -> str:
+    if not before or after is None:
+        return "n/a"
+    return f"{after / before:.2f}x"
+
+def compare(before: dict, after: dict, min_seconds: float = 0.001) -> list:
+    """Lines describing the change of every measurement present in both runs"""
+    lines = []
+    old, new = _stage_rows(before), _stage_rows(after)
+    for key in old.keys() & new.keys():
+        a, b = old[key], new[key]
+        if max(a["seconds_median"], b["seconds_median"]) < min_seconds:
+            continue
+        shape, rows, prompt, stage = key
+        lines.append(
+            f"{shape:<10} {rows:>9} {stage:<15} "
+            f"{a['seconds_median']:.4f}s -> {b['seconds_median']:.4f}s ({_ratio(a['seconds_median'], b['seconds_median'])}) "
+            f"peak {a['peak_bytes'] / 1024 ** 2:.1f} -> {b['peak_bytes'] / 1024 ** 2:.1f} MB  {prompt}"
+        )
+    lines.sort()
+
+    old_endpoint = {entry["shape"]: entry for entry in before.get("endpoint", [])}
+    for entry in after.get("endpoint", []):
+        previous = old_endpoint.get(entry["shape"])
+        if previous is None:
+            continue
+        lines.append(
+            f"endpoint {entry['shape']:<10} rps {previous['throughput_rps']:.1f} -> {entry['throughput_rps']:.1f}  "
+            f"p50 {previous['latency']['p50'] * 1000:.1f} -> {entry['latency']['p50'] * 1000:.1f} ms  "
+            f"p99 {previous['latency']['p99'] * 1000:.1f} -> {entry['latency']['p99'] * 1000:.1f} ms"
+        )
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--min-seconds", type=float, default=0.001, help="hide measurements faster than this")
+    args = parser.parse_args(argv)
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    for line in compare(before, after, args.min_seconds):
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+SHAPES = ("employees", "inventory", "sales")
+
+def _pool(prefix: str, size: int) -> np.ndarray:
+    return np.array([f"{prefix} {i}" for i in range(max(size, 1))], dtype=object)
+
+def _dates(rng, rows: int) -> np.ndarray:
+    days = rng.integers(0, 5 * 365, rows)
+    return (np.datetime64("2020-01-01") + days).astype(str).astype(object)
+
+def _employees(rng, rows: int, cardinality: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Employee ID": np.arange(rows),
+        "First Name": rng.choice(_pool(" first", cardinality), rows),
+        "Last Name": rng.choice(_pool("last ", cardinality), rows),
+        "Department": rng.choice(np.array(["sales", "engineering", "hr", "finance", "support"], dtype=object), rows),
+        "Salary": rng.integers(30_000, 150_000, rows),
+        "Performance Score": np.round(rng.uniform(1, 5, rows), 1),
+        "Status": rng.choice(np.array(["Active", "inactive", "on leave"], dtype=object), rows),
+        "Hire Date": _dates(rng, rows),
+    })
+
+def _inventory(rng, rows: int, cardinality: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Product": rng.choice(_pool("product ", cardinality), rows),
+        "Category": rng.choice(np.array(["hardware", "software", "accessories", "parts"], dtype=object), rows),
+        "Quantity": rng.integers(0, 300, rows),
+        "Unit Price": np.round(rng.uniform(1, 500, rows), 2),
+        "Stock Level": rng.integers(0, 1000, rows),
+        "Updated Date": _dates(rng, rows),
+    })
+
+def _sales(rng, rows: int, cardinality: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Order ID": np.arange(rows),
+        "Customer": rng.choice(_pool("customer", cardinality), rows),
+        "Region": rng.choice(np.array(["north", "south", "east", "west"], dtype=object), rows),
+        "Quantity": rng.integers(1, 50, rows),
+        "Price": np.round(rng.uniform(1, 200, rows), 2),
+        "Status": rng.choice(np.array(["active", "cancelled", "returned"], dtype=object), rows),
+        "Order Date": _dates(rng, rows),
+    })
+
+_GENERATORS = {"employees": _employees, "inventory": _inventory, "sales": _sales}
+
+def _customers(rng, cardinality: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Customer": _pool("customer", cardinality),
+        "Segment": rng.choice(np.array(["retail", "wholesale", "online"], dtype=object), max(cardinality, 1)),
+        "Credit Limit": rng.integers(1_000, 50_000, max(cardinality, 1)),
+    })
+
+# Lookup tables the prompts of a shape join, by the name prompts use for them
+_LOOKUPS = {"sales": {"customers": _customers}}
+
+def make_lookups(shape: str, cardinality: int = 1000, seed: int = 0) -> dict:
+    """Synthetic lookup tables for a shape's join prompts, one row per key, by table name"""
+    rng = np.random.default_rng(seed)
+    return {name: generator(rng, cardinality) for name, generator in _LOOKUPS.get(shape, {}).items()}
+
+def make_dataset(shape: str, rows: int, null_rate: float = 0.05, cardinality: int = 1000, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic dataset of the given shape, reproducible for a seed.
+    cardinality is the number of distinct names/products/customers; null_rate is the
+    share of missing values in every column except identifiers.
+    """
+    if shape not in _GENERATORS:
+        raise ValueError(f"Unknown dataset shape: {shape}")
+
+    rng = np.random.default_rng(seed)
+    df = _GENERATORS[shape](rng, rows, cardinality)
+    if null_rate > 0:
+        for col in df.columns:
+            if col.endswith(" ID"):
+                continue
+            mask = rng.random(rows) < null_rate
+            if mask.any():
+                # Integer columns become float, as they would when read from a CSV with gaps
+                df[col] = df[col].mask(mask)
+    return df
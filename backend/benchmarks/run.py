@@ -0,0 +1,270 @@
+"""
+Benchmark the transformer stages and the /generate-workflow endpoint.
+
+Run from the backend directory:
+    python -m benchmarks.run --rows 10000 100000 --output bench.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Keep benchmark runs out of the real dataset cache; must be set before utils is imported
+_CACHE_DIR = tempfile.mkdtemp(prefix="etl-bench-cache-")
+os.environ.setdefault("DATASET_CACHE_DIR", _CACHE_DIR)
+
+from utils import transformer
+from utils.plan import STAGE_ORDER
+from .datasets import SHAPES, make_dataset, make_lookups
+
+PROMPTS = {
+    "employees": [
+        "clean names and sort by salary desc",
+        "filter salary > 60000 then group by department and mean salary",
+        "fill null values with mean and uppercase department",
+        "combine names into full name and classify performance category",
+        "lowercase status and filter active records",
+    ],
+    "inventory": [
+        "calculate revenue and classify inventory stock",
+        "group by category and sum quantity",
+        "filter quantity > 100 then sort by unit_price desc",
+        "remove null values",
+    ],
+    "sales": [
+        "calculate revenue then sort by revenue desc",
+        "filter status = active then group by region and sum quantity",
+        "enrich sales with customers on customer then group by segment and sum quantity",
+        "convert order_date to datetime and add timestamp",
+        "clean the data and group by customer",
+    ],
+}
+
+STAGE_FUNCTIONS = {
+    "joining": transformer.apply_joins,
+    "math": transformer.apply_mathematical_operations,
+    "cleaning": transformer.apply_data_cleaning,
+    "filtering": transformer.apply_filtering,
+    "columns": transformer.apply_column_operations,
+    "dates": transformer.apply_date_operations,
+    "grouping": transformer.apply_grouping_aggregation,
+    "sorting": transformer.apply_sorting,
+}
+
+def _measure(fn, repeat: int) -> tuple:
+    """Wall time over repeated runs, then one traced run for the peak allocation"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    # Traced separately: tracemalloc slows allocation-heavy code considerably
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds_min": min(times),
+        "seconds_median": float(np.median(times)),
+        "peak_bytes": peak - baseline,
+    }, result
+
+def write_lookups(shape: str, cardinality: int, seed: int) -> tuple:
+    """A shape's lookup tables as CSV files in the benchmark cache directory"""
+    from utils.joins import Lookup
+
+    lookups = []
+    for name, table in make_lookups(shape, cardinality, seed).items():
+        path = os.path.join(_CACHE_DIR, f"{name}.csv")
+        table.to_csv(path, index=False)
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        lookups.append(Lookup(name, path, f"{name}.csv", digest, os.path.getsize(path)))
+    return tuple(lookups)
+
+def bench_stages(df: pd.DataFrame, prompt: str, repeat: int, lookups: tuple = None) -> dict:
+    """Time every apply_* stage in pipeline order, then the full transform_data"""
+    stages = []
+    current = transformer.clean_column_names(df.copy(deep=False))
+    for name in STAGE_ORDER:
+        fn = STAGE_FUNCTIONS[name]
+        stage_input = current
+        if name == "joining":
+            metrics, current = _measure(lambda: fn(stage_input, prompt, lookups), repeat)
+        else:
+            metrics, current = _measure(lambda: fn(stage_input, prompt), repeat)
+        stages.append({"stage": name, "rows_in": len(stage_input), "rows_out": len(current), **metrics})
+
+    metrics, result = _measure(lambda: transformer.transform_data(df, prompt, lookups=lookups), repeat)
+    return {
+        "prompt": prompt,
+        "stages": stages,
+        "transform_data": {"rows_in": len(df), "rows_out": len(result), **metrics},
+    }
+
+class _StubCompletions:
+    def __init__(self, latency: float, is_async: bool):
+        self.latency = latency
+        self.is_async = is_async
+
+    def _response(self, params: dict):
+        content = '{"workflow": {"name": "benchmark", "steps": []}}' if params.get("max_tokens") == 500 else "stub"
+        message = type("Message", (), {"content": content})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+    def create(self, **params):
+        if self.is_async:
+            return self._create_async(params)
+        time.sleep(self.latency)
+        return self._response(params)
+
+    async def _create_async(self, params: dict):
+        await asyncio.sleep(self.latency)
+        return self._response(params)
+
+def _stub_client(latency: float, is_async: bool):
+    chat = type("Chat", (), {"completions": _StubCompletions(latency, is_async)})
+    return type("Client", (), {"chat": chat})
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {f"p{p}": float(np.percentile(values, p)) for p in (50, 90, 95, 99)}
+
+async def _bench_endpoint_async(app, csv_bytes: bytes, prompt: str, requests: int, concurrency: int,
+                                use_ai: bool, vary_uploads: bool) -> dict:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    # Application errors are counted as failed requests rather than raised
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def send(i: int):
+            nonlocal errors
+            # Trailing blank lines change the content hash but not the parsed data
+            body = csv_bytes + b"\n" * (i + 1) if vary_uploads else csv_bytes
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/generate-workflow",
+                    data={"prompt": prompt, "use_ai": str(use_ai).lower()},
+                    files={"file": ("bench.csv", body, "text/csv")},
+                )
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        await send(-1)  # warm-up: imports, plan compilation, first parse
+        latencies.clear()
+        errors = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "prompt": prompt,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed if elapsed else None,
+        "latency_mean": float(np.mean(latencies)),
+        "latency": _percentiles(latencies),
+    }
+
+def bench_endpoint(df: pd.DataFrame, prompt: str, requests: int, concurrency: int, use_ai: bool = False,
+                   ai_latency: float = 0.0, vary_uploads: bool = False) -> dict:
+    """Drive /generate-workflow in-process through the ASGI transport, with OpenAI stubbed"""
+    from app import app
+    from utils import openai_helper
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    openai_helper.set_openai_client(_stub_client(ai_latency, is_async=False))
+    openai_helper.set_async_openai_client(_stub_client(ai_latency, is_async=True))
+    csv_bytes = df.to_csv(index=False).encode()
+    result = asyncio.run(_bench_endpoint_async(app, csv_bytes, prompt, requests, concurrency, use_ai, vary_uploads))
+    return {"rows": len(df), "upload_bytes": len(csv_bytes), "use_ai": use_ai, "ai_latency": ai_latency,
+            "vary_uploads": vary_uploads, **result}
+
+def _metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark transformer stages and the workflow endpoint")
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--rows", nargs="+", type=int, default=[10_000, 100_000])
+    parser.add_argument("--null-rate", type=float, default=0.05)
+    parser.add_argument("--cardinality", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-endpoint", action="store_true")
+    parser.add_argument("--endpoint-rows", type=int, default=10_000)
+    parser.add_argument("--endpoint-null-rate", type=float, default=0.0)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--use-ai", action="store_true", help="exercise the (stubbed) OpenAI path")
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="seconds per stubbed OpenAI call")
+    parser.add_argument("--vary-uploads", action="store_true", help="defeat the dataset and stage caches")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+
+    results = {"meta": _metadata(args), "stages": [], "endpoint": []}
+    try:
+        if not args.skip_stages:
+            for shape in args.shapes:
+                lookups = write_lookups(shape, args.cardinality, args.seed)
+                for rows in args.rows:
+                    df = make_dataset(shape, rows, args.null_rate, args.cardinality, args.seed)
+                    for prompt in PROMPTS[shape]:
+                        print(f"stages: {shape} x {rows} rows: {prompt}")
+                        results["stages"].append({"shape": shape, "rows": rows,
+                                                  **bench_stages(df, prompt, args.repeat, lookups)})
+
+        if not args.skip_endpoint:
+            for shape in args.shapes:
+                df = make_dataset(shape, args.endpoint_rows, args.endpoint_null_rate, args.cardinality, args.seed)
+                prompt = PROMPTS[shape][0]
+                print(f"endpoint: {shape} x {args.endpoint_rows} rows: {prompt}")
+                results["endpoint"].append({"shape": shape, **bench_endpoint(
+                    df, prompt, args.requests, args.concurrency, args.use_ai, args.ai_latency, args.vary_uploads
+                )})
+    finally:
+        shutil.rmtree(_CACHE_DIR, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+    return results
+
+if __name__ == "__main__":
+    main()
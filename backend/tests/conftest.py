@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Keep test runs out of the real caches; must be set before utils is imported
+os.environ.setdefault("DATASET_CACHE_DIR", tempfile.mkdtemp(prefix="etl-test-cache-"))
+
+# Tests import the backend modules the way app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import asyncio
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils import admission
+from utils.admission import AdmissionRejected, acquire, admission_stats, estimate_shape, release
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MEMORY_BYTES", 100)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_CONCURRENT", 4)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUED", 4)
+
+def test_upload_shape_is_estimated_without_parsing(tmp_path):
+    frame = pd.DataFrame({"a": range(1000), "b": ["text"] * 1000, "c": [1.5] * 1000})
+    csv_path = tmp_path / "data.csv"
+    frame.to_csv(csv_path, index=False)
+    rows, columns = estimate_shape(str(csv_path), "data.csv", csv_path.stat().st_size)
+    assert columns == 3 and 900 <= rows <= 1100
+
+    pytest.importorskip("openpyxl")
+    xlsx_path = tmp_path / "data.xlsx"
+    frame.to_excel(xlsx_path, index=False)
+    assert estimate_shape(str(xlsx_path), "data.xlsx", xlsx_path.stat().st_size) == (1001, 3)
+
+def test_waiters_are_admitted_in_arrival_order(budget):
+    async def scenario():
+        first = await acquire(80, timeout=1)
+        admitted = []
+
+        async def wait(name, cost):
+            ticket = await acquire(cost, timeout=1)
+            admitted.append(name)
+            return ticket
+
+        # The small request fits the budget, but must not overtake the large one
+        large = asyncio.create_task(wait("large", 60))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(wait("small", 10))
+        await asyncio.sleep(0.05)
+        assert admitted == [] and admission_stats()["queued"] == 2
+
+        release(first)
+        tickets = await asyncio.gather(large, small)
+        for ticket in tickets:
+            release(ticket)
+        return admitted
+
+    assert asyncio.run(scenario()) == ["large", "small"]
+    assert admission_stats()["used_bytes"] == 0
+
+def test_wait_times_out_and_a_full_queue_rejects_at_once(budget, monkeypatch):
+    async def scenario():
+        ticket = await acquire(100, timeout=1)
+        try:
+            with pytest.raises(AdmissionRejected):
+                await acquire(50, timeout=0.05)
+            monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUED", 0)
+            with pytest.raises(AdmissionRejected) as rejected:
+                await acquire(50, timeout=1)
+            assert rejected.value.retry_after == admission.ADMISSION_RETRY_AFTER_SECONDS
+        finally:
+            release(ticket)
+
+    timed_out = admission_stats()["timed_out"]
+    asyncio.run(scenario())
+    assert admission_stats()["timed_out"] == timed_out + 1
+    assert admission_stats()["active"] == 0
+
+def test_busy_server_answers_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_CONCURRENT", 0)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUED", 0)
+    response = TestClient(app).post(
+        "/generate-workflow", data={"prompt": "group by region"},
+        files={"file": ("orders.csv", "region,amount\nn,1\n", "text/csv")},
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER_SECONDS)
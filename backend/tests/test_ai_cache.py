@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from utils import ai_cache, openai_helper
+
+def _reply(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f" {text}\n"))])
+
+class StubClient:
+    """Stands in for openai.OpenAI; records every chat completion request"""
+
+    def __init__(self, gate: threading.Event = None, fail_first: int = 0):
+        self.chat = SimpleNamespace(completions=self)
+        self.calls = []
+        self.gate = gate
+        self.fail_first = fail_first
+
+    def create(self, **params):
+        self.calls.append(params)
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        if len(self.calls) <= self.fail_first:
+            raise ConnectionError("stub is down")
+        return _reply(f"answer {len(self.calls)}")
+
+class AsyncStubClient(StubClient):
+    """Stands in for openai.AsyncOpenAI"""
+
+    async def create(self, **params):
+        self.calls.append(params)
+        await asyncio.sleep(0.01)
+        return _reply(f"answer {len(self.calls)}")
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(ai_cache, "AI_CACHE_DIR", None)
+    ai_cache._memory.clear()
+    yield
+    ai_cache._memory.clear()
+    openai_helper.set_openai_client(None)
+    openai_helper.set_async_openai_client(None)
+
+def _stub(**kwargs) -> StubClient:
+    client = StubClient(**kwargs)
+    openai_helper.set_openai_client(client)
+    return client
+
+def test_identical_normalized_prompts_call_the_client_once():
+    client = _stub()
+    first = openai_helper.get_smart_fix("KeyError:  'amount'")
+    assert openai_helper.get_smart_fix("KeyError: 'amount'\n") == first == "answer 1"
+    assert len(client.calls) == 1
+
+    assert openai_helper.get_smart_fix("KeyError: 'price'") == "answer 2"
+    assert len(client.calls) == 2
+
+def test_cache_key_covers_model_parameters():
+    client = StubClient()
+    messages = [{"role": "user", "content": "hi"}]
+    for _ in range(2):
+        ai_cache.cached_completion(client, model="gpt-4o-mini", messages=messages, max_tokens=100)
+        ai_cache.cached_completion(client, model="gpt-4o-mini", messages=messages, max_tokens=200)
+        ai_cache.cached_completion(client, model="gpt-4o", messages=messages, max_tokens=100)
+    assert len(client.calls) == 3
+
+def test_concurrent_identical_prompts_share_one_call():
+    gate = threading.Event()
+    client = _stub(gate=gate)
+    coalesced = ai_cache._stats["coalesced"]
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(openai_helper.get_transformation_suggestions(["a", "b"], "sum b")))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    deadline = time.monotonic() + 5
+    while ai_cache._stats["coalesced"] - coalesced < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["answer 1"] * 4
+    assert len(client.calls) == 1
+
+def test_concurrent_identical_async_prompts_share_one_call():
+    client = AsyncStubClient()
+    openai_helper.set_async_openai_client(client)
+
+    async def ask():
+        return await asyncio.gather(*(openai_helper.get_smart_fix_async("boom") for _ in range(5)))
+
+    assert asyncio.run(ask()) == ["answer 1"] * 5
+    assert len(client.calls) == 1
+
+def test_errors_are_not_cached():
+    client = _stub(fail_first=1)
+    assert openai_helper.get_smart_fix("boom").startswith("Failed to generate fix")
+    assert openai_helper.get_smart_fix("boom") == "answer 2"
+    assert len(client.calls) == 2
+
+def test_zero_ttl_bypasses_the_cache(monkeypatch):
+    monkeypatch.setattr(ai_cache, "AI_CACHE_TTL_SECONDS", 0)
+    client = _stub()
+    assert openai_helper.get_smart_fix("boom") == "answer 1"
+    assert openai_helper.get_smart_fix("boom") == "answer 2"
+    assert len(ai_cache._memory) == 0
+
+def test_disk_store_answers_after_memory_is_cleared(monkeypatch, tmp_path):
+    monkeypatch.setattr(ai_cache, "AI_CACHE_DIR", str(tmp_path))
+    client = _stub()
+    openai_helper.get_smart_fix("boom")
+    ai_cache._memory.clear()
+    assert openai_helper.get_smart_fix("boom") == "answer 1"
+    assert len(client.calls) == 1
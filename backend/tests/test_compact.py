@@ -0,0 +1,46 @@
+import pandas as pd
+from utils.compact import compact_frame
+from utils.serialization import json_records
+from utils.transformer import PARSED_DATES, transform_data
+
+def test_compaction_does_not_change_results():
+    df = pd.DataFrame({
+        "name": [f"person {i}" for i in range(200)],
+        "department": ["sales", "ops", "hr", "sales"] * 50,
+        "hire_date": ["2021-05-06", "2022-01-31"] * 100,
+        "salary": [50000, 60000, 50000, 70000, 60000] * 40,
+    })
+    compacted = compact_frame(df)
+    assert isinstance(compacted["department"].dtype, pd.CategoricalDtype)
+
+    for prompt in ("sort by department", "sort by department desc", "sort by salary"):
+        expected = json_records(transform_data(df.copy(), prompt))
+        assert json_records(transform_data(compacted.copy(), prompt)) == expected
+    assert json_records(compacted.head(1))[0]["hire_date"] == "2021-05-06"
+
+def test_date_columns_are_parsed_up_front_without_changing_conversions():
+    df = pd.DataFrame({
+        "Hire Date": ["2021-05-06", "2022-01-31", None, "2020-12-01"] * 50,
+        "Department": ["sales", "ops"] * 100,
+    })
+    report = {}
+    compacted = compact_frame(df, report)
+    assert report["date_columns"] == ["Hire Date"]
+    assert list(compacted.attrs[PARSED_DATES]) == ["Hire Date"]
+
+    for prompt in (
+        "convert hire_date to datetime",
+        "filter department = sales then convert hire_date to datetime",
+        "rename hire_date to start_date then convert start_date to datetime",
+    ):
+        expected = transform_data(df.copy(), prompt)
+        result = transform_data(compacted.copy(), prompt)
+        date_column = expected.columns[0]
+        pd.testing.assert_series_equal(result[date_column], expected[date_column])
+
+def test_dates_that_are_not_all_iso_are_left_to_conversions():
+    df = pd.DataFrame({"Hire Date": ["05/06/2021", "2021-05-06", "01/31/2022"] * 50})
+    compacted = compact_frame(df)
+    assert PARSED_DATES not in compacted.attrs
+    prompt = "convert hire_date to datetime"
+    pd.testing.assert_frame_equal(transform_data(compacted.copy(), prompt), transform_data(df.copy(), prompt))
@@ -0,0 +1,20 @@
+from functools import partial
+import pandas as pd
+from utils import csv_processor
+from utils.sinks import SinkSpec
+
+def test_batch_file_filters_text_column_empty_in_first_chunk(tmp_path, monkeypatch):
+    rows = 3000
+    path = tmp_path / "employees.csv"
+    pd.DataFrame({
+        "name": [f"employee {i}" for i in range(rows)],
+        "department": [None] * 1000 + ["sales", "ops"] * 1000,
+    }).to_csv(path, index=False)
+    monkeypatch.setattr(csv_processor, "iter_csv_chunks", partial(csv_processor.iter_csv_chunks, chunksize=1000))
+
+    result = csv_processor.process_file(str(path), "employees", "filter department = sales", SinkSpec("csv"),
+                                        str(tmp_path / "out"))
+    assert result["status"] == "done"
+    written = pd.read_csv(result["output"])
+    assert len(written) == 1000
+    assert (written["department"] == "sales").all()
@@ -0,0 +1,74 @@
+import os
+import threading
+import pandas as pd
+import pytest
+from utils import dag
+from utils.dag import DagFailed, Node, render_mermaid, run_dag
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(dag, "DAG_CHECKPOINT_DIR", str(tmp_path / "runs"))
+
+def _frame(*values) -> pd.DataFrame:
+    return pd.DataFrame({"n": list(values)})
+
+def test_dependencies_are_checked():
+    with pytest.raises(ValueError, match="Cycle"):
+        run_dag([Node("a", "A", "transform", lambda b: b, ("b",)), Node("b", "B", "transform", lambda a: a, ("a",))])
+    with pytest.raises(ValueError, match="Unknown dependency"):
+        run_dag([Node("a", "A", "transform", lambda x: x, ("x",))])
+
+def test_independent_nodes_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def extract(*values):
+        barrier.wait()  # both extracts must be running at once to pass
+        return _frame(*values)
+
+    nodes = [
+        Node("left", "Left", "extract", lambda: extract(1, 2)),
+        Node("right", "Right", "extract", lambda: extract(3)),
+        Node("both", "Both", "transform", lambda a, b: pd.concat([a, b], ignore_index=True), ("left", "right")),
+        Node("unused", "Unused", "transform", lambda a: a, ("left",)),
+    ]
+    outputs, report = run_dag(nodes, targets=("both",), workers=2)
+    assert outputs["both"]["n"].tolist() == [1, 2, 3]
+    assert {entry["id"]: entry["status"] for entry in report} == {
+        "left": "done", "right": "done", "both": "done", "unused": "skipped"
+    }
+
+def test_failed_run_resumes_from_its_checkpoints():
+    pytest.importorskip("pyarrow")
+    calls = []
+    fail = [True]
+
+    def step(name, fn):
+        def run(*args):
+            calls.append(name)
+            return fn(*args)
+        return run
+
+    def transform(df):
+        if fail[0]:
+            raise RuntimeError("disk full")
+        return df.assign(n=df["n"] * 10)
+
+    nodes = [
+        Node("extract", "Extract", "extract", step("extract", lambda: _frame(1, 2))),
+        Node("transform", "Transform", "transform", step("transform", transform), ("extract",)),
+        Node("load", "Load", "load", step("load", lambda df: None), ("transform",)),
+    ]
+    with pytest.raises(DagFailed) as failed:
+        run_dag(nodes, run_key="run")
+    assert failed.value.node_id == "transform"
+    assert [entry["status"] for entry in failed.value.report] == ["done", "failed", "cancelled"]
+    assert "failed" in render_mermaid(failed.value.report)
+
+    fail[0] = False
+    outputs, report = run_dag(nodes, run_key="run", targets=("transform", "load"))
+    assert calls == ["extract", "transform", "transform", "load"]
+    assert outputs["transform"]["n"].tolist() == [10, 20]
+    assert [entry["status"] for entry in report] == ["resumed", "done", "done"]
+    assert "resumed from checkpoint" in render_mermaid(report)
+    # A complete run has nothing left to resume
+    assert not os.path.exists(os.path.join(dag.DAG_CHECKPOINT_DIR, "run"))
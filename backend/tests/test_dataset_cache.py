@@ -0,0 +1,60 @@
+import os
+import pandas as pd
+import pytest
+from utils import dataset_cache, workflow
+from utils.dataset_cache import dataset_key, frame_nbytes, get_dataset, has_dataset, put_dataset
+from utils.lru import ByteLRU
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(dataset_cache, "DATASET_CACHE_DIR", str(tmp_path / "datasets"))
+    monkeypatch.setattr(dataset_cache, "_memory", ByteLRU(dataset_cache.DATASET_CACHE_MEMORY_BYTES, frame_nbytes))
+
+def _frame(n: int = 100) -> pd.DataFrame:
+    return pd.DataFrame({"id": range(n), "name": [f"row {i}" for i in range(n)]})
+
+def test_key_depends_on_parse_options():
+    assert dataset_key("abc") == "abc"
+    assert dataset_key("abc", "csv") == dataset_key("abc", "csv")
+    assert dataset_key("abc", "csv") != dataset_key("abc", "xlsx")
+    assert dataset_key("abc", "Sheet1", 0) != dataset_key("abc", "Sheet1", 10)
+
+def test_frame_survives_in_the_disk_tier():
+    df = _frame()
+    put_dataset("k", df)
+    assert get_dataset("k") is df
+
+    dataset_cache._memory.clear()
+    hits = dataset_cache._disk_stats["hits"]
+    assert has_dataset("k")
+    pd.testing.assert_frame_equal(get_dataset("k"), df)
+    assert dataset_cache._disk_stats["hits"] == hits + 1
+    assert "k" in dataset_cache._memory
+    assert get_dataset("missing") is None
+
+def test_disk_tier_evicts_least_recently_used_files(monkeypatch):
+    put_dataset("old", _frame())
+    size = os.path.getsize(dataset_cache._disk_path("old"))
+    monkeypatch.setattr(dataset_cache, "DATASET_CACHE_DISK_BYTES", int(size * 2.5))
+    put_dataset("used", _frame())
+    os.utime(dataset_cache._disk_path("old"), (1, 1))
+    os.utime(dataset_cache._disk_path("used"), (2, 2))
+
+    put_dataset("new", _frame())
+    assert not os.path.exists(dataset_cache._disk_path("old"))
+    assert os.path.exists(dataset_cache._disk_path("used"))
+    assert os.path.exists(dataset_cache._disk_path("new"))
+
+def test_upload_is_parsed_once_per_digest(monkeypatch, tmp_path):
+    path = tmp_path / "orders.csv"
+    _frame().to_csv(path, index=False)
+    parses = []
+    read_dataset = workflow.read_dataset
+    monkeypatch.setattr(workflow, "read_dataset", lambda *args: parses.append(args) or read_dataset(*args))
+
+    first = workflow.load_dataset(str(path), "orders.csv", "digest-1")
+    second = workflow.load_dataset(str(path), "orders.csv", "digest-1")
+    pd.testing.assert_frame_equal(first, second)
+    assert len(parses) == 1
+    workflow.load_dataset(str(path), "orders.csv", "digest-2")
+    assert len(parses) == 2
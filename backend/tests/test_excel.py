@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils import excel
+from utils.excel import SheetRange, is_converted, iter_excel_chunks, read_excel_file
+
+pytest.importorskip("openpyxl")
+
+ROWS = 300
+
+def _employees() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Name": [f"person {i}" for i in range(ROWS)],
+        "Department": np.where(np.arange(ROWS) % 3 == 0, "sales", "ops"),
+        "Salary": np.where(np.arange(ROWS) % 7 == 0, np.nan, np.arange(ROWS) * 100.0),
+        "Quantity": np.arange(ROWS),
+        "Hire Date": pd.date_range("2020-01-01", periods=ROWS, freq="D"),
+    })
+
+def _unit_ns(df: pd.DataFrame) -> pd.DataFrame:
+    """Readers differ in datetime resolution only"""
+    return df.astype({col: "datetime64[ns]" for col in df.columns if str(df[col].dtype).startswith("datetime64")})
+
+@pytest.fixture
+def workbook(monkeypatch, tmp_path) -> str:
+    monkeypatch.setattr(excel, "EXCEL_CACHE_DIR", str(tmp_path / "excel"))
+    path = str(tmp_path / "book.xlsx")
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        _employees().to_excel(writer, sheet_name="employees", index=False)
+        pd.DataFrame({"Region": ["n", "s"], "Units": [1, 2]}).to_excel(writer, sheet_name="sales", index=False)
+    return path
+
+@pytest.mark.parametrize("engine", ["calamine", "openpyxl"])
+@pytest.mark.parametrize("sheet, position", [(None, 0), ("sales", 1), ("1", 1)])
+def test_streaming_readers_match_pandas(workbook, monkeypatch, engine, sheet, position):
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+    monkeypatch.setattr(excel, "EXCEL_ENGINE", engine)
+    expected = pd.read_excel(workbook, sheet_name=position, engine="openpyxl")
+    got = read_excel_file(workbook, "book.xlsx", sheet_range=SheetRange(sheet), chunk_rows=64)
+    pd.testing.assert_frame_equal(_unit_ns(got), _unit_ns(expected))
+
+@pytest.mark.parametrize("sheet_range", [SheetRange(None, 100, 50), SheetRange(None, 250, None), SheetRange(None, 500, 10)])
+def test_row_ranges_read_the_same_before_and_after_conversion(workbook, sheet_range):
+    pytest.importorskip("pyarrow")
+    expected = pd.read_excel(workbook, engine="openpyxl")
+    end = None if sheet_range.max_rows is None else sheet_range.start_row + sheet_range.max_rows
+    expected = expected.iloc[sheet_range.start_row:end].reset_index(drop=True)
+
+    assert not is_converted("digest", None)
+    parsed = read_excel_file(workbook, "book.xlsx", "digest", sheet_range, chunk_rows=64)
+    assert is_converted("digest", None)
+    cached = read_excel_file(workbook, "book.xlsx", "digest", sheet_range, chunk_rows=64)
+    for got in (parsed, cached):
+        pd.testing.assert_frame_equal(_unit_ns(got), _unit_ns(expected), check_dtype=False)
+    assert list(parsed.columns) == list(expected.columns)
+
+def test_chunks_cover_the_range_in_order(workbook):
+    chunks = list(iter_excel_chunks(workbook, "book.xlsx", None, SheetRange(None, 10, 200), chunk_rows=64,
+                                    columns=["Quantity"]))
+    assert sum(len(chunk) for chunk in chunks) == 200
+    assert pd.concat(chunks)["Quantity"].tolist() == list(range(10, 210))
+    assert all(list(chunk.columns) == ["Quantity"] for chunk in chunks)
+
+def test_workflow_reads_the_selected_sheet_rows(workbook):
+    with open(workbook, "rb") as f:
+        content = f.read()
+    response = TestClient(app).post(
+        "/generate-workflow", data={"prompt": "filter quantity > 150", "start_row": "100", "max_rows": "100"},
+        files={"file": ("book.xlsx", content, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+    ).json()
+    assert response["transformed_rows"] == 49
+    assert response["transformed_data"][0]["quantity"] == 151
+    assert os.path.isdir(excel.EXCEL_CACHE_DIR)
@@ -0,0 +1,66 @@
+import time
+import pytest
+from utils import jobs
+from utils.jobs import JobQueueFull, cancel_job, get_job, report_progress, submit_job
+
+# Worker functions run in spawned processes, so they live at module level
+
+def _double(status, value):
+    report_progress(status, 0.5, "halfway")
+    return value * 2
+
+def _fail(status):
+    raise ValueError("bad input")
+
+def _run_until_cancelled(status):
+    while True:
+        report_progress(status, 0.1, "working")
+        time.sleep(0.05)
+
+@pytest.fixture(autouse=True)
+def one_worker(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_WORKERS", 1)
+    yield
+    jobs.shutdown_jobs()
+
+def _wait(job_id: str, states=("completed", "failed", "cancelled")) -> dict:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        job = get_job(job_id)
+        if job["state"] in states:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} is still {job['state']}")
+
+def test_completed_and_failed_jobs():
+    done = _wait(submit_job(_double, 21, on_done=lambda result: {"value": result}))
+    assert done["state"] == "completed"
+    assert done["progress"] == 1.0
+    assert done["result"] == {"value": 42}
+
+    failed = _wait(submit_job(_fail))
+    assert failed["state"] == "failed"
+    assert failed["error"] == "bad input"
+    assert get_job("unknown") is None
+
+def test_cancelling_running_and_queued_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_QUEUE_DEPTH", 4)
+    running = submit_job(_run_until_cancelled)
+    assert _wait(running, ("running",))["message"] == "working"
+
+    cancelled_before_start = []
+    queued = [submit_job(_double, i, on_cancel=lambda: cancelled_before_start.append(True)) for i in range(3)]
+    with pytest.raises(JobQueueFull):
+        submit_job(_double, 0)
+
+    # The last job is still in the executor's queue: it is cancelled without starting
+    assert cancel_job(queued[-1])
+    assert get_job(queued[-1])["state"] == "cancelled"
+    assert cancelled_before_start == [True]
+
+    assert cancel_job(running)
+    assert get_job(running)["state"] == "cancelling"
+    assert _wait(running)["state"] == "cancelled"
+    assert not cancel_job(running)
+
+    assert [_wait(job_id)["result"] for job_id in queued[:2]] == [0, 2]
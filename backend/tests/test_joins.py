@@ -0,0 +1,80 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils import joins
+from utils.joins import Lookup, find_lookup, join_frame, lookup_name, prepare_lookup
+
+def _orders() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    orders = pd.DataFrame({
+        "order_id": np.arange(2000),
+        "dept_id": rng.integers(0, 60, 2000).astype(float),
+        "amount": rng.random(2000).round(3),
+        "name": rng.choice(["a", "b"], 2000),
+    })
+    orders.loc[::97, "dept_id"] = np.nan
+    return orders
+
+def _departments() -> pd.DataFrame:
+    departments = pd.DataFrame({"dept_id": np.arange(50), "dept_name": [f"d{i}" for i in range(50)],
+                                "name": [f"n{i}" for i in range(50)]})
+    # Duplicate keys repeat the order once per match; a missing key never matches
+    extra = pd.DataFrame({"dept_id": [1, 2, None], "dept_name": ["d1x", "d2x", "none"], "name": ["x", "y", "z"]})
+    return pd.concat([departments, extra], ignore_index=True)
+
+def _lookup(df: pd.DataFrame, path) -> Lookup:
+    df.to_csv(path, index=False)
+    data = path.read_bytes()
+    return Lookup(lookup_name(str(path)), str(path), path.name, hashlib.sha256(data).hexdigest(), len(data))
+
+def _expected(left: pd.DataFrame, right: pd.DataFrame, how: str) -> pd.DataFrame:
+    right = right.dropna(subset=["dept_id"])
+    return left.merge(right, on="dept_id", how=how, suffixes=("", "_departments")).reset_index(drop=True)
+
+@pytest.mark.parametrize("broadcast", [True, False])
+@pytest.mark.parametrize("how", ["left", "inner"])
+def test_join_matches_a_merge_that_never_matches_missing_keys(monkeypatch, tmp_path, broadcast, how):
+    monkeypatch.setattr(joins, "JOIN_BROADCAST_MAX_BYTES", 64 * 1024 ** 2 if broadcast else 200)
+    lookup = _lookup(_departments(), tmp_path / "departments.csv")
+    assert joins.is_broadcast(lookup) == broadcast
+
+    orders = _orders()
+    got = join_frame(orders, lookup, "dept_id", how)
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), _expected(orders, _departments(), how), check_dtype=False)
+
+    prepared = prepare_lookup(lookup, "dept_id", orders.columns)
+    try:
+        again = join_frame(orders, lookup, "dept_id", how, prepared)
+    finally:
+        if not broadcast:
+            prepared.close()
+    pd.testing.assert_frame_equal(again, got)
+
+def test_keys_of_different_kinds_cannot_be_joined(tmp_path):
+    lookup = _lookup(_departments(), tmp_path / "departments.csv")
+    with pytest.raises(ValueError):
+        join_frame(_orders().assign(dept_id=lambda df: df["dept_id"].astype(str)), lookup, "dept_id", "left")
+
+def test_prompts_name_lookups_by_cleaned_file_name(tmp_path):
+    assert lookup_name("uploads/Dept Sheet.xlsx") == "dept_sheet"
+    lookup = _lookup(_departments(), tmp_path / "Dept Sheet.csv")
+    assert find_lookup((lookup,), "dept_sheet") is lookup
+    assert find_lookup((lookup,), "dept") is lookup
+    assert find_lookup((lookup,), "customers") is None
+
+def test_workflow_joins_an_uploaded_lookup():
+    orders = _orders()
+    client = TestClient(app)
+    upload = ("file", ("orders.csv", orders.to_csv(index=False), "text/csv"))
+    missing = client.post("/generate-workflow", data={"prompt": "join with departments on dept_id"}, files=[upload])
+    assert missing.status_code == 400
+
+    response = client.post(
+        "/generate-workflow", data={"prompt": "inner join with departments on dept_id"},
+        files=[upload, ("lookups", ("departments.csv", _departments().to_csv(index=False), "text/csv"))],
+    )
+    assert response.status_code == 200
+    assert response.json()["transformed_rows"] == len(_expected(orders, _departments(), "inner"))
@@ -0,0 +1,56 @@
+import pandas as pd
+from fastapi.testclient import TestClient
+from app import app
+from utils import metrics
+from utils.metrics import Histogram, collect_timings, timed
+
+ORDERS = pd.DataFrame({"region": ["n", "s", "n", "e"], "quantity": [1, 2, 3, 4], "price": [1.5, 2.0, 1.0, 3.0]})
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test", (0.1, 1, 10), ("name",))
+    for value in (0.05, 0.5, 5, 50):
+        histogram.observe(("a",), value)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{name="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{name="a",le="10"} 3' in lines
+    assert 'test_seconds_bucket{name="a",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{name="a"} 55.55' in lines
+
+def test_timed_steps_go_to_the_collecting_request_only():
+    with timed("test", "outside"):
+        pass
+    timings = collect_timings()
+    with timed("test", "inside", rows_in=10) as record:
+        record["rows_out"] = 4
+    assert [(t["kind"], t["name"], t["rows_in"], t["rows_out"]) for t in timings] == [("test", "inside", 10, 4)]
+    assert timings[0]["seconds"] >= 0
+    assert 'etl_step_rows_total{kind="test",name="inside",direction="out"}' in metrics.render_metrics()
+
+def test_disabled_metrics_still_collect_request_timings(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    timings = collect_timings()
+    with timed("test", "disabled"):
+        pass
+    assert [t["name"] for t in timings] == ["disabled"]
+    assert 'name="disabled"' not in metrics.render_metrics()
+
+def test_workflow_timings_and_metrics_endpoint():
+    client = TestClient(app)
+    response = client.post(
+        "/generate-workflow", data={"prompt": "calculate revenue then group by region", "timings": "true"},
+        files={"file": ("orders.csv", ORDERS.to_csv(index=False), "text/csv")},
+    ).json()
+    steps = {(t["kind"], t["name"]): t for t in response["timings"]}
+    assert steps[("ingest", "parse")]["rows_out"] == 4
+    assert any(kind == "stage" for kind, _ in steps)
+
+    untimed = client.post(
+        "/generate-workflow", data={"prompt": "group by region"},
+        files={"file": ("orders.csv", ORDERS.to_csv(index=False), "text/csv")},
+    ).json()
+    assert "timings" not in untimed
+
+    exposition = client.get("/metrics")
+    assert exposition.headers["content-type"].startswith("text/plain")
+    assert 'etl_step_duration_seconds_count{kind="ingest",name="parse"}' in exposition.text
+    assert 'etl_http_request_duration_seconds_count{method="POST",route="/generate-workflow",status="200"}' in exposition.text
@@ -0,0 +1,100 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from utils import ai_cache, openai_helper
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+class AsyncStubClient:
+    """Stands in for openai.AsyncOpenAI; replies, hangs or fails per call"""
+
+    def __init__(self, delay: float = 0.0, hang_first: int = 0, errors=()):
+        self.chat = SimpleNamespace(completions=self)
+        self.delay = delay
+        self.hang_first = hang_first
+        self.errors = list(errors)
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    async def create(self, **params):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            if self.calls <= self.hang_first:
+                await asyncio.Event().wait()
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=" ok "))])
+        finally:
+            self.running -= 1
+
+@pytest.fixture(autouse=True)
+def fast_calls(monkeypatch):
+    monkeypatch.setattr(openai_helper, "AI_CALL_TIMEOUT_SECONDS", 0.2)
+    monkeypatch.setattr(openai_helper, "AI_MAX_RETRIES", 2)
+    monkeypatch.setattr(openai_helper, "AI_RETRY_BACKOFF_SECONDS", 0.0)
+    ai_cache._memory.clear()
+
+def _complete(client, count: int = 1, **params):
+    async def run():
+        return await asyncio.gather(
+            *(openai_helper._create_completion(client, model="stub", n=i, **params) for i in range(count))
+        )
+    return asyncio.run(run())
+
+def test_concurrent_calls_are_limited(monkeypatch):
+    monkeypatch.setattr(openai_helper, "AI_MAX_CONCURRENCY", 3)
+    client = AsyncStubClient(delay=0.02)
+    assert _complete(client, 10) == ["ok"] * 10
+    assert client.calls == 10
+    assert client.max_running == 3
+
+def test_hung_call_times_out_and_is_retried():
+    client = AsyncStubClient(hang_first=1)
+    assert _complete(client) == ["ok"]
+    assert client.calls == 2
+
+def test_call_that_keeps_hanging_gives_up_after_the_retries():
+    client = AsyncStubClient(hang_first=10)
+    with pytest.raises(asyncio.TimeoutError):
+        _complete(client)
+    assert client.calls == 3
+    assert client.running == 0
+
+def test_transient_errors_are_retried():
+    client = AsyncStubClient(errors=[StatusError(503), ConnectionError("reset")])
+    assert _complete(client) == ["ok"]
+    assert client.calls == 3
+
+def test_client_errors_are_not_retried():
+    client = AsyncStubClient(errors=[StatusError(400)])
+    with pytest.raises(StatusError):
+        _complete(client)
+    assert client.calls == 1
+
+def test_retries_back_off_exponentially(monkeypatch):
+    monkeypatch.setattr(openai_helper, "AI_RETRY_BACKOFF_SECONDS", 0.5)
+    monkeypatch.setattr(openai_helper.random, "random", lambda: 1.0)
+    delays = []
+
+    async def no_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(openai_helper.asyncio, "sleep", no_sleep)
+    client = AsyncStubClient(errors=[StatusError(429), StatusError(429)])
+    assert _complete(client) == ["ok"]
+    assert delays == [0.5, 1.0]
+
+def test_async_helper_reports_failure_after_the_retries():
+    openai_helper.set_async_openai_client(AsyncStubClient(errors=[StatusError(503)] * 3))
+    try:
+        assert asyncio.run(openai_helper.get_smart_fix_async("boom")).startswith("Failed to generate fix")
+    finally:
+        openai_helper.set_async_openai_client(None)
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from utils import parallel
+from utils.plan import Stage
+from utils.transformer import transform_data
+
+ROWS = 4000
+
+def _employees() -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    salary = rng.integers(30000, 90000, ROWS).astype(float)
+    salary[::9] = np.nan
+    return pd.DataFrame({
+        "name": [f"  person {i} " for i in range(ROWS)],
+        "department": rng.choice(["sales", "ops", "it"], ROWS),
+        "salary": salary,
+        "quantity": rng.integers(0, 50, ROWS),
+    })
+
+@pytest.fixture(scope="module", autouse=True)
+def worker_pool():
+    yield
+    parallel.shutdown_parallel()
+
+@pytest.fixture
+def partitioned(monkeypatch):
+    monkeypatch.setattr(parallel, "PARALLEL_WORKERS", 2)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_ROWS", 1000)
+
+def _serial(df: pd.DataFrame, prompt: str, monkeypatch) -> pd.DataFrame:
+    with monkeypatch.context() as patch:
+        patch.setattr(parallel, "PARALLEL_WORKERS", 1)
+        return transform_data(df, prompt)
+
+def test_run_length_takes_row_local_stages_and_a_following_grouping(partitioned):
+    stages = (Stage("cleaning", ()), Stage("filtering", ()), Stage("grouping", ()), Stage("sorting", ()))
+    assert parallel.partitioned_run_length(stages, 0, ROWS) == 3
+    assert parallel.partitioned_run_length(stages, 2, ROWS) == 0
+    assert parallel.partitioned_run_length(stages, 0, 10) == 0
+
+@pytest.mark.parametrize("prompt", [
+    "remove duplicates then filter salary > 60000",
+    "fill null values with mean then group by department and mean salary",
+    "filter quantity > 10 then group by department and sum salary",
+])
+def test_partitioned_run_matches_the_serial_one(partitioned, monkeypatch, prompt):
+    df = _employees()
+    expected = _serial(df, prompt, monkeypatch)
+    runs = []
+    run_partitioned = parallel.run_partitioned
+    monkeypatch.setattr(parallel, "run_partitioned", lambda *args: runs.append(args) or run_partitioned(*args))
+    pd.testing.assert_frame_equal(
+        transform_data(df, prompt).drop(columns=["processed_at"], errors="ignore"),
+        expected.drop(columns=["processed_at"], errors="ignore"),
+    )
+    assert runs
+
+def test_shared_memory_round_trip_removes_the_block():
+    df = _employees()
+    handle = parallel._export(df)
+    pd.testing.assert_frame_equal(parallel._import(handle, unlink=True), df)
+    assert not os.path.exists(f"/dev/shm/{handle[0].lstrip('/')}")
+
+def test_partitions_with_different_categories_are_concatenated():
+    parts = [pd.DataFrame({"c": pd.Categorical(["b", "a"])}), pd.DataFrame({"c": pd.Categorical(["c"])})]
+    combined = parallel._concat_partitions(parts)
+    assert combined["c"].tolist() == ["b", "a", "c"]
+    assert list(combined["c"].cat.categories) == ["a", "b", "c"]
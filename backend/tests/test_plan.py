@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import transformer
+import reference_transformer as reference
+
+def _employees(rows: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "First Name": rng.choice([" alice", "bob ", "carol", None, "dave"], rows),
+        "Last Name": rng.choice(["smith", "jones ", "lee"], rows),
+        "Department": rng.choice(["sales", "eng", "hr", None], rows),
+        # Distinct, so sorts have no ties whose order the original left to quicksort
+        "Salary": rng.permutation(np.arange(30000, 30000 + 100 * rows, 100)).astype(float),
+        "Performance Score": np.round(rng.uniform(1, 5, rows), 1),
+        "Status": rng.choice(["Active", "inactive", "on leave"], rows),
+        "Hire Date": rng.choice(["2020-01-05", "2021-06-30", "bad"], rows),
+    })
+    df.loc[::7, "Salary"] = np.nan
+    return df
+
+def _inventory(rows: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        "Product": rng.choice(["widget", "gadget ", "doohickey"], rows),
+        "Quantity": rng.permutation(rows),
+        "Unit Price": np.round(rng.uniform(1, 50, rows), 2),
+        "Stock Level": rng.integers(0, 500, rows),
+        "Category": rng.choice(["a", "b"], rows),
+    })
+
+PROMPTS = [
+    "clean names and sort by salary desc",
+    "calculate total and average salary then group by department and mean salary",
+    "filter salary > 60000 then sort by salary asc",
+    "remove null values and uppercase department",
+    "lowercase status and filter active records",
+    "fill null values with mean",
+    "fill null values",
+    "rename salary to pay and sort by pay desc",
+    "combine names into full name and classify performance category",
+    "classify inventory stock category and calculate revenue",
+    "convert hire_date to datetime and add timestamp",
+    "group by department",
+    "group by category and sum quantity",
+    "calculate value = quantity * unit_price then filter value >= 1000",
+    "calculate ratio = quantity / stock_level",
+    "filter department = sales",
+    "filter status != active",
+    "nothing to do here",
+    # Literals that do not fit the column: the original skipped these filters
+    "filter salary > abc",
+    "filter salary == abc",
+    "filter quantity <= 12abc",
+    "filter department > 5",
+    "filter hire_date >= 2021-01-01",
+]
+
+@pytest.mark.parametrize("dataset", [_employees, _inventory])
+@pytest.mark.parametrize("prompt", PROMPTS)
+def test_compiled_plan_matches_original_transformer(dataset, prompt):
+    df = dataset()
+    expected = reference.transform_data(df.copy(), prompt)
+    result = transformer.transform_data(df.copy(), prompt)
+    # The timestamp the date stage adds is the only value allowed to differ
+    pd.testing.assert_frame_equal(
+        result.drop(columns=["processed_at"], errors="ignore"), expected.drop(columns=["processed_at"], errors="ignore")
+    )
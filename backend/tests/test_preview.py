@@ -0,0 +1,73 @@
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils.jobs import shutdown_jobs
+from utils.plan import compile_plan
+from utils.preview import PREVIEW_SAMPLE_ROWS, preview_transform, sample_frame
+from utils.transformer import transform_data
+
+ROWS = PREVIEW_SAMPLE_ROWS + 1000
+
+def _orders() -> pd.DataFrame:
+    rng = np.random.default_rng(2)
+    return pd.DataFrame({
+        "region": rng.choice(["north", "south", "east"], ROWS),
+        "quantity": rng.integers(0, 1000, ROWS).astype(float),
+        "price": np.round(rng.random(ROWS) * 50, 2),
+    })
+
+@pytest.fixture(scope="module")
+def upload() -> bytes:
+    yield _orders().to_csv(index=False).encode()
+    shutdown_jobs()
+
+def _preview(client: TestClient, prompt: str, upload: bytes) -> dict:
+    response = client.post("/generate-workflow", data={"prompt": prompt, "preview": "true"},
+                           files={"file": ("orders.csv", upload, "text/csv")})
+    assert response.status_code == 200
+    return response.json()
+
+def test_sample_is_seeded_and_keeps_upload_order():
+    df = _orders()
+    sample = sample_frame(df, rows=100)
+    assert sample.method == "sample" and sample.total_rows == ROWS
+    assert sample.df.index.is_monotonic_increasing
+    assert sample.df.index.equals(sample_frame(df, rows=100).df.index)
+    assert sample_frame(df.head(50), rows=100).method == "complete"
+
+@pytest.mark.parametrize("prompt", ["sort by quantity descending", "filter price > 40 then sort by region"])
+def test_preview_transform_selects_the_first_rows_of_the_full_result(prompt):
+    df = _orders()
+    rows, total = preview_transform(df, compile_plan(prompt))
+    expected = transform_data(df, prompt)
+    assert total == len(expected)
+    assert rows["quantity"].tolist() == expected["quantity"].head(10).tolist()
+
+def test_head_preview_is_exact_for_row_local_plans(upload):
+    client = TestClient(app)
+    preview = _preview(client, "filter price > 40", upload)
+    assert preview["preview"]["method"] == "head"
+    assert preview["preview"]["rows_sampled"] == PREVIEW_SAMPLE_ROWS
+    assert preview["preview"]["exact"]
+    expected = transform_data(_orders(), "filter price > 40").head(10)
+    assert [row["price"] for row in preview["transformed_data"]] == expected["price"].tolist()
+
+    grouped = _preview(client, "group by region and sum quantity", upload)
+    assert not grouped["preview"]["exact"]
+    assert grouped["preview"]["grouping"] == "approximate"
+
+def test_full_run_of_a_preview_completes_once(upload):
+    client = TestClient(app)
+    preview_id = _preview(client, "filter price > 40", upload)["preview"]["preview_id"]
+    job_id = client.post(f"/previews/{preview_id}/run").json()["job_id"]
+    deadline = time.monotonic() + 60
+    while (job := client.get(f"/jobs/{job_id}").json())["state"] not in ("completed", "failed"):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    assert job["state"] == "completed"
+    assert job["result"]["transformed_rows"] == len(transform_data(_orders(), "filter price > 40"))
+    assert job["result"]["original_rows"] == ROWS
+    assert client.post(f"/previews/{preview_id}/run").status_code == 404
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils.metrics import FALLBACKS
+from utils.plan import compile_plan
+from utils.pushdown import plan_pushdown, read_pushdown, _can_filter
+from utils.transformer import transform_data
+
+EMPLOYEES = pd.DataFrame({"name": ["ann", "bob", "cy"], "salary": [1, 2, 3]})
+
+def _read(prompt: str, report: dict) -> pd.DataFrame:
+    pushdown = plan_pushdown(compile_plan(prompt), EMPLOYEES.columns)
+    return read_pushdown(lambda columns: iter([EMPLOYEES.copy()]), lambda columns: EMPLOYEES.copy(), pushdown, report)
+
+def test_number_filter_is_pushed_down():
+    report = {}
+    assert _read("filter salary > 1", report)["salary"].tolist() == [2, 3]
+    assert report["rows_kept"] == 2
+
+def test_text_literal_on_number_column_is_not_pushed_down():
+    report = {}
+    pd.testing.assert_frame_equal(_read("filter salary > abc", report), EMPLOYEES)
+    assert report["rows_kept"] == 3
+    op = compile_plan("filter salary > abc").stage("filtering").ops[0]
+    assert not _can_filter(EMPLOYEES, op, ())
+
+def test_workflow_with_text_literal_on_number_column_keeps_every_row():
+    response = TestClient(app).post(
+        "/generate-workflow", data={"prompt": "filter salary > abc"},
+        files={"file": ("employees.csv", EMPLOYEES.to_csv(index=False), "text/csv")},
+    )
+    assert response.status_code == 200
+    assert response.json()["transformed_data"] == transform_data(EMPLOYEES, "filter salary > abc").to_dict("records")
+
+def _fallbacks(reason: str) -> int:
+    return FALLBACKS._values.get(("pushdown", reason), 0)
+
+def test_chunks_of_differing_types_are_read_without_filters():
+    chunks = [EMPLOYEES.iloc[:2], pd.DataFrame({"name": ["cy"], "salary": ["n/a"]})]
+    whole = pd.concat(chunks, ignore_index=True)
+    pushdown = plan_pushdown(compile_plan("filter salary > 1"), EMPLOYEES.columns)
+    before = _fallbacks("mixed_types")
+    report = {}
+    df = read_pushdown(lambda columns: iter(chunks), lambda columns: whole, pushdown, report)
+    pd.testing.assert_frame_equal(df, whole)
+    assert report["fallback"] == "mixed types"
+    assert _fallbacks("mixed_types") == before + 1
+
+@pytest.mark.parametrize("dag", [False, True])
+def test_failed_transform_of_a_pushed_down_read_is_redone_on_the_complete_upload(dag):
+    prompt = "filter salary > 2 then join with departments on nope"
+    # Distinct uploads: a complete upload cached by an earlier run is read instead of a pushed-down one
+    employees = EMPLOYEES.assign(salary=EMPLOYEES["salary"] * (2 if dag else 1))
+    before = _fallbacks("transform_failed")
+    response = TestClient(app).post(
+        "/generate-workflow", data={"prompt": prompt, "dag": str(dag).lower()},
+        files=[("file", ("employees.csv", employees.to_csv(index=False), "text/csv")),
+               ("lookups", ("departments.csv", "dept_id,dept_name\n1,ops\n", "text/csv"))],
+    )
+    assert response.status_code == 200
+    assert response.json()["transformed_data"] == employees.to_dict("records")
+    assert _fallbacks("transform_failed") == before + 1
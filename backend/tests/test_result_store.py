@@ -0,0 +1,33 @@
+import os
+import pandas as pd
+from utils import result_store
+from utils.streaming import SpilledFrame
+
+def _spilled(rows: int = 10) -> SpilledFrame:
+    frame = SpilledFrame()
+    frame.append(pd.DataFrame({"n": range(rows)}))
+    return frame
+
+def test_evicted_result_stays_open_while_held(monkeypatch):
+    monkeypatch.setattr(result_store, "RESULT_STORE_MAX_ENTRIES", 2)
+    frame = _spilled()
+    result_id = result_store.store_result({"transformed": frame})
+    datasets, release = result_store.hold_result(result_id)
+
+    for _ in range(3):
+        result_store.store_result({"transformed": _spilled()})
+    assert result_store.get_result(result_id) is None
+    assert datasets["transformed"].slice(0, 10)["n"].tolist() == list(range(10))
+
+    release()
+    release()  # a second release is a no-op
+    assert not os.path.exists(frame.path)
+
+def test_released_hold_leaves_live_result_open():
+    frame = _spilled()
+    result_id = result_store.store_result({"transformed": frame})
+    _, release = result_store.hold_result(result_id)
+    release()
+    assert os.path.exists(frame.path)
+    assert result_store.delete_result(result_id)
+    assert not os.path.exists(frame.path)
@@ -0,0 +1,78 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app import app
+from utils.serialization import columns_json, iter_frames, iter_ndjson, negotiate_format, records_json
+
+FRAME = pd.DataFrame({
+    "id": [1, 2, 3],
+    "price": [0.1, np.nan, np.inf],
+    "name": ['q"uo\\te', None, "héllo\n"],
+    "region": pd.Categorical(["n", None, "n"]),
+    "day": pd.to_datetime(["2024-01-01", None, "2024-01-02 03:04:05"], format="ISO8601"),
+    "count": pd.array([1, None, 3], dtype="Int64"),
+    "flag": [True, False, True],
+})
+
+RECORDS = [
+    {"id": 1, "price": 0.1, "name": 'q"uo\\te', "region": "n", "day": "2024-01-01T00:00:00", "count": 1, "flag": True},
+    {"id": 2, "price": None, "name": None, "region": None, "day": None, "count": None, "flag": False},
+    {"id": 3, "price": None, "name": "héllo\n", "region": "n", "day": "2024-01-02T03:04:05", "count": 3, "flag": True},
+]
+
+def test_records_encode_missing_and_non_finite_values_as_null():
+    assert json.loads(records_json(FRAME)) == RECORDS
+
+def test_columns_and_ndjson_hold_the_same_values():
+    columns = json.loads(columns_json(FRAME))
+    assert columns["columns"] == list(FRAME.columns)
+    assert [dict(zip(columns["columns"], row)) for row in zip(*columns["values"].values())] == RECORDS
+
+    lines = b"".join(iter_ndjson(iter_frames(FRAME, offset=1, batch_rows=1))).decode().splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS[1:]
+
+@pytest.mark.parametrize("requested, accept, expected", [
+    ("NDJSON", None, "ndjson"),
+    ("bogus", None, None),
+    (None, None, "json"),
+    (None, "*/*", "json"),
+    (None, "application/x-ndjson;q=0.5, application/vnd.apache.arrow.stream", "arrow"),
+    (None, "application/x-parquet;q=0, application/jsonl", "ndjson"),
+])
+def test_format_negotiation(requested, accept, expected):
+    assert negotiate_format(requested, accept) == expected
+
+@pytest.fixture(scope="module")
+def result_id():
+    upload = pd.DataFrame({"region": ["n", "s", "e"] * 50, "quantity": range(150)})
+    response = TestClient(app).post(
+        "/generate-workflow", data={"prompt": "filter quantity > 20"},
+        files={"file": ("orders.csv", upload.to_csv(index=False), "text/csv")},
+    )
+    return response.json()["result_id"]
+
+def test_result_formats_return_the_same_rows(result_id):
+    pa = pytest.importorskip("pyarrow")
+    client = TestClient(app)
+    url = f"/results/{result_id}"
+    rows = client.get(url, params={"limit": 1000}).json()["rows"]
+    assert len(rows) == 129
+
+    columns = client.get(url, params={"format": "columns", "limit": 1000}).json()["data"]
+    assert len(columns["values"]["quantity"]) == 129
+
+    ndjson = client.get(url, headers={"Accept": "application/x-ndjson"})
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in ndjson.text.splitlines()] == rows
+
+    arrow = client.get(url, params={"format": "arrow", "offset": 100})
+    table = pa.ipc.open_stream(io.BytesIO(arrow.content)).read_all()
+    assert table.column("quantity").to_pylist() == [row["quantity"] for row in rows[100:]]
+
+    parquet = client.get(url, params={"format": "parquet"})
+    assert pd.read_parquet(io.BytesIO(parquet.content))["quantity"].tolist() == [row["quantity"] for row in rows]
+
+    assert client.get(url, params={"format": "xml"}).status_code == 400
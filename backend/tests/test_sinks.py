@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.sinks import SinkSpec, SinkWriter
+
+pytest.importorskip("pyarrow")
+
+BATCH_ROWS = 1000
+
+def _sparse_notes() -> pd.DataFrame:
+    """Text that only starts after the first row groups"""
+    rows = 4 * BATCH_ROWS
+    return pd.DataFrame({
+        "id": range(rows),
+        "region": ["north", "south"] * (rows // 2),
+        "note": pd.Series([None] * (2 * BATCH_ROWS) + [f"note {i}" for i in range(2 * BATCH_ROWS)], dtype=object),
+    })
+
+def _write(frames, spec: SinkSpec, directory) -> pd.DataFrame:
+    with SinkWriter(spec, batch_rows=BATCH_ROWS, directory=str(directory)) as writer:
+        for frame in frames:
+            writer.put(frame)
+        output = writer.close()
+    return pd.read_parquet(output["path"]).sort_values("id", ignore_index=True)
+
+@pytest.mark.parametrize("partition_by", [None, "region"])
+def test_parquet_accepts_text_after_null_row_groups(tmp_path, partition_by):
+    df = _sparse_notes()
+    written = _write([df.iloc[i:i + BATCH_ROWS] for i in range(0, len(df), BATCH_ROWS)],
+                     SinkSpec("parquet", partition_by), tmp_path)
+    assert written["note"].iloc[:2 * BATCH_ROWS].isna().all()
+    assert written["note"].iloc[2 * BATCH_ROWS:].tolist() == df["note"].iloc[2 * BATCH_ROWS:].tolist()
+
+def test_parquet_accepts_text_after_float_chunks(tmp_path):
+    df = _sparse_notes()
+    # A streamed chunk without any note reads as float64
+    chunks = [df.iloc[i:i + BATCH_ROWS].copy() for i in range(0, len(df), BATCH_ROWS)]
+    for chunk in chunks[:2]:
+        chunk["note"] = np.nan
+    written = _write(chunks, SinkSpec("parquet"), tmp_path)
+    assert written["note"].notna().sum() == 2 * BATCH_ROWS
+    assert written["note"].iloc[-1] == df["note"].iloc[-1]
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+from utils import streaming
+from utils.streaming import combine_partials, iter_csv_chunks, merge_partials, partial_aggregate, stream_transform
+from utils.transformer import apply_grouping_aggregation, transform_data
+
+CHUNK_ROWS = 1000
+
+@pytest.fixture
+def sparse_csv(tmp_path) -> str:
+    """Employees whose first chunk has no department at all"""
+    rows = 3 * CHUNK_ROWS
+    df = pd.DataFrame({
+        "name": [f"employee {i}" for i in range(rows)],
+        "department": [None] * CHUNK_ROWS + ["sales", "ops"] * CHUNK_ROWS,
+        "salary": [float(i % 7) if i % 5 else None for i in range(rows)],
+    })
+    path = tmp_path / "employees.csv"
+    df.to_csv(path, index=False)
+    return str(path)
+
+def _streamed(path: str, prompt: str) -> pd.DataFrame:
+    chunks = stream_transform(lambda: iter_csv_chunks(path, chunksize=CHUNK_ROWS), prompt, chunk_rows=CHUNK_ROWS)
+    return pd.concat(list(chunks), ignore_index=True)
+
+@pytest.mark.parametrize("prompt", [
+    "filter department = sales",
+    "filter department != sales",
+    "fill null values with mean",
+    "group by department and sum salary",
+])
+def test_stream_matches_single_read_when_first_chunk_is_empty(sparse_csv, prompt):
+    expected = transform_data(pd.read_csv(sparse_csv), prompt)
+    pd.testing.assert_frame_equal(_streamed(sparse_csv, prompt), expected)
+
+def test_chunks_keep_text_columns_as_text(sparse_csv):
+    chunks = list(iter_csv_chunks(sparse_csv, chunksize=CHUNK_ROWS))
+    assert {str(chunk["department"].dtype) for chunk in chunks} == {"str"}
+
+def test_number_column_turning_to_text_fails_the_stream(tmp_path):
+    path = tmp_path / "codes.csv"
+    pd.DataFrame({"code": [str(i) for i in range(CHUNK_ROWS)] + ["unknown"] * CHUNK_ROWS}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="code"):
+        _streamed(str(path), "filter code > 5")
+
+def test_filter_that_cannot_compare_is_skipped():
+    df = pd.DataFrame({"department": [float("nan")] * 2, "salary": [1, 2]})
+    for prompt in ("filter department = sales", "filter salary > abc", "filter salary == abc"):
+        stats = {}
+        result = transform_data(df.copy(), prompt, stats=stats)
+        assert not stats.get("failed")
+        pd.testing.assert_frame_equal(result, df)
+
+def test_bool_column_turning_to_text_fails_the_stream(tmp_path):
+    path = tmp_path / "flags.csv"
+    pd.DataFrame({"active": [True, False] * (CHUNK_ROWS // 2) + ["maybe"] * CHUNK_ROWS}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="active"):
+        _streamed(str(path), "filter active = True")
+
+@pytest.mark.parametrize("agg", ["min", "max", "sum", "mean", "count", None])
+def test_folded_partials_match_merging_them_at_once(agg):
+    df = pd.DataFrame({"region": ["north", "south", "east"] * 400, "quantity": pd.Series(range(1200), dtype="int16")})
+    spec = ("region", "quantity" if agg else None, agg)
+    partials = [partial_aggregate(df.iloc[start:start + 300], spec) for start in range(0, len(df), 300)]
+    total = None
+    for partial in partials:
+        total = combine_partials(total, [partial], spec)
+    pd.testing.assert_frame_equal(merge_partials([total], spec), merge_partials(partials, spec))
+
+def test_stream_groups_more_keys_than_a_chunk_holds(tmp_path):
+    path = tmp_path / "orders.csv"
+    rows = 5 * CHUNK_ROWS
+    pd.DataFrame({"customer": [f"c{i % 2500}" for i in range(rows)], "amount": range(rows)}).to_csv(path, index=False)
+    prompt = "group by customer and sum amount"
+    pd.testing.assert_frame_equal(_streamed(str(path), prompt), transform_data(pd.read_csv(path), prompt))
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_external_sort_keeps_ties_in_input_order(monkeypatch, ascending):
+    # More runs than one merge takes, so some runs are merged in an earlier pass
+    monkeypatch.setattr(streaming, "MERGE_FAN_IN", 4)
+    df = pd.DataFrame({"rank": [float(i % 5) for i in range(1500)], "row": range(1500)})
+    df.loc[::11, "rank"] = None
+    chunks = (df.iloc[start:start + 100] for start in range(0, len(df), 100))
+    result = pd.concat(list(streaming.external_sort(chunks, "rank", ascending, chunk_rows=100)))
+    assert result["row"].tolist() == df.sort_values("rank", ascending=ascending, kind="stable")["row"].tolist()
@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import pandas as pd
+import pytest
+from utils import workflow
+from utils.etl_parser import config_steps, generate_config
+from utils.joins import Lookup, lookup_name
+from utils.transformer import transform_data
+
+def test_dag_stage_error_falls_back_like_run_workflow(tmp_path):
+    path = tmp_path / "employees.csv"
+    pd.DataFrame({"department": ["sales", "ops"] * 50, "salary": ["high", "low"] * 50}).to_csv(path, index=False)
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    prompt = "group by department and mean salary"
+
+    df, _, upload = workflow.load_upload(str(path), "employees.csv", prompt)
+    expected = workflow.run_workflow(prompt, df=df, upload=upload)["transformed"]
+    for _ in range(2):  # a rerun must not fail either
+        result = workflow.run_dag_workflow(prompt, path=str(path), filename="employees.csv", digest=digest)
+        assert result["dag_run"]["failed_stage"] == "grouping"
+        pd.testing.assert_frame_equal(result["transformed"].astype(str), expected.astype(str))
+
+def _upload(path) -> tuple:
+    return str(path), path.name, hashlib.sha256(path.read_bytes()).hexdigest()
+
+def _lookup(path) -> Lookup:
+    return Lookup(lookup_name(path.name), str(path), path.name, hashlib.sha256(path.read_bytes()).hexdigest(),
+                  path.stat().st_size)
+
+@pytest.fixture
+def joined_upload(tmp_path) -> tuple:
+    orders = tmp_path / "orders.csv"
+    pd.DataFrame({"dept_id": [1, 2, 3, 1] * 25, "amount": range(100)}).to_csv(orders, index=False)
+    departments = tmp_path / "departments.csv"
+    pd.DataFrame({"dept_id": [1, 2, 3], "dept_name": ["sales", "ops", "hr"]}).to_csv(departments, index=False)
+    return orders, (_lookup(departments),)
+
+PROMPT = "join with departments on dept_id then filter amount > 10 then group by dept_name and sum amount"
+
+def test_dag_is_built_from_config_steps_with_a_node_per_lookup(joined_upload):
+    orders, lookups = joined_upload
+    path, filename, digest = _upload(orders)
+    steps = config_steps(generate_config(PROMPT))
+    nodes, last = workflow.workflow_nodes(PROMPT, steps, path, filename, digest, lookups=lookups)
+    by_id = {node.id: node for node in nodes}
+
+    assert by_id["extract_departments"].action == "extract" and not by_id["extract_departments"].deps
+    join_step = next(step for step in steps if step["description"].startswith("join"))
+    assert by_id[f"step_{join_step['id']}"].deps == ("extract", "extract_departments")
+    assert "preview" not in by_id
+    assert last == f"step_{next(step for step in steps if step['description'].startswith('group'))['id']}"
+
+    result = workflow.run_dag_workflow(PROMPT, path=path, filename=filename, digest=digest, lookups=lookups)
+    expected = transform_data(pd.read_csv(orders), PROMPT, lookups=lookups)
+    pd.testing.assert_frame_equal(result["transformed"], expected, check_dtype=False)
+
+def test_lookups_are_extracted_alongside_the_upload(joined_upload, monkeypatch):
+    orders, lookups = joined_upload
+    path, filename, digest = _upload(orders)
+    # Each extract waits for the other: this only passes when they run at the same time
+    both = threading.Barrier(2, timeout=10)
+    load_upload, prepare_lookup = workflow.load_upload, workflow.prepare_lookup
+
+    def waiting(fn):
+        def run(*args, **kwargs):
+            both.wait()
+            return fn(*args, **kwargs)
+        return run
+
+    monkeypatch.setattr(workflow, "load_upload", waiting(load_upload))
+    monkeypatch.setattr(workflow, "prepare_lookup", waiting(prepare_lookup))
+    result = workflow.run_dag_workflow(PROMPT, path=path, filename=filename, digest=digest, lookups=lookups)
+    assert {entry["id"]: entry["status"] for entry in result["dag_run"]["nodes"]}["extract_departments"] == "done"
+    assert result["dag_run"]["failed_stage"] is None
@@ -0,0 +1,209 @@
+import asyncio
+import csv
+import io
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import deque
+from typing import NamedTuple
+from .excel import is_excel
+
+def _default_budget() -> int:
+    """Half of physical memory, where the platform reports it"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return 2 * 1024 ** 3
+
+# Estimated memory of the requests running at once in this process, and their number
+ADMISSION_MEMORY_BYTES = int(os.getenv("ADMISSION_MEMORY_BYTES", str(_default_budget())))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", str(2 * (os.cpu_count() or 1))))
+# Requests wait this long for room before a 429; 0 rejects at once when over budget
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "32"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# Peak bytes per parsed cell, including the transformed copy; Excel parsers build a Python object per cell
+ADMISSION_CSV_BYTES_PER_CELL = float(os.getenv("ADMISSION_CSV_BYTES_PER_CELL", "48"))
+ADMISSION_EXCEL_BYTES_PER_CELL = float(os.getenv("ADMISSION_EXCEL_BYTES_PER_CELL", "128"))
+# Fixed cost of any request: response building, AI calls, interpreter overhead
+ADMISSION_BASE_BYTES = int(os.getenv("ADMISSION_BASE_BYTES", str(32 * 1024 ** 2)))
+
+_CSV_SAMPLE_BYTES = 64 * 1024
+# Worksheet XML per cell, for sheets without a dimension element
+_XLSX_XML_BYTES_PER_CELL = 50
+_DIMENSION = re.compile(rb'<dimension ref="[A-Z]*\d*:?([A-Z]+)(\d+)"')
+
+_lock = threading.Lock()
+_waiters = deque()  # Waiter, in arrival order
+_state = {"used_bytes": 0, "active": 0, "peak_bytes": 0}
+_counters = {"admitted": 0, "waited": 0, "rejected": 0, "timed_out": 0, "wait_seconds": 0.0}
+
+class AdmissionRejected(Exception):
+    """The server is over its memory budget or concurrency limit; retry after retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: int = ADMISSION_RETRY_AFTER_SECONDS):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Ticket(NamedTuple):
+    """Admitted work: its estimated bytes, released with release()"""
+    cost: int
+    admitted_at: float
+
+class _Waiter:
+    def __init__(self, cost: int, loop):
+        self.cost = cost
+        self.loop = loop
+        self.future = loop.create_future()
+        self.queued_at = time.monotonic()
+        self.ticket = None  # set under the lock once admitted
+
+def _column_letters(letters: bytes) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + letter - ord("A") + 1
+    return number
+
+def _csv_shape(path: str, size: int) -> tuple:
+    with open(path, "rb") as f:
+        sample = f.read(_CSV_SAMPLE_BYTES)
+    lines = sample.split(b"\n")
+    if len(sample) == _CSV_SAMPLE_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # cut off mid-row
+    header = next(csv.reader(io.StringIO(lines[0].decode("utf-8", "replace")))) if lines and lines[0] else []
+    rows_sampled = max(len(lines) - 1, 1)
+    row_bytes = max((sum(len(line) + 1 for line in lines) - len(lines[0]) - 1) / rows_sampled, 1) if lines else 1
+    return int(size / row_bytes), max(len(header), 1)
+
+def _xlsx_shape(path: str) -> tuple:
+    """Rows and columns of the largest worksheet, from the dimension each sheet declares"""
+    largest = (0, 1)
+    with zipfile.ZipFile(path) as workbook:
+        for info in workbook.infolist():
+            if not (info.filename.startswith("xl/worksheets/") and info.filename.endswith(".xml")):
+                continue
+            with workbook.open(info) as f:
+                match = _DIMENSION.search(f.read(4096))
+            if match:
+                shape = (int(match.group(2)), _column_letters(match.group(1)))
+            else:
+                shape = (info.file_size // _XLSX_XML_BYTES_PER_CELL, 1)
+            if shape[0] * shape[1] > largest[0] * largest[1]:
+                largest = shape
+    return largest
+
+def estimate_shape(path: str, filename: str, size: int) -> tuple:
+    """(rows, columns) of an upload, estimated without parsing it"""
+    try:
+        if filename.lower().endswith(".xlsx"):
+            return _xlsx_shape(path)
+        if not is_excel(filename):
+            return _csv_shape(path, size)
+    except (OSError, zipfile.BadZipFile, csv.Error):
+        pass
+    # .xls and unreadable files: a cell per 8 bytes is a generous guess
+    return size // 8, 1
+
+def estimate_memory(path: str, filename: str, size: int, max_rows: int = None) -> int:
+    """
+    Peak memory a request on this upload is expected to need: parsing it, the
+    transformed copy, and a fixed base. max_rows caps the rows held at once, for
+    streamed, previewed or row-ranged requests.
+    """
+    if path is None:
+        return ADMISSION_BASE_BYTES
+    rows, columns = estimate_shape(path, filename, size)
+    if max_rows is not None:
+        rows = min(rows, max_rows)
+    per_cell = ADMISSION_EXCEL_BYTES_PER_CELL if is_excel(filename) else ADMISSION_CSV_BYTES_PER_CELL
+    return ADMISSION_BASE_BYTES + int(rows * columns * per_cell)
+
+def _fits(cost: int) -> bool:
+    """Whether work of this cost can start now; caller must hold the lock"""
+    if _state["active"] >= ADMISSION_MAX_CONCURRENT:
+        return False
+    # Work larger than the whole budget runs alone rather than never
+    return _state["active"] == 0 or _state["used_bytes"] + cost <= ADMISSION_MEMORY_BYTES
+
+def _admit(cost: int, waited: float) -> Ticket:
+    """Caller must hold the lock"""
+    _state["used_bytes"] += cost
+    _state["active"] += 1
+    _state["peak_bytes"] = max(_state["peak_bytes"], _state["used_bytes"])
+    _counters["admitted"] += 1
+    _counters["wait_seconds"] += waited
+    return Ticket(cost, time.monotonic())
+
+async def acquire(cost: int, timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS) -> Ticket:
+    """
+    Admit work of an estimated cost in bytes, waiting up to timeout seconds for room.
+    Waiters are admitted in arrival order, so large requests are not starved by small
+    ones. Raises AdmissionRejected when the queue is full or the wait times out.
+    """
+    with _lock:
+        if not _waiters and _fits(cost):
+            return _admit(cost, 0.0)
+        if timeout <= 0 or len(_waiters) >= ADMISSION_MAX_QUEUED:
+            _counters["rejected"] += 1
+            raise AdmissionRejected(
+                f"Server is busy ({_state['active']} requests running, {len(_waiters)} queued); retry later"
+            )
+        waiter = _Waiter(cost, asyncio.get_running_loop())
+        _waiters.append(waiter)
+        _counters["waited"] += 1
+
+    try:
+        await asyncio.wait_for(waiter.future, timeout)
+    except asyncio.TimeoutError:
+        with _lock:
+            if waiter.ticket is None:
+                _waiters.remove(waiter)
+                _counters["timed_out"] += 1
+                _wake_waiters()  # work queued behind it may fit now
+                raise AdmissionRejected(f"No capacity within {timeout:g}s; retry later")
+        # Admitted just as the wait ended
+    except asyncio.CancelledError:
+        # The client went away
+        with _lock:
+            if waiter.ticket is None:
+                _waiters.remove(waiter)
+                _wake_waiters()
+        if waiter.ticket is not None:
+            release(waiter.ticket)
+        raise
+    return waiter.ticket
+
+def _wake_waiters():
+    """Admit queued work in order while it fits; caller must hold the lock"""
+    while _waiters and _fits(_waiters[0].cost):
+        waiter = _waiters.popleft()
+        waiter.ticket = _admit(waiter.cost, time.monotonic() - waiter.queued_at)
+        waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+def release(ticket: Ticket):
+    """Return an admitted request's memory and concurrency slot"""
+    with _lock:
+        _state["used_bytes"] -= ticket.cost
+        _state["active"] -= 1
+        _wake_waiters()
+
+def admission_stats() -> dict:
+    """Live budget usage and admission counters, for tuning worker counts per host"""
+    with _lock:
+        return {
+            "budget_bytes": ADMISSION_MEMORY_BYTES,
+            "used_bytes": _state["used_bytes"],
+            "available_bytes": max(ADMISSION_MEMORY_BYTES - _state["used_bytes"], 0),
+            "peak_bytes": _state["peak_bytes"],
+            "max_concurrent": ADMISSION_MAX_CONCURRENT,
+            "active": _state["active"],
+            "queued": len(_waiters),
+            "queued_bytes": sum(waiter.cost for waiter in _waiters),
+            **_counters,
+        }
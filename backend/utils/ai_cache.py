@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from .lru import ByteLRU
+
+# Completions keyed by model parameters and (normalized) messages
+# A TTL of 0 bypasses the cache; concurrent identical requests are still coalesced
+AI_CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", "3600"))
+AI_CACHE_MEMORY_BYTES = int(os.getenv("AI_CACHE_MEMORY_BYTES", str(16 * 1024 ** 2)))
+# Optional on-disk store shared across workers and restarts; disabled when unset
+AI_CACHE_DIR = os.getenv("AI_CACHE_DIR")
+
+# Each entry is (expires_at wall-clock time, completion text)
+_memory = ByteLRU(AI_CACHE_MEMORY_BYTES, lambda entry: len(entry[1].encode()) + 64)
+_inflight = {}
+# Async callers coalesce on futures of their own event loop
+_async_inflight = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_stats = {"disk_hits": 0, "coalesced": 0, "calls": 0, "errors": 0}
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different inputs share a cache entry"""
+    return " ".join(str(text).split())
+
+def completion_key(params: dict) -> str:
+    """Stable hash of every parameter sent to the chat completions API"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def _disk_path(key: str) -> str:
+    return os.path.join(AI_CACHE_DIR, f"{key}.json")
+
+def _read_disk(key: str):
+    if not AI_CACHE_DIR:
+        return None
+    try:
+        with open(_disk_path(key)) as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry["expires_at"] <= time.time():
+        return None
+    return entry["expires_at"], entry["value"]
+
+def _write_disk(key: str, entry: tuple):
+    if not AI_CACHE_DIR:
+        return
+    try:
+        os.makedirs(AI_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"expires_at": entry[0], "value": entry[1]}, f)
+        os.replace(tmp_path, _disk_path(key))
+    except OSError as e:
+        print(f"AI cache write failed: {e}")
+
+def get_cached(key: str):
+    """Return a fresh cached completion, or None"""
+    if AI_CACHE_TTL_SECONDS <= 0:
+        return None
+    entry = _memory.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+
+    entry = _read_disk(key)
+    if entry is not None:
+        _memory.put(key, entry)
+        with _lock:
+            _stats["disk_hits"] += 1
+        return entry[1]
+    return None
+
+def put_cached(key: str, value: str):
+    if AI_CACHE_TTL_SECONDS <= 0:
+        return
+    entry = (time.time() + AI_CACHE_TTL_SECONDS, value)
+    _memory.put(key, entry)
+    _write_disk(key, entry)
+
+def _join_or_lead(inflight: dict, key: str, new_future):
+    """
+    Return (future, leader) for a cache miss: the caller either waits on the identical
+    call already in flight, or owns the new future and must settle it with _settle.
+    """
+    with _lock:
+        future = inflight.get(key)
+        if future is not None:
+            _stats["coalesced"] += 1
+            return future, False
+        future = inflight[key] = new_future()
+        _stats["calls"] += 1
+        return future, True
+
+def _settle(inflight: dict, key: str, future, value=None, error: BaseException = None):
+    """Cache the leader's result and hand it (or its error, never cached) to the waiters"""
+    if error is None:
+        put_cached(key, value)
+        future.set_result(value)
+    elif isinstance(error, asyncio.CancelledError):
+        future.cancel()
+    else:
+        future.set_exception(error)
+        # Mark retrieved so an error without waiters is not logged as unhandled
+        future.exception()
+    with _lock:
+        if error is not None:
+            _stats["errors"] += 1
+        inflight.pop(key, None)
+
+def cached_completion(client, **params) -> str:
+    """
+    Run client.chat.completions.create(**params) and return the stripped message text.
+    Identical requests are answered from the cache until the TTL expires, and concurrent
+    identical requests share one in-flight call. Errors are never cached.
+    """
+    key = completion_key(params)
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+
+    future, leader = _join_or_lead(_inflight, key, Future)
+    if not leader:
+        return future.result()
+
+    try:
+        response = client.chat.completions.create(**params)
+        value = response.choices[0].message.content.strip()
+    except BaseException as e:
+        _settle(_inflight, key, future, error=e)
+        raise
+    _settle(_inflight, key, future, value)
+    return value
+
+async def cached_completion_async(create, **params) -> str:
+    """
+    Async counterpart of cached_completion.
+    create(**params) is a coroutine function returning the completion text; it is
+    awaited at most once per key at a time, other callers await the same result.
+    """
+    key = completion_key(params)
+    cached = get_cached(key)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    inflight = _async_inflight.setdefault(loop, {})
+    future, leader = _join_or_lead(inflight, key, loop.create_future)
+    if not leader:
+        # shield: one cancelled waiter must not cancel the shared call
+        return await asyncio.shield(future)
+
+    try:
+        value = await create(**params)
+    except BaseException as e:
+        _settle(inflight, key, future, error=e)
+        raise
+    _settle(inflight, key, future, value)
+    return value
+
+def ai_cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    return {
+        "memory": _memory.stats(),
+        "disk_enabled": bool(AI_CACHE_DIR),
+        "ttl_seconds": AI_CACHE_TTL_SECONDS,
+        **stats,
+    }
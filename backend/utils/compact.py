@@ -0,0 +1,83 @@
+import os
+import pandas as pd
+from .dataset_cache import frame_nbytes
+from .transformer import detect_date_columns, PARSED_DATES
+
+# Shrink parsed uploads before they are cached and transformed
+COMPACT_INGEST = os.getenv("COMPACT_INGEST", "true").lower() in ("1", "true", "yes")
+# String columns with at most this share of distinct values become categoricals
+COMPACT_CATEGORY_RATIO = float(os.getenv("COMPACT_CATEGORY_RATIO", "0.5"))
+# Date columns with more distinct values are not parsed: the parsed copy rides in attrs,
+# which pandas deep-copies on most operations
+COMPACT_DATE_CATEGORIES = 10000
+# Part of dataset cache keys; bumped when compaction changes what it produces
+COMPACT_VERSION = 3
+
+def _is_text(series: pd.Series) -> bool:
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+def _parse_dates(series: pd.Series):
+    """
+    A categorical date column's categories parsed, in a JSON-safe form the Parquet caches
+    keep, or None unless they are all ISO 8601 dates: only then does pd.to_datetime parse
+    any subset of the rows the same way, whichever row comes first.
+    """
+    categories = series.cat.categories
+    try:
+        parsed = pd.to_datetime(pd.Series(categories, dtype=object), format="ISO8601")
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not pd.api.types.is_datetime64_any_dtype(parsed.dtype):
+        return None
+    expected = pd.to_datetime(series.astype(categories.dtype), errors="coerce")
+    taken = pd.Series(parsed.array.take(series.cat.codes.to_numpy(), allow_fill=True), index=series.index)
+    if taken.dtype != expected.dtype or not taken.equals(expected):
+        return None
+    return {"categories": categories.tolist(), "dtype": str(parsed.dtype), "values": [ts.isoformat() for ts in parsed]}
+
+def compact_frame(df: pd.DataFrame, report: dict = None) -> pd.DataFrame:
+    """
+    Reduce a parsed dataframe's memory without changing its values:
+    int64 columns are downcast to the smallest integer type that fits and low-cardinality
+    string columns become categoricals. Floats are left alone, since downcasting them
+    would round values.
+    Date columns keep their text, so results serialize as they would uncompacted; when a
+    categorical one holds ISO 8601 dates, they are parsed here and kept in
+    df.attrs[PARSED_DATES] for date conversions to reuse. Date columns with more than
+    COMPACT_DATE_CATEGORIES distinct values, or too many to become categoricals, are not
+    parsed: their parsed copy would be about as large as the column.
+    report, if given, receives bytes before/after, the dtype changes per column and the
+    parsed date columns.
+    """
+    before = frame_nbytes(df)
+    changes = {}
+    parsed_dates = {}
+    df = df.copy(deep=False)
+    date_columns = set(detect_date_columns(df))
+
+    for col in df.columns:
+        series = df[col]
+        converted = None
+        if pd.api.types.is_integer_dtype(series.dtype) and series.dtype.itemsize > 1 \
+                and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            converted = pd.to_numeric(series, downcast="integer")
+        elif _is_text(series) and len(series):
+            if series.nunique(dropna=True) <= COMPACT_CATEGORY_RATIO * len(series):
+                converted = series.astype("category")
+                parsed = None
+                if col in date_columns and len(converted.cat.categories) <= COMPACT_DATE_CATEGORIES:
+                    parsed = _parse_dates(converted)
+                if parsed is not None:
+                    parsed_dates[col] = parsed
+
+        if converted is not None and converted.dtype != series.dtype:
+            changes[col] = f"{series.dtype} -> {converted.dtype}"
+            df[col] = converted
+
+    if parsed_dates:
+        df.attrs[PARSED_DATES] = parsed_dates
+    after = frame_nbytes(df)
+    if report is not None:
+        report.update({"bytes_before": before, "bytes_after": after, "columns": changes,
+                       "date_columns": sorted(parsed_dates)})
+    return df
@@ -1,5 +1,36 @@
-import pandas as pd
+"""
+Batch processing of CSV files from the command line:
+    python -m utils.csv_processor DIRECTORY_OR_GLOB --prompt "filter quantity > 10" --output-dir out
+    python -m utils.csv_processor "drops/*.csv" --config workflow.yaml --format parquet
+"""
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+import pandas as pd
+import yaml
+from .plan import normalize_prompt
+from .streaming import iter_csv_chunks, stream_transform
+from .sinks import SinkSpec, SinkWriter, parse_sink, SINK_FORMATS
+
+# Files processed at once, and files submitted to the pool at most (each holds its arguments and result)
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", str(2 * BATCH_WORKERS)))
+# Content hashes of processed files, per workflow, kept in the output directory
+BATCH_MANIFEST = ".etl-manifest.jsonl"
+# Part of every workflow hash: bumped when a fix changes what a workflow writes, so files
+# recorded by earlier versions are processed again (2: streamed chunks keep text columns as text)
+BATCH_OUTPUT_VERSION = 2
+
+# Hashes this worker skips; set by the pool initializer
+_processed = frozenset()
 
 def add_timestamp_to_csv(input_csv_path: str, output_csv_path: str):
     """
@@ -13,3 +44,211 @@ def add_timestamp_to_csv(input_csv_path: str, output_csv_path: str):
         print(f"Successfully added timestamp to {input_csv_path} and saved to {output_csv_path}")
     except Exception as e:
         print(f"Error processing CSV: {e}")
+
+def load_workflow_prompt(config_path: str) -> str:
+    """The prompt of a saved workflow config, as written by generate_config (JSON or YAML)"""
+    with open(config_path) as f:
+        config = yaml.safe_load(f)  # YAML is a superset of JSON
+    workflow = config.get("workflow", config) if isinstance(config, dict) else None
+    prompt = workflow.get("description") or workflow.get("prompt") if isinstance(workflow, dict) else None
+    if not prompt:
+        raise ValueError(f"No workflow description in {config_path}")
+    return prompt
+
+def find_inputs(source: str) -> list:
+    """CSV files of a directory, or the files matching a glob pattern, in sorted order"""
+    if os.path.isdir(source):
+        paths = glob.glob(os.path.join(source, "*.csv"))
+    else:
+        paths = glob.glob(source, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path))
+
+def _output_names(paths: list) -> list:
+    """Output names from the input file names, numbered where names repeat across directories"""
+    names, seen = [], {}
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}-{seen[stem]}")
+    return names
+
+def workflow_hash(prompt: str, spec: SinkSpec) -> str:
+    """Identifies what a batch does to a file, so a changed prompt or format reprocesses it"""
+    return hashlib.sha256(repr((normalize_prompt(prompt), tuple(spec), BATCH_OUTPUT_VERSION)).encode()).hexdigest()[:16]
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def read_manifest(path: str, workflow: str) -> frozenset:
+    """Content hashes already processed by a workflow; lines cut off by a crash are ignored"""
+    processed = set()
+    if not os.path.exists(path):
+        return frozenset()
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("workflow") == workflow:
+                processed.add(entry["sha256"])
+    return frozenset(processed)
+
+def _init_worker(processed: frozenset):
+    global _processed
+
+    _processed = processed
+    # Each worker already takes a core; transforms must not start nested pools
+    os.environ["PARALLEL_WORKERS"] = "1"
+
+def process_file(path: str, name: str, prompt: str, spec: SinkSpec, output_dir: str) -> dict:
+    """
+    Stream one CSV through the prompt's transform into output_dir, chunk by chunk, so
+    files larger than memory work. Skips files whose hash is in the worker's processed set.
+    """
+    start = time.perf_counter()
+    result = {"file": path, "status": None, "sha256": None, "rows_in": None, "rows_out": None,
+              "output": None, "bytes": None, "seconds": None, "error": None}
+    try:
+        result["sha256"] = file_sha256(path)
+        if result["sha256"] in _processed:
+            result["status"] = "skipped"
+            return result
+
+        stats = {}
+        with SinkWriter(spec, name, directory=output_dir) as writer:
+            written = False
+            for chunk in stream_transform(lambda: iter_csv_chunks(path), prompt, stats=stats):
+                writer.put(chunk)
+                written = True
+            if not written:
+                writer.put(pd.DataFrame())
+            output = writer.close()
+        result.update(status="done", rows_in=stats["rows_in"], rows_out=output["rows"], output=output["path"],
+                      bytes=output["bytes"])
+    except Exception as e:
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+def _start_pool(workers: int, processed: frozenset) -> ProcessPoolExecutor:
+    # spawn, like the job pool: forked workers would inherit the parent's threads
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context, initializer=_init_worker,
+                               initargs=(processed,))
+
+def run_batch(paths: list, prompt: str, spec: SinkSpec, output_dir: str, workers: int = BATCH_WORKERS,
+              max_in_flight: int = BATCH_MAX_IN_FLIGHT, force: bool = False) -> list:
+    """
+    Process files on a process pool with at most max_in_flight submitted at a time.
+    Every processed file is appended to the output directory's manifest as it finishes,
+    so an interrupted batch restarts where it stopped. Returns one result per file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workflow = workflow_hash(prompt, spec)
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    processed = frozenset() if force else read_manifest(manifest_path, workflow)
+
+    results = []
+    pending = iter(zip(paths, _output_names(paths)))
+    running = {}
+    pool = _start_pool(workers, processed)
+    try:
+        with open(manifest_path, "a") as manifest:
+            while True:
+                while len(running) < max(max_in_flight, 1):
+                    item = next(pending, None)
+                    if item is None:
+                        break
+                    try:
+                        future = pool.submit(process_file, item[0], item[1], prompt, spec, output_dir)
+                    except BrokenProcessPool:
+                        # A worker died and failed the files in flight; later files get a new pool
+                        pool.shutdown(wait=False)
+                        pool = _start_pool(workers, processed)
+                        future = pool.submit(process_file, item[0], item[1], prompt, spec, output_dir)
+                    running[future] = item[0]
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker died (e.g. out of memory); the pool is replaced before the next file
+                        result = {"file": path, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+                    results.append(result)
+                    if result["status"] == "done":
+                        manifest.write(json.dumps({
+                            "sha256": result["sha256"], "workflow": workflow, "file": path, "output": result["output"],
+                            "rows_out": result["rows_out"], "finished_at": datetime.now().isoformat()
+                        }) + "\n")
+                        manifest.flush()
+                    print(f"[{len(results)}/{len(paths)}] {result['status']:<7} {path}"
+                          + (f": {result['error']}" if result.get("error") else ""))
+    finally:
+        pool.shutdown()
+    return results
+
+def write_summary(results: list, path: str, prompt: str, spec: SinkSpec, seconds: float) -> dict:
+    summary = {
+        "prompt": prompt,
+        "format": spec.format,
+        "partition_by": spec.partition_by,
+        "seconds": round(seconds, 4),
+        "totals": {
+            status: sum(1 for result in results if result["status"] == status)
+            for status in ("done", "skipped", "failed")
+        },
+        "rows_in": sum(result.get("rows_in") or 0 for result in results),
+        "rows_out": sum(result.get("rows_out") or 0 for result in results),
+        "files": sorted(results, key=lambda result: result["file"]),
+    }
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a workflow over many CSV files")
+    parser.add_argument("inputs", help="directory of CSV files, or a glob pattern (quote it)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--prompt", help="transformation prompt")
+    source.add_argument("--config", help="saved workflow config (JSON or YAML); its description is the prompt")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--format", choices=SINK_FORMATS,
+                        help="output format; defaults to the one the prompt asks for, else csv")
+    parser.add_argument("--partition-by", help="column to partition each output by")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--max-in-flight", type=int, default=BATCH_MAX_IN_FLIGHT)
+    parser.add_argument("--force", action="store_true", help="reprocess files listed in the manifest")
+    parser.add_argument("--summary", help="summary file; defaults to summary-<time>.json in the output directory")
+    args = parser.parse_args(argv)
+
+    prompt = args.prompt or load_workflow_prompt(args.config)
+    spec = parse_sink(prompt) or SinkSpec("csv")
+    spec = SinkSpec(args.format or spec.format, args.partition_by or spec.partition_by)
+    paths = find_inputs(args.inputs)
+    if not paths:
+        print(f"No files match {args.inputs}")
+        return 1
+
+    print(f"Processing {len(paths)} files with {args.workers} workers: {prompt}")
+    start = time.perf_counter()
+    results = run_batch(paths, prompt, spec, args.output_dir, args.workers, args.max_in_flight, args.force)
+    summary_path = args.summary or os.path.join(args.output_dir, f"summary-{datetime.now():%Y%m%d-%H%M%S}.json")
+    summary = write_summary(results, summary_path, prompt, spec, time.perf_counter() - start)
+
+    totals = summary["totals"]
+    print(f"{totals['done']} done, {totals['skipped']} skipped, {totals['failed']} failed; "
+          f"{summary['rows_in']} rows in, {summary['rows_out']} rows out in {summary['seconds']:.1f}s")
+    print(f"Wrote {summary_path}")
+    return 1 if totals["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
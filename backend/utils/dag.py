@@ -0,0 +1,293 @@
+import contextvars
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from .ingest import is_pyarrow_available
+from .dataset_cache import DATASET_CACHE_DIR
+from .metrics import timed
+
+# Independent nodes of a workflow DAG run concurrently on this many threads
+DAG_WORKERS = int(os.getenv("DAG_WORKERS", "4"))
+# Node outputs are checkpointed here, so a failed run resumes from its last good nodes
+DAG_CHECKPOINT_DIR = os.getenv("DAG_CHECKPOINT_DIR", os.path.join(DATASET_CACHE_DIR, "dag-runs"))
+# Checkpoints of runs that were never resumed are removed after this long
+DAG_CHECKPOINT_TTL_SECONDS = float(os.getenv("DAG_CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+
+_MANIFEST = "manifest.json"
+
+class Node(NamedTuple):
+    """
+    A unit of work in a DAG. fn receives the outputs of deps, in order.
+    action is "extract", "transform" or "load", as in generated configs.
+    """
+    id: str
+    label: str
+    action: str
+    fn: object
+    deps: tuple = ()
+
+class DagFailed(Exception):
+    """A node failed; report holds the state of every node, and checkpoints are kept for a resume"""
+
+    def __init__(self, node_id: str, error: Exception, report: list):
+        super().__init__(f"Node {node_id} failed: {error}")
+        self.node_id = node_id
+        self.error = error
+        self.report = report
+
+def _ordered(nodes: list) -> list:
+    """Nodes in a topological order; raises ValueError for unknown dependencies or cycles"""
+    by_id = {node.id: node for node in nodes}
+    if len(by_id) != len(nodes):
+        raise ValueError("Duplicate node IDs")
+    order, state = [], {}
+
+    def visit(node_id: str, path: tuple):
+        if state.get(node_id) == "done":
+            return
+        if node_id in path:
+            raise ValueError(f"Cycle through node {node_id}")
+        if node_id not in by_id:
+            raise ValueError(f"Unknown dependency: {node_id}")
+        for dep in by_id[node_id].deps:
+            visit(dep, path + (node_id,))
+        state[node_id] = "done"
+        order.append(by_id[node_id])
+
+    for node in nodes:
+        visit(node.id, ())
+    return order
+
+def _checkpointing() -> bool:
+    return is_pyarrow_available()
+
+def _prune_runs(now: float):
+    if not os.path.isdir(DAG_CHECKPOINT_DIR):
+        return
+    for name in os.listdir(DAG_CHECKPOINT_DIR):
+        directory = os.path.join(DAG_CHECKPOINT_DIR, name)
+        try:
+            if now - os.stat(directory).st_mtime > DAG_CHECKPOINT_TTL_SECONDS:
+                shutil.rmtree(directory, ignore_errors=True)
+        except FileNotFoundError:
+            continue  # removed by another worker process
+
+def _read_manifest(run_dir: str) -> dict:
+    try:
+        with open(os.path.join(run_dir, _MANIFEST)) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    # Only entries whose output file survived can stand in for their node
+    return {
+        node_id: entry for node_id, entry in manifest.items()
+        if entry.get("file") is None or os.path.exists(os.path.join(run_dir, entry["file"]))
+    }
+
+def _write_manifest(run_dir: str, manifest: dict):
+    tmp_path = os.path.join(run_dir, f"{_MANIFEST}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(run_dir, _MANIFEST))
+
+def _save_output(run_dir: str, node: Node, output) -> dict:
+    """
+    Checkpoint a node's output: frames as Parquet, None as a manifest entry alone.
+    Returns the manifest entry, or None when the output cannot be checkpointed.
+    """
+    if output is None:
+        return {"file": None, "rows": None}
+    if not isinstance(output, pd.DataFrame):
+        return None
+    name = f"{node.id}.parquet"
+    tmp_path = os.path.join(run_dir, f"{name}.tmp")
+    try:
+        output.to_parquet(tmp_path)
+        # Atomic rename, so a crash never leaves a partly written checkpoint
+        os.replace(tmp_path, os.path.join(run_dir, name))
+    except Exception as e:
+        # e.g. non-string column names or mixed-type object columns
+        print(f"DAG checkpoint skipped for {node.id}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return {"file": name, "rows": len(output)}
+
+def _load_output(run_dir: str, entry: dict):
+    if entry["file"] is None:
+        return None
+    df = pd.read_parquet(os.path.join(run_dir, entry["file"]))
+    # Parquet restores missing text as None; parsed frames use NaN
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+def _entry(node: Node) -> dict:
+    return {"id": node.id, "label": node.label, "action": node.action, "deps": list(node.deps),
+            "status": "pending", "seconds": None, "rows": None, "error": None}
+
+def run_dag(nodes: list, run_key: str = None, targets: tuple = None, workers: int = DAG_WORKERS,
+            on_node=None) -> tuple:
+    """
+    Run a DAG, each node as soon as its dependencies are done, on a pool of threads.
+    Returns ({target ID: output}, report); targets default to the nodes nothing depends on.
+    report has one entry per node: status (done, resumed, failed, cancelled or skipped),
+    seconds and rows.
+
+    With a run_key, every frame a node outputs is checkpointed to Parquet. A run with
+    the same key after a failure loads checkpointed outputs instead of re-running their
+    nodes; once a run succeeds its checkpoints are removed. on_node(entry, completed, total)
+    is called after each node; raising from it stops the run.
+    """
+    nodes = _ordered(nodes)
+    by_id = {node.id: node for node in nodes}
+    if targets is None:
+        needed_by = {dep for node in nodes for dep in node.deps}
+        targets = tuple(node.id for node in nodes if node.id not in needed_by)
+
+    run_dir = None
+    manifest = {}
+    if run_key is not None and _checkpointing():
+        _prune_runs(time.time())
+        run_dir = os.path.join(DAG_CHECKPOINT_DIR, run_key)
+        os.makedirs(run_dir, exist_ok=True)
+        os.utime(run_dir)
+        manifest = _read_manifest(run_dir)
+    manifest_lock = threading.Lock()
+
+    report = {node.id: _entry(node) for node in nodes}
+    # Nodes to run: those needed for the targets, where a checkpoint cannot stand in
+    to_run, resumed = set(), set()
+    stack = list(targets)
+    while stack:
+        node_id = stack.pop()
+        if node_id in to_run or node_id in resumed:
+            continue
+        if node_id in manifest:
+            resumed.add(node_id)
+            report[node_id].update(status="resumed", rows=manifest[node_id].get("rows"))
+        else:
+            to_run.add(node_id)
+            stack.extend(by_id[node_id].deps)
+    for node_id in report:
+        if node_id not in to_run and node_id not in resumed:
+            report[node_id]["status"] = "skipped"
+
+    outputs = {}
+    # Outputs are dropped once every node that reads them has run
+    readers = {node_id: 0 for node_id in by_id}
+    for node_id in to_run:
+        for dep in by_id[node_id].deps:
+            readers[dep] += 1
+
+    def output_of(node_id: str):
+        if node_id not in outputs:
+            outputs[node_id] = _load_output(run_dir, manifest[node_id])
+        return outputs[node_id]
+
+    def execute(node: Node, args: list):
+        with timed("dag", node.id) as record:
+            output = node.fn(*args)
+            record["rows_out"] = len(output) if isinstance(output, pd.DataFrame) else None
+        entry = _save_output(run_dir, node, output) if run_dir is not None else None
+        if entry is not None:
+            with manifest_lock:
+                manifest[node.id] = entry
+                _write_manifest(run_dir, manifest)
+        return output, record
+
+    pending = [node for node in nodes if node.id in to_run]
+    running = {}
+    completed = len(resumed)
+    failure = None
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        try:
+            while pending or running:
+                if failure is None:
+                    for node in [node for node in pending if all(dep not in to_run or report[dep]["status"] == "done"
+                                                                 for dep in node.deps)]:
+                        pending.remove(node)
+                        args = [output_of(dep) for dep in node.deps]
+                        report[node.id]["status"] = "running"
+                        # Each thread records its timings into the caller's request or job
+                        context = contextvars.copy_context()
+                        running[pool.submit(context.run, execute, node, args)] = node
+                elif not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    try:
+                        outputs[node.id], record = future.result()
+                    except Exception as e:
+                        print(f"DAG node {node.id} failed: {e}")
+                        report[node.id].update(status="failed", error=str(e))
+                        failure = failure or (node.id, e)
+                        continue
+                    report[node.id].update(status="done", seconds=record.get("seconds"),
+                                           rows=record.get("rows_out"))
+                    completed += 1
+                    for dep in node.deps:
+                        readers[dep] -= 1
+                        if readers[dep] == 0 and dep not in targets:
+                            outputs.pop(dep, None)
+                    if on_node is not None:
+                        on_node(report[node.id], completed, len(to_run) + len(resumed))
+        except BaseException:
+            # Stopped from on_node (e.g. a cancelled job): let running nodes finish, start no more
+            for future in running:
+                future.cancel()
+            raise
+
+    for node in pending:
+        report[node.id]["status"] = "cancelled"
+    if failure is not None:
+        raise DagFailed(failure[0], failure[1], list(report.values()))
+
+    results = {node_id: output_of(node_id) for node_id in targets}
+    if run_dir is not None:
+        # A complete run has nothing to resume
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return results, list(report.values())
+
+def _mermaid_label(entry: dict) -> str:
+    label = entry["label"].replace('"', "#quot;")
+    if entry["status"] == "done" and entry["seconds"] is not None:
+        detail = f"{entry['seconds']:.3f}s"
+        if entry["rows"] is not None:
+            detail += f", {entry['rows']:,} rows"
+        return f"{label}<br/>{detail}"
+    if entry["status"] == "resumed":
+        return f"{label}<br/>resumed from checkpoint"
+    if entry["status"] in ("failed", "cancelled", "skipped"):
+        return f"{label}<br/>{entry['status']}"
+    return label
+
+def render_mermaid(report: list) -> str:
+    """Mermaid diagram of a DAG run, with every node's timing and status"""
+    lines = ["graph TD"]
+    needed_by = {dep for entry in report for dep in entry["deps"]}
+    for entry in report:
+        lines.append(f'    {entry["id"]}["{_mermaid_label(entry)}"];')
+    for entry in report:
+        if not entry["deps"]:
+            lines.append(f"    Start-->{entry['id']};")
+        for dep in entry["deps"]:
+            lines.append(f"    {dep}-->{entry['id']};")
+        if entry["id"] not in needed_by:
+            lines.append(f"    {entry['id']}-->Finish;")
+    lines.append("    Finish[Finish];")
+    lines.append("    classDef failed fill:#f8d7da,stroke:#c0392b;")
+    lines.append("    classDef resumed fill:#d6eaf8,stroke:#2e86c1;")
+    for status in ("failed", "resumed"):
+        ids = [entry["id"] for entry in report if entry["status"] == status]
+        if ids:
+            lines.append(f"    class {','.join(ids)} {status};")
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import tempfile
+import threading
+import pandas as pd
+from .lru import ByteLRU
+from .ingest import is_pyarrow_available
+
+# Parsed uploads keyed by content hash: an in-memory LRU backed by Parquet files on disk
+DATASET_CACHE_MEMORY_BYTES = int(os.getenv("DATASET_CACHE_MEMORY_BYTES", str(512 * 1024 ** 2)))
+DATASET_CACHE_DISK_BYTES = int(os.getenv("DATASET_CACHE_DISK_BYTES", str(4 * 1024 ** 3)))
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(tempfile.gettempdir(), "etl-dataset-cache"))
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    """In-memory size of a dataframe, including Python string objects"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+_memory = ByteLRU(DATASET_CACHE_MEMORY_BYTES, frame_nbytes)
+_disk_lock = threading.Lock()
+_disk_stats = {"hits": 0, "writes": 0, "write_errors": 0, "evictions": 0}
+_misses = 0
+
+def dataset_key(digest: str, *variant) -> str:
+    """Cache key for a content hash plus the options it was parsed with (file type, sheet, ...)"""
+    if not variant:
+        return digest
+    return hashlib.sha256("|".join([digest, *map(str, variant)]).encode()).hexdigest()
+
+def _disk_path(key: str) -> str:
+    return os.path.join(DATASET_CACHE_DIR, f"{key}.parquet")
+
+def _disk_enabled() -> bool:
+    return DATASET_CACHE_DISK_BYTES > 0 and is_pyarrow_available()
+
+def get_dataset(key: str):
+    """Return the cached dataframe for a key from memory, then disk, or None"""
+    global _misses
+
+    df = _memory.get(key)
+    if df is not None:
+        return df
+
+    path = _disk_path(key)
+    if _disk_enabled() and os.path.exists(path):
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            print(f"Dataset cache read failed for {key}: {e}")
+        else:
+            # mtime doubles as the disk tier's recency for eviction
+            os.utime(path)
+            _memory.put(key, df)
+            with _disk_lock:
+                _disk_stats["hits"] += 1
+            return df
+
+    with _disk_lock:
+        _misses += 1
+    return None
+
+def has_dataset(key: str) -> bool:
+    """Whether a key is cached in either tier, without counting a lookup"""
+    return key in _memory or (_disk_enabled() and os.path.exists(_disk_path(key)))
+
+def _evict_disk():
+    """Remove least recently used Parquet files until the disk tier fits its budget"""
+    entries = []
+    for name in os.listdir(DATASET_CACHE_DIR):
+        if not name.endswith(".parquet"):
+            continue
+        try:
+            stat = os.stat(os.path.join(DATASET_CACHE_DIR, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= DATASET_CACHE_DISK_BYTES:
+            break
+        try:
+            os.remove(os.path.join(DATASET_CACHE_DIR, name))
+            _disk_stats["evictions"] += 1
+        except FileNotFoundError:
+            pass  # removed by another worker process
+        total -= size
+
+def put_dataset(key: str, df: pd.DataFrame):
+    """Cache a parsed dataframe in memory and, when Parquet is available, on disk"""
+    _memory.put(key, df)
+    if not _disk_enabled():
+        return
+
+    path = _disk_path(key)
+    if os.path.exists(path):
+        return
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _disk_lock:
+        try:
+            df.to_parquet(tmp_path)
+            # Atomic rename, so readers never see a partial file
+            os.replace(tmp_path, path)
+            _disk_stats["writes"] += 1
+        except Exception as e:
+            # e.g. object columns with mixed types that Parquet cannot represent
+            print(f"Dataset cache write skipped for {key}: {e}")
+            _disk_stats["write_errors"] += 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        _evict_disk()
+
+def cache_stats() -> dict:
+    """Hit/miss counters and sizes of both cache tiers"""
+    memory = _memory.stats()
+    disk_bytes, disk_entries = 0, 0
+    if _disk_enabled() and os.path.isdir(DATASET_CACHE_DIR):
+        for name in os.listdir(DATASET_CACHE_DIR):
+            if name.endswith(".parquet"):
+                try:
+                    disk_bytes += os.path.getsize(os.path.join(DATASET_CACHE_DIR, name))
+                    disk_entries += 1
+                except FileNotFoundError:
+                    pass
+    with _disk_lock:
+        disk = dict(_disk_stats)
+        misses = _misses
+    return {
+        "hits": memory["hits"] + disk["hits"],
+        "misses": misses,
+        "memory": memory,
+        "disk": {
+            "enabled": _disk_enabled(),
+            "directory": DATASET_CACHE_DIR,
+            "entries": disk_entries,
+            "bytes": disk_bytes,
+            "max_bytes": DATASET_CACHE_DISK_BYTES,
+            **disk,
+        },
+    }
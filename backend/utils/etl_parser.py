@@ -32,6 +32,18 @@ def generate_config(prompt: str, format: str = "json"):
     }
     return json.dumps(data, indent=2) if format == "json" else yaml.dump(data)
 
+def config_steps(config: str) -> list:
+    """The steps of a generated workflow config (JSON or YAML), or [] if it has none"""
+    try:
+        data = yaml.safe_load(config)  # JSON is YAML too
+    except yaml.YAMLError:
+        return []
+    workflow = data.get("workflow") if isinstance(data, dict) else None
+    steps = workflow.get("steps") if isinstance(workflow, dict) else None
+    if not isinstance(steps, list):
+        return []
+    return [step for step in steps if isinstance(step, dict) and isinstance(step.get("description"), str)]
+
 def generate_dag(prompt: str):
     # Split steps by various delimiters and action words
     steps_raw = re.split(r"(?:then|,|and|next|after|followed by|to)", prompt, flags=re.IGNORECASE)
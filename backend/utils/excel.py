@@ -0,0 +1,280 @@
+import os
+import shutil
+import threading
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from .ingest import is_pyarrow_available
+from .dataset_cache import DATASET_CACHE_DIR, dataset_key
+
+# auto: python-calamine when installed, then openpyxl in read-only mode; "calamine"/"openpyxl" force one
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "auto").lower()
+EXCEL_CHUNK_ROWS = int(os.getenv("EXCEL_CHUNK_ROWS", "50000"))
+# Parsed sheets are converted once to Parquet parts, so later requests never re-parse the workbook
+EXCEL_CACHE_DIR = os.getenv("EXCEL_CACHE_DIR", os.path.join(DATASET_CACHE_DIR, "excel"))
+EXCEL_CACHE_MAX_BYTES = int(os.getenv("EXCEL_CACHE_MAX_BYTES", str(4 * 1024 ** 3)))
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+
+_cache_lock = threading.Lock()
+
+class SheetRange(NamedTuple):
+    """Which part of a workbook to read: a sheet (name or 0-based index) and a range of data rows"""
+    sheet: str = None
+    start_row: int = 0
+    max_rows: int = None
+
+def is_excel(filename: str) -> bool:
+    return filename.lower().endswith(EXCEL_EXTENSIONS)
+
+def _available(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+def _engine(filename: str) -> str:
+    """Streaming reader for a workbook, or None when only pandas' own reader can open it"""
+    if EXCEL_ENGINE in ("auto", "calamine") and _available("python_calamine"):
+        return "calamine"
+    if EXCEL_ENGINE in ("auto", "openpyxl") and not filename.lower().endswith(".xls") and _available("openpyxl"):
+        return "openpyxl"
+    return None
+
+def _sheet_ref(sheet: str):
+    """Sheet names are matched first; a number that is not a sheet name selects by position"""
+    if sheet is None or sheet == "":
+        return 0
+    return sheet
+
+def _iter_calamine(path: str, sheet: str):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(path)
+    try:
+        ref = _sheet_ref(sheet)
+        if isinstance(ref, str) and ref in workbook.sheet_names:
+            worksheet = workbook.get_sheet_by_name(ref)
+        elif str(ref).isdigit() and int(ref) < len(workbook.sheet_names):
+            worksheet = workbook.get_sheet_by_index(int(ref))
+        else:
+            raise ValueError(f"Worksheet not found: {sheet}")
+        yield from worksheet.iter_rows()
+    finally:
+        workbook.close()
+
+def _iter_openpyxl(path: str, sheet: str):
+    import openpyxl
+
+    # read_only streams rows from the XML instead of building the whole sheet in memory
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ref = _sheet_ref(sheet)
+        if isinstance(ref, str) and ref in workbook.sheetnames:
+            worksheet = workbook[ref]
+        elif str(ref).isdigit() and int(ref) < len(workbook.sheetnames):
+            worksheet = workbook.worksheets[int(ref)]
+        else:
+            raise ValueError(f"Worksheet not found: {sheet}")
+        yield from worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _header(row) -> list:
+    """Column names from the header row, named and de-duplicated the way read_excel does"""
+    names = list(row)
+    while names and names[-1] in (None, ""):
+        names.pop()
+    columns = []
+    seen = {}
+    for i, name in enumerate(names):
+        name = f"Unnamed: {i}" if name in (None, "") else name
+        if isinstance(name, float) and name.is_integer():
+            name = int(name)
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen.setdefault(base, 0)
+        seen[name] = 0
+        columns.append(name)
+    return columns
+
+def _rows_to_frame(rows: list, columns: list) -> pd.DataFrame:
+    """Build a chunk column by column, with the types read_excel would infer"""
+    width = len(columns)
+    values = list(zip(*(tuple(row[:width]) + (None,) * (width - len(row)) for row in rows))) if rows else [()] * width
+    data = {}
+    for name, column in zip(columns, values):
+        series = pd.Series(column, dtype=object)
+        # Empty cells inside the used range come back as ""
+        blank = series.eq("")
+        if blank.any():
+            series = series.where(~blank, None)
+        series = series.infer_objects()
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ("date", "datetime"):
+            series = pd.to_datetime(series)
+        elif series.dtype == object:
+            series = series.where(series.notna(), np.nan)
+        elif series.dtype.kind == "f" and series.notna().all() and not np.mod(series.to_numpy(), 1).any():
+            # Excel stores every number as a double; whole numbers read back as integers
+            series = series.astype("int64")
+        data[name] = series
+    return pd.DataFrame(data, columns=columns)
+
+def _iter_parsed(path: str, filename: str, sheet: str, chunk_rows: int):
+    """Parse a sheet into dataframes of chunk_rows rows, skipping blank rows"""
+    engine = _engine(filename)
+    if engine is None:
+        # Fallback: pandas' reader (e.g. xlrd for .xls) loads the sheet at once
+        ref = _sheet_ref(sheet)
+        df = pd.read_excel(path, sheet_name=int(ref) if str(ref).isdigit() else ref)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows].reset_index(drop=True)
+        return
+
+    rows = _iter_calamine(path, sheet) if engine == "calamine" else _iter_openpyxl(path, sheet)
+    try:
+        columns = None
+        batch = []
+        for row in rows:
+            if columns is None:
+                columns = _header(row)
+                continue
+            if all(value is None or value == "" for value in row):
+                continue
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield _rows_to_frame(batch, columns)
+                batch = []
+        if batch or columns is None:
+            yield _rows_to_frame(batch, columns or [])
+    finally:
+        rows.close()
+
+def _cache_dir(digest: str, sheet: str) -> str:
+    return os.path.join(EXCEL_CACHE_DIR, dataset_key(digest, "excel", _sheet_ref(sheet)))
+
+def _cache_enabled(digest: str) -> bool:
+    return digest is not None and EXCEL_CACHE_MAX_BYTES > 0 and is_pyarrow_available()
+
+def is_converted(digest: str, sheet: str = None) -> bool:
+    """Whether a workbook sheet is already in the columnar cache"""
+    return _cache_enabled(digest) and os.path.isdir(_cache_dir(digest, sheet))
+
+def _iter_cached(directory: str, columns: list = None):
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".parquet"):
+            chunk = pd.read_parquet(os.path.join(directory, name), columns=columns)
+            # Parquet restores missing text as None; parsed chunks use NaN
+            for col in chunk.columns:
+                if chunk[col].dtype == object:
+                    chunk[col] = chunk[col].where(chunk[col].notna(), np.nan)
+            yield chunk
+
+def _evict_cache():
+    """Remove least recently used converted workbooks until the cache fits its budget"""
+    entries = []
+    for name in os.listdir(EXCEL_CACHE_DIR):
+        directory = os.path.join(EXCEL_CACHE_DIR, name)
+        if name.endswith(".tmp") or not os.path.isdir(directory):
+            continue
+        try:
+            size = sum(entry.stat().st_size for entry in os.scandir(directory))
+            entries.append((os.stat(directory).st_mtime, size, directory))
+        except FileNotFoundError:
+            continue  # removed by another worker process
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, directory in sorted(entries):
+        if total <= EXCEL_CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+
+def _iter_converting(path: str, filename: str, sheet: str, directory: str, chunk_rows: int):
+    """Parse the sheet, writing every chunk to a Parquet part; publish the parts once all were written"""
+    tmp_dir = f"{directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    caching = True
+    complete = False
+    try:
+        for i, chunk in enumerate(_iter_parsed(path, filename, sheet, chunk_rows)):
+            if caching:
+                try:
+                    chunk.to_parquet(os.path.join(tmp_dir, f"part-{i:06d}.parquet"), index=False)
+                except Exception as e:
+                    # e.g. object columns with mixed types that Parquet cannot represent
+                    print(f"Excel cache skipped for {filename}: {e}")
+                    caching = False
+            yield chunk
+        complete = True
+    finally:
+        if caching and complete:
+            with _cache_lock:
+                try:
+                    # Atomic rename, so readers never see a partly written workbook
+                    os.rename(tmp_dir, directory)
+                    print(f"Converted {filename} to {directory}")
+                except OSError:
+                    pass  # converted concurrently by another request
+                _evict_cache()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def iter_excel_chunks(path: str, filename: str, digest: str = None, sheet_range: SheetRange = None,
+                      chunk_rows: int = EXCEL_CHUNK_ROWS, columns: list = None):
+    """
+    Read a workbook sheet as dataframe chunks, restricted to sheet_range's rows and,
+    if given, to columns. With a content digest, the first read converts the whole
+    sheet to a columnar cache that later reads come from.
+    """
+    sheet_range = sheet_range or SheetRange()
+    start = max(sheet_range.start_row or 0, 0)
+    end = None if sheet_range.max_rows is None else start + max(sheet_range.max_rows, 0)
+
+    converting = cached = False
+    if _cache_enabled(digest):
+        directory = _cache_dir(digest, sheet_range.sheet)
+        if os.path.isdir(directory):
+            # mtime doubles as the cache's recency for eviction
+            os.utime(directory)
+            chunks = _iter_cached(directory, columns)
+            cached = True
+        else:
+            os.makedirs(EXCEL_CACHE_DIR, exist_ok=True)
+            chunks = _iter_converting(path, filename, sheet_range.sheet, directory, chunk_rows)
+            converting = True
+    else:
+        chunks = _iter_parsed(path, filename, sheet_range.sheet, chunk_rows)
+
+    position = 0
+    emitted = False
+    empty = None
+    try:
+        for chunk in chunks:
+            chunk_start, position = position, position + len(chunk)
+            part = chunk.iloc[max(start - chunk_start, 0):None if end is None else max(end - chunk_start, 0)]
+            if columns is not None and not cached:
+                part = part[columns]
+            if len(part):
+                emitted = True
+                yield part.reset_index(drop=True)
+            elif empty is None:
+                empty = part
+            # A conversion reads on to the end of the sheet, so the cache is complete
+            if end is not None and position >= end and not converting:
+                break
+        if not emitted and empty is not None:
+            # Nothing in range: still yield the columns
+            yield empty.reset_index(drop=True)
+    finally:
+        chunks.close()
+
+def read_excel_file(path: str, filename: str, digest: str = None, sheet_range: SheetRange = None,
+                    columns: list = None, chunk_rows: int = EXCEL_CHUNK_ROWS) -> pd.DataFrame:
+    """Parse a workbook sheet (or the selected rows and columns of it) into one dataframe"""
+    chunks = list(iter_excel_chunks(path, filename, digest, sheet_range, chunk_rows, columns))
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,98 @@
+import datetime
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple
+import pandas as pd
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# auto: pyarrow when installed, otherwise the C engine; "pyarrow" or "c" force one
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto").lower()
+
+_pyarrow_available = None
+
+def is_pyarrow_available() -> bool:
+    """Check once whether the optional pyarrow package can be imported"""
+    global _pyarrow_available
+
+    if _pyarrow_available is None:
+        try:
+            import pyarrow  # noqa: F401
+            _pyarrow_available = True
+        except ImportError:
+            _pyarrow_available = False
+    return _pyarrow_available
+
+class SpooledUpload(NamedTuple):
+    """An upload copied to disk, with its content hash"""
+    path: str
+    sha256: str
+    size: int
+
+async def spool_upload(upload, spool_dir: str = None) -> SpooledUpload:
+    """
+    Stream an upload to a named temporary file in fixed-size chunks, hashing it on the way.
+    The caller is responsible for removing the file.
+    """
+    suffix = os.path.splitext(upload.filename or "")[1]
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(prefix="etl-upload-", suffix=suffix, dir=spool_dir, delete=False) as tmp:
+        try:
+            while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+                tmp.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    return SpooledUpload(tmp.name, digest.hexdigest(), size)
+
+def _is_temporal(series: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if series.dtype == object:
+        first = series.first_valid_index()
+        return first is not None and isinstance(series[first], datetime.date)
+    return False
+
+def _read_csv_pyarrow(path: str, **kwargs) -> pd.DataFrame:
+    df = pd.read_csv(path, engine="pyarrow", **kwargs)
+
+    # pyarrow infers dates and timestamps the C engine leaves as text; re-read only
+    # those columns with the C engine so downstream stages see the same values
+    temporal = [col for col in df.columns if _is_temporal(df[col])]
+    if temporal:
+        text = pd.read_csv(path, memory_map=True, **{**kwargs, "usecols": temporal})
+        for col in temporal:
+            df[col] = text[col]
+    return df
+
+def uses_pyarrow_csv() -> bool:
+    """Whether read_csv_file parses with the pyarrow engine"""
+    return CSV_ENGINE == "pyarrow" or (CSV_ENGINE == "auto" and is_pyarrow_available())
+
+def read_csv_file(path: str, **kwargs) -> pd.DataFrame:
+    """
+    Parse a CSV file from disk.
+    Uses the multithreaded pyarrow engine when available, otherwise the C engine
+    reading through a memory map, so the raw bytes are never held in memory.
+    """
+    if uses_pyarrow_csv():
+        try:
+            return _read_csv_pyarrow(path, **kwargs)
+        except (ImportError, ValueError) as e:
+            # Options or input the pyarrow engine does not support
+            print(f"pyarrow CSV engine failed ({e}), falling back to the C engine")
+    return pd.read_csv(path, memory_map=True, **kwargs)
+
+def read_dataset(source, filename: str) -> pd.DataFrame:
+    """Parse an uploaded CSV or Excel file from a path or file object"""
+    if filename.endswith(".csv"):
+        if isinstance(source, (str, os.PathLike)):
+            return read_csv_file(source)
+        return pd.read_csv(source)
+    elif filename.endswith((".xlsx", ".xls")):
+        return pd.read_excel(source)
+    raise ValueError("Unsupported file format")
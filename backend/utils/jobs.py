@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+# Background jobs run on a process pool so CPU-heavy work never blocks the event loop
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", "16"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+ACTIVE_STATES = ("queued", "running", "cancelling")
+
+class JobQueueFull(Exception):
+    """Raised when the number of queued and running jobs reached JOB_QUEUE_DEPTH"""
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a worker when its job was cancelled.
+    Like asyncio.CancelledError it derives from BaseException, so the pipeline's
+    broad error handling does not swallow it.
+    """
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = None
+_manager = None
+
+def _init_worker():
+    # Jobs already occupy a process per core; their transforms must not start nested pools
+    os.environ["PARALLEL_WORKERS"] = "1"
+
+def _get_executor():
+    """Lazy initialization of the process pool and the shared status manager"""
+    global _executor, _manager
+
+    if _executor is None:
+        # spawn avoids forking a process that already runs server threads
+        context = multiprocessing.get_context("spawn")
+        _manager = context.Manager()
+        _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=context, initializer=_init_worker)
+    return _executor
+
+def report_progress(status, progress: float, message: str = ""):
+    """Called from a worker to publish progress; raises JobCancelled if the job was cancelled"""
+    if status is None:
+        return
+    if status.get("cancelled"):
+        raise JobCancelled()
+    status.update(state="running", progress=round(progress, 3), message=message)
+
+def _prune_finished(now: float):
+    """Forget finished jobs after JOB_TTL_SECONDS; caller must hold the lock"""
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job["state"] not in ACTIVE_STATES and now - job["finished_at"] > JOB_TTL_SECONDS
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def _finish(job_id: str, future, on_done, on_cancel):
+    """Done callback: record the outcome of a job"""
+    outcome = {"finished_at": time.time()}
+    if future.cancelled():
+        # The worker never started, so it could not clean up after itself
+        if on_cancel is not None:
+            on_cancel()
+        outcome.update(state="cancelled")
+    else:
+        error = future.exception()
+        if isinstance(error, JobCancelled):
+            outcome.update(state="cancelled")
+        elif error is not None:
+            outcome.update(state="failed", error=str(error))
+        else:
+            try:
+                result = future.result()
+                outcome.update(state="completed", progress=1.0, result=on_done(result) if on_done else result)
+            except Exception as e:
+                outcome.update(state="failed", error=str(e))
+
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(outcome)
+
+def submit_job(fn, *args, on_done=None, on_cancel=None) -> str:
+    """
+    Submit fn(status, *args) to the process pool and return a job ID.
+    on_done, if given, runs in this process on the worker's return value;
+    on_cancel runs if the job is cancelled before a worker picks it up.
+    """
+    executor = _get_executor()
+    now = time.time()
+
+    with _lock:
+        _prune_finished(now)
+        active = sum(1 for job in _jobs.values() if job["state"] in ACTIVE_STATES)
+        if active >= JOB_QUEUE_DEPTH:
+            raise JobQueueFull(f"Job queue is full ({JOB_QUEUE_DEPTH} jobs queued or running)")
+
+        job_id = uuid.uuid4().hex
+        status = _manager.dict(cancelled=False)
+        _jobs[job_id] = {
+            "state": "queued",
+            "progress": 0.0,
+            "message": "",
+            "submitted_at": now,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+            "status": status,
+            "future": None,
+        }
+
+    future = executor.submit(fn, status, *args)
+    with _lock:
+        _jobs[job_id]["future"] = future
+    future.add_done_callback(lambda f: _finish(job_id, f, on_done, on_cancel))
+    return job_id
+
+def get_job(job_id: str):
+    """Snapshot of a job's state, progress and result, or None if unknown"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = {key: value for key, value in job.items() if key not in ("status", "future")}
+
+    # Live progress is published by the worker through the shared status dict
+    if snapshot["state"] in ("queued", "running"):
+        try:
+            live = dict(job["status"])
+        except Exception:
+            live = {}
+        snapshot["state"] = live.get("state", snapshot["state"])
+        snapshot["progress"] = live.get("progress", snapshot["progress"])
+        snapshot["message"] = live.get("message", snapshot["message"])
+    return {"job_id": job_id, **snapshot}
+
+def cancel_job(job_id: str) -> bool:
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None or job["state"] not in ACTIVE_STATES:
+            return False
+        future = job["future"]
+
+    if future is not None and future.cancel():
+        return True
+
+    job["status"]["cancelled"] = True
+    with _lock:
+        if job["state"] in ("queued", "running"):
+            job["state"] = "cancelling"
+    return True
+
+def shutdown_jobs():
+    """Stop the process pool and status manager"""
+    global _executor, _manager
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _manager.shutdown()
+        _executor = None
+        _manager = None
@@ -0,0 +1,399 @@
+import os
+from functools import lru_cache
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from .plan import Op, Plan, Stage
+from .lru import ByteLRU
+from .dataset_cache import dataset_key, frame_nbytes
+from .ingest import read_csv_file, spool_upload
+from .excel import SheetRange, is_excel, iter_excel_chunks, read_excel_file
+from .streaming import SpilledFrame, iter_csv_chunks, STREAM_CHUNK_ROWS
+from .transformer import clean_column_names
+from .metrics import timed
+
+# Lookup files up to this size are indexed whole and probed by every row (a broadcast join);
+# larger ones are joined partition by partition, each partition about this size
+JOIN_BROADCAST_MAX_BYTES = int(os.getenv("JOIN_BROADCAST_MAX_BYTES", str(64 * 1024 ** 2)))
+JOIN_MAX_PARTITIONS = int(os.getenv("JOIN_MAX_PARTITIONS", "256"))
+# Hash indexes of lookup tables keyed by content hash and key column
+JOIN_INDEX_CACHE_BYTES = int(os.getenv("JOIN_INDEX_CACHE_BYTES", str(256 * 1024 ** 2)))
+
+# Input row number carried through a partitioned join, to restore the input order
+_ROW = "__join_row"
+
+class Lookup(NamedTuple):
+    """A lookup table uploaded with a workflow; prompts refer to it by name"""
+    name: str
+    path: str
+    filename: str
+    digest: str
+    size: int
+
+    def __repr__(self):
+        # Stage cache keys hold the repr: it must change with the content, not the spooled path
+        return f"Lookup({self.name!r}, {self.digest!r})"
+
+class HashIndex:
+    """
+    A lookup table hashed on its key column: the distinct keys, and the positions of the
+    rows of each key. Rows with a missing key are left out: missing keys never match.
+    """
+
+    def __init__(self, table: pd.DataFrame, key: str):
+        self.key = key
+        self.kind = _key_kind(table[key])
+        codes, uniques = pd.factorize(_normalize_keys(table[key]))
+        present = np.flatnonzero(codes >= 0)
+        self.rows = present[np.argsort(codes[present], kind="stable")]
+        self.counts = np.bincount(codes[present], minlength=len(uniques))
+        self.starts = np.cumsum(self.counts) - self.counts
+        self.keys = pd.Index(uniques)
+        # Build the hash table now, so cached indexes are probed without rebuilding it
+        self.keys.get_indexer(self.keys[:1])
+        self.payload = table.drop(columns=[key]).reset_index(drop=True)
+        self.nbytes = frame_nbytes(self.payload) + 2 * int(self.keys.memory_usage(deep=True)) \
+            + self.rows.nbytes + self.counts.nbytes + self.starts.nbytes
+
+    def probe(self, keys: pd.Series, how: str) -> tuple:
+        """
+        (left rows, right rows) of the joined rows, in the order of keys; left rows is None
+        when every key gives exactly one row. Right rows are -1 where a left join found no match.
+        """
+        codes = self.keys.get_indexer(_normalize_keys(keys))
+        found = codes >= 0
+        matches = np.zeros(len(codes), dtype=np.int64)
+        matches[found] = self.counts[codes[found]]
+        repeats = np.maximum(matches, 1) if how == "left" else matches
+        starts = np.zeros(len(codes), dtype=np.int64)
+        starts[found] = self.starts[codes[found]]
+
+        if (repeats == 1).all():
+            right = self.rows[starts] if len(self.rows) else np.zeros(len(codes), dtype=np.int64)
+            right[~found] = -1
+            return None, right
+        # Each left row repeated once per match, next to consecutive rows of its key
+        within = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        right = self.rows[np.repeat(starts, repeats) + within] if len(self.rows) else np.zeros(len(within), dtype=np.int64)
+        right[np.repeat(~found, repeats)] = -1
+        return np.repeat(np.arange(len(codes)), repeats), right
+
+_indexes = ByteLRU(JOIN_INDEX_CACHE_BYTES, lambda index: index.nbytes)
+
+def lookup_name(filename: str) -> str:
+    """The name prompts use for a lookup file: its cleaned file name without extension"""
+    return os.path.splitext(os.path.basename(filename))[0].strip().lower().replace(" ", "_")
+
+async def spool_lookups(uploads) -> tuple:
+    """Spool lookup uploads to disk; the caller removes their files with remove_lookups"""
+    lookups = []
+    try:
+        for upload in uploads or ():
+            spooled = await spool_upload(upload)
+            lookups.append(Lookup(lookup_name(upload.filename), spooled.path, upload.filename, spooled.sha256,
+                                  spooled.size))
+    except BaseException:
+        remove_lookups(lookups)
+        raise
+    return tuple(lookups)
+
+def remove_lookups(lookups):
+    for lookup in lookups or ():
+        if os.path.exists(lookup.path):
+            os.remove(lookup.path)
+
+def find_lookup(lookups, table: str):
+    """The lookup a prompt's table name refers to: by exact name, then by name fragment"""
+    for lookup in lookups or ():
+        if lookup.name == table:
+            return lookup
+    for lookup in lookups or ():
+        if table in lookup.name or lookup.name in table:
+            return lookup
+    return None
+
+def missing_lookups(plan: Plan, lookups) -> list:
+    """Table names joined by a plan that no lookup upload provides"""
+    return [op.params[0] for op in plan.stage("joining").ops if find_lookup(lookups, op.params[0]) is None]
+
+def bind_lookups(plan: Plan, lookups) -> Plan:
+    """The plan with every join op given the lookup it names, as its last parameter"""
+    joining = plan.stage("joining")
+    if joining.is_noop:
+        return plan
+    ops = tuple(Op(op.kind, (*op.params[:3], find_lookup(lookups, op.params[0]))) for op in joining.ops)
+    return plan._replace(stages=tuple(
+        Stage(stage.name, ops) if stage.name == "joining" else stage for stage in plan.stages
+    ))
+
+def is_broadcast(lookup: Lookup) -> bool:
+    return lookup.size <= JOIN_BROADCAST_MAX_BYTES
+
+def _key_kind(series: pd.Series):
+    """"number" or "text", or None for a column without values, which matches neither"""
+    if not series.notna().any():
+        return None
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    return "number" if pd.api.types.is_numeric_dtype(dtype) else "text"
+
+def _normalize_keys(series: pd.Series) -> pd.Series:
+    """Keys in one type per kind, so 1 and 1.0 hash and match alike on both sides"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(series.cat.categories.dtype)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("float64")
+    return series.astype(object)
+
+def _check_kinds(left_kind, right_kind, key: str):
+    if left_kind is not None and right_kind is not None and left_kind != right_kind:
+        raise ValueError(f"Cannot join on {key}: it holds {left_kind} on one side and {right_kind} on the other")
+
+@lru_cache(maxsize=64)
+def lookup_columns(lookup: Lookup) -> tuple:
+    """Cleaned column names of a lookup table, from its header alone"""
+    if is_excel(lookup.filename):
+        header = read_excel_file(lookup.path, lookup.filename, lookup.digest, SheetRange(max_rows=0))
+    else:
+        header = pd.read_csv(lookup.path, nrows=0)
+    return tuple(clean_column_names(header).columns)
+
+def _match_column(columns, key: str):
+    """The column a key names: an exact match, else the first containing it, as kernels pick"""
+    if key in columns:
+        return key
+    return next((col for col in columns if key.lower() in col.lower()), None)
+
+def resolve_keys(columns, lookup: Lookup, key: str = None) -> tuple:
+    """
+    (left key, lookup key) columns of a join. Without a key in the prompt, the first
+    column both tables share is used.
+    """
+    right_columns = lookup_columns(lookup)
+    if key is None:
+        shared = next((col for col in columns if col in right_columns), None)
+        if shared is None:
+            raise ValueError(f"No column shared with {lookup.name} to join on")
+        return shared, shared
+    left_key, right_key = _match_column(list(columns), key), _match_column(right_columns, key)
+    if left_key is None or right_key is None:
+        raise ValueError(f"Join column not found: {key}" + ("" if left_key is None else f" in {lookup.name}"))
+    return left_key, right_key
+
+def _read_lookup(lookup: Lookup) -> pd.DataFrame:
+    if is_excel(lookup.filename):
+        df = read_excel_file(lookup.path, lookup.filename, lookup.digest)
+    else:
+        df = read_csv_file(lookup.path)
+    return clean_column_names(df)
+
+def _lookup_chunks(lookup: Lookup):
+    if is_excel(lookup.filename):
+        chunks = iter_excel_chunks(lookup.path, lookup.filename, lookup.digest)
+    else:
+        chunks = iter_csv_chunks(lookup.path)
+    for chunk in chunks:
+        yield clean_column_names(chunk)
+
+def lookup_index(lookup: Lookup, key: str) -> HashIndex:
+    """The hash index of a lookup table on a key column, built once per content hash"""
+    cache_key = dataset_key(lookup.digest, "join-index", key)
+    index = _indexes.get(cache_key)
+    if index is None:
+        with timed("join", "index") as record:
+            index = HashIndex(_read_lookup(lookup), key)
+            record["rows_out"] = len(index.payload)
+        _indexes.put(cache_key, index)
+    return index
+
+def join_index_stats() -> dict:
+    return _indexes.stats()
+
+def _take(series: pd.Series, positions: np.ndarray, fill: bool):
+    """Rows of a column by position; -1 gives a missing value when fill is set"""
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        return series.array.take(positions, allow_fill=fill)
+    return pd.api.extensions.take(series.to_numpy(), positions, allow_fill=fill)
+
+def _join_block(left: pd.DataFrame, left_key: str, index: HashIndex, how: str, name: str) -> pd.DataFrame:
+    """
+    Join rows to an index, as DataFrame.merge would: in the order of the left rows,
+    each followed by its matches in lookup order. Lookup columns whose names are taken
+    get the lookup's name as a suffix.
+    """
+    _check_kinds(_key_kind(left[left_key]), index.kind, left_key)
+    left_rows, right_rows = index.probe(left[left_key], how)
+    base = left.copy(deep=False) if left_rows is None else left.take(left_rows)
+    base.index = pd.RangeIndex(len(base))
+    fill = bool((right_rows < 0).any())
+    added = {
+        (f"{col}_{name}" if col in left.columns else col): _take(index.payload[col], right_rows, fill)
+        for col in index.payload.columns
+    }
+    return pd.concat([base, pd.DataFrame(added, index=base.index)], axis=1)
+
+def _split_partitions(chunk: pd.DataFrame, key: str, partitions: int, keep_missing: bool):
+    """(partition, rows) of a chunk by the hash of its key; missing keys go to partition 0 or are dropped"""
+    keys = _normalize_keys(chunk[key])
+    parts = pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(partitions)
+    parts = parts.astype(np.int64)
+    parts[keys.isna().to_numpy()] = 0 if keep_missing else -1
+    order = np.argsort(parts, kind="stable")
+    order = order[parts[order] >= 0]
+    bounds = np.flatnonzero(np.diff(parts[order])) + 1
+    for rows in np.split(order, bounds) if len(order) else ():
+        yield int(parts[rows[0]]), chunk.iloc[rows]
+
+def partition_count(lookup: Lookup) -> int:
+    return min(max(-(-lookup.size // max(JOIN_BROADCAST_MAX_BYTES, 1)), 2), JOIN_MAX_PARTITIONS)
+
+class LookupPartitions(NamedTuple):
+    """A lookup's rows split by the hash of its key column into partitions on disk"""
+    key: str
+    kind: str
+    schema: pd.DataFrame
+    parts: list
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+
+def partition_lookup(lookup: Lookup, key: str, spill_dir: str = None) -> LookupPartitions:
+    """Split a lookup by the hash of its key column, one chunk in memory at a time"""
+    parts = [SpilledFrame(spill_dir) for _ in range(partition_count(lookup))]
+    kind = schema = None
+    try:
+        for chunk in _lookup_chunks(lookup):
+            if schema is None:
+                schema = chunk.iloc[:0]
+            kind = kind or _key_kind(chunk[key])
+            for part, rows in _split_partitions(chunk, key, len(parts), False):
+                parts[part].append(rows)
+    except BaseException:
+        for part in parts:
+            part.close()
+        raise
+    if schema is None:
+        schema = pd.DataFrame(columns=list(lookup_columns(lookup)))
+    return LookupPartitions(key, kind, schema, parts)
+
+def prepare_lookup(lookup: Lookup, key: str, columns):
+    """
+    What a join to a lookup needs before it sees the rows it joins, so it can be built
+    alongside reading them: the hash index of a small lookup, or a large one split into
+    partitions on disk. columns are the (cleaned) columns of the frame it is joined to.
+    """
+    right_key = resolve_keys(columns, lookup, key)[1]
+    if is_broadcast(lookup):
+        return lookup_index(lookup, right_key)
+    return partition_lookup(lookup, right_key)
+
+def partitioned_join(left_chunks, lookup: Lookup, key: str, how: str, spill_dir: str = None,
+                     right: LookupPartitions = None):
+    """
+    Grace hash join of a stream of chunks to a lookup too large to index whole. Both
+    sides are split by key hash into partitions on disk, and each partition is joined
+    with an index of its own lookup rows. Memory holds one partition's index rather
+    than the lookup's. Yields one joined chunk per input chunk, in input order.
+    right, if given, is the lookup already partitioned on the join's key (see prepare_lookup);
+    the join takes it over and removes it.
+    """
+    partitions = len(right.parts) if right is not None else partition_count(lookup)
+    left_parts = [SpilledFrame(spill_dir) for _ in range(partitions)]
+    outputs = [SpilledFrame(spill_dir) for _ in range(partitions)]
+    right_parts = right.parts if right is not None else []
+    try:
+        left_key = right_key = left_kind = None
+        empty = None
+        # Input chunk of each left block, per partition; then (partition, offset, rows) of each chunk's output
+        chunk_ids = [[] for _ in range(partitions)]
+        pieces = []
+        row = 0
+        for chunk in left_chunks:
+            if left_key is None:
+                left_key, right_key = resolve_keys(chunk.columns, lookup, key)
+                empty = chunk.iloc[:0]
+            chunk = chunk.copy(deep=False)
+            chunk.index = pd.RangeIndex(len(chunk))
+            chunk[_ROW] = np.arange(row, row + len(chunk))
+            row += len(chunk)
+            left_kind = left_kind or _key_kind(chunk[left_key])
+            for part, rows in _split_partitions(chunk, left_key, partitions, how == "left"):
+                left_parts[part].append(rows)
+                chunk_ids[part].append(len(pieces))
+            pieces.append([])
+        if left_key is None:
+            return
+
+        if right is None or right.key != right_key:
+            if right is not None:
+                right.close()
+            right = partition_lookup(lookup, right_key, spill_dir)
+            right_parts = right.parts
+        right_schema = right.schema
+        # Keys of different kinds hash apart, so a mismatch would otherwise match nothing
+        _check_kinds(left_kind, right.kind, left_key)
+
+        with timed("join", "partitioned", rows_in=row) as record:
+            for part in range(partitions):
+                if not len(left_parts[part]):
+                    continue
+                blocks = list(right_parts[part].iter_blocks())
+                table = pd.concat(blocks, ignore_index=True) if blocks else right_schema
+                index = HashIndex(table, right_key)
+                for block, chunk_id in zip(left_parts[part].iter_blocks(), chunk_ids[part]):
+                    joined = _join_block(block, left_key, index, how, lookup.name)
+                    if len(joined):
+                        pieces[chunk_id].append((part, len(outputs[part]), len(joined)))
+                        outputs[part].append(joined)
+                left_parts[part].close()
+                right_parts[part].close()
+            record["rows_out"] = sum(len(output) for output in outputs)
+
+        emitted = False
+        for chunk_pieces in pieces:
+            if not chunk_pieces:
+                continue
+            # Each piece holds rows of this chunk in order; a stable sort interleaves them back
+            joined = pd.concat([outputs[part].slice(offset, rows) for part, offset, rows in chunk_pieces])
+            joined = joined.sort_values(_ROW, kind="mergesort").drop(columns=[_ROW])
+            joined.index = pd.RangeIndex(len(joined))
+            emitted = True
+            yield joined
+        if not emitted:
+            # No rows: still yield the columns
+            yield _join_block(empty, left_key, HashIndex(right_schema, right_key), how, lookup.name)
+    finally:
+        for spilled in left_parts + right_parts + outputs:
+            spilled.close()
+
+def join_frame(df: pd.DataFrame, lookup: Lookup, key: str, how: str, prepared=None) -> pd.DataFrame:
+    """
+    Join a frame to a lookup: broadcast to a cached index when small, partitioned when not.
+    prepared is prepare_lookup's result for this join, if it was built ahead.
+    """
+    if is_broadcast(lookup):
+        left_key, right_key = resolve_keys(df.columns, lookup, key)
+        index = prepared if isinstance(prepared, HashIndex) and prepared.key == right_key \
+            else lookup_index(lookup, right_key)
+        return _join_block(df, left_key, index, how, lookup.name)
+    chunks = [df.iloc[start:start + STREAM_CHUNK_ROWS] for start in range(0, len(df), STREAM_CHUNK_ROWS)] or [df]
+    right = prepared if isinstance(prepared, LookupPartitions) else None
+    return pd.concat(partitioned_join(chunks, lookup, key, how, right=right), ignore_index=True)
+
+def _join_each(chunks, lookup: Lookup, key: str, how: str):
+    for chunk in chunks:
+        yield join_frame(chunk, lookup, key, how)
+
+def join_chunks(chunks, stage: Stage, spill_dir: str = None):
+    """Apply a joining stage to a stream of chunks: broadcast joins per chunk, partitioned ones over the stream"""
+    for op in stage.ops:
+        table, key, how, lookup = (*op.params, None)[:4]
+        if lookup is None:
+            raise ValueError(f"No lookup table uploaded for {table}")
+        if is_broadcast(lookup):
+            chunks = _join_each(chunks, lookup, key, how)
+        else:
+            chunks = partitioned_join(chunks, lookup, key, how, spill_dir)
+    return chunks
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Step timings are aggregated into Prometheus histograms served on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# tracemalloc makes every allocation slower, so peak memory is only traced on request.
+# Peaks are process-wide: concurrent requests inflate each other's numbers.
+METRICS_TRACE_MEMORY = os.getenv("METRICS_TRACE_MEMORY", "false").lower() in ("1", "true", "yes")
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+MEMORY_BUCKETS = tuple(1024 ** 2 * 2 ** i for i in range(13))  # 1 MB .. 4 GB
+
+# Records of the current request, when one is collecting them (see collect_timings)
+_current_timings = contextvars.ContextVar("timings", default=None)
+
+class Histogram:
+    """Thread-safe labelled histogram rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, buckets: tuple, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            label_text = _format_labels(self.labelnames, labels)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]}")
+        return lines
+
+class Counter:
+    """Thread-safe labelled counter rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{{{_format_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+STEP_SECONDS = Histogram("etl_step_duration_seconds", "Wall time of pipeline steps", DURATION_BUCKETS, ("kind", "name"))
+STEP_MEMORY = Histogram("etl_step_memory_peak_bytes", "Peak traced allocation during pipeline steps", MEMORY_BUCKETS, ("kind", "name"))
+STEP_ROWS = Counter("etl_step_rows_total", "Rows entering and leaving pipeline steps", ("kind", "name", "direction"))
+REQUEST_SECONDS = Histogram("etl_http_request_duration_seconds", "HTTP request latency", DURATION_BUCKETS, ("method", "route", "status"))
+FALLBACKS = Counter("etl_fallbacks_total", "Fast paths abandoned for the plain one", ("kind", "reason"))
+
+_REGISTRY = (STEP_SECONDS, STEP_MEMORY, STEP_ROWS, REQUEST_SECONDS, FALLBACKS)
+
+if METRICS_TRACE_MEMORY:
+    tracemalloc.start()
+
+def collect_timings() -> list:
+    """Start collecting step records for the current request or job; returns the list they go into"""
+    timings = []
+    _current_timings.set(timings)
+    return timings
+
+def observe(record: dict):
+    """Add a finished step record to the aggregated metrics"""
+    if not METRICS_ENABLED:
+        return
+    labels = (record["kind"], record["name"])
+    STEP_SECONDS.observe(labels, record["seconds"])
+    if record.get("memory_peak_bytes") is not None:
+        STEP_MEMORY.observe(labels, record["memory_peak_bytes"])
+    if record.get("rows_in") is not None:
+        STEP_ROWS.inc(labels + ("in",), record["rows_in"])
+    if record.get("rows_out") is not None:
+        STEP_ROWS.inc(labels + ("out",), record["rows_out"])
+
+@contextmanager
+def timed(kind: str, name: str, rows_in: int = None, trace_memory: bool = True):
+    """
+    Time a pipeline step. Yields the step record, so the caller can set rows_out.
+    The record is aggregated into /metrics and added to the current request's timings.
+    """
+    timings = _current_timings.get()
+    if not METRICS_ENABLED and timings is None:
+        yield {}
+        return
+
+    record = {"kind": kind, "name": name, "seconds": None, "rows_in": rows_in, "rows_out": None, "memory_peak_bytes": None}
+    tracing = trace_memory and tracemalloc.is_tracing()
+    if tracing:
+        memory_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        if tracing:
+            record["memory_peak_bytes"] = max(tracemalloc.get_traced_memory()[1] - memory_start, 0)
+        observe(record)
+        if timings is not None:
+            timings.append(record)
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        REQUEST_SECONDS.observe((method, route, str(status)), seconds)
+
+def count_fallback(kind: str, reason: str):
+    """Count a fast path (e.g. a pushed-down read) that was abandoned for the plain one"""
+    if METRICS_ENABLED:
+        FALLBACKS.inc((kind, reason))
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,24 @@
+import asyncio
 import os
 import json
+import random
 import re
+import weakref
+from .ai_cache import cached_completion, cached_completion_async, normalize_text
+from .metrics import timed
+
+# Async calls: at most AI_MAX_CONCURRENCY in flight per event loop, each bounded by a
+# timeout and retried with exponential backoff on timeouts, rate limits and server errors
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_CALL_TIMEOUT_SECONDS = float(os.getenv("AI_CALL_TIMEOUT_SECONDS", "20"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+AI_RETRY_BACKOFF_SECONDS = float(os.getenv("AI_RETRY_BACKOFF_SECONDS", "0.5"))
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
 
 # Don't initialize OpenAI client at import time
 _openai_client = None
+_async_openai_client = None
+_semaphores = weakref.WeakKeyDictionary()
 
 def get_openai_client():
     """Lazy initialization of OpenAI client"""
@@ -16,13 +31,143 @@ def get_openai_client():
         
         try:
             import openai
-            _openai_client = openai.OpenAI(api_key=api_key)
+            # OPENAI_BASE_URL, when set, is picked up by the client (e.g. a local mock server)
+            _openai_client = openai.OpenAI(api_key=api_key, timeout=AI_CALL_TIMEOUT_SECONDS, max_retries=AI_MAX_RETRIES)
         except Exception as e:
             print(f"Failed to initialize OpenAI client: {e}")
             return None
     
     return _openai_client
 
+def set_openai_client(client):
+    """Use the given client (e.g. a local stub) instead of creating one from OPENAI_API_KEY"""
+    global _openai_client
+    _openai_client = client
+
+def get_async_openai_client():
+    """Lazy initialization of the asyncio OpenAI client"""
+    global _async_openai_client
+
+    if _async_openai_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            return None
+
+        try:
+            import openai
+            # Timeouts and retries are applied per call in _create_completion
+            _async_openai_client = openai.AsyncOpenAI(api_key=api_key, max_retries=0)
+        except Exception as e:
+            print(f"Failed to initialize async OpenAI client: {e}")
+            return None
+
+    return _async_openai_client
+
+def set_async_openai_client(client):
+    """Use the given async client instead of creating one from OPENAI_API_KEY"""
+    global _async_openai_client
+    _async_openai_client = client
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return semaphore
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES:
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+async def _create_completion(client, **params) -> str:
+    """One chat completion with the concurrency limit, a timeout and retries"""
+    for attempt in range(AI_MAX_RETRIES + 1):
+        try:
+            async with _get_semaphore():
+                response = await asyncio.wait_for(client.chat.completions.create(**params), AI_CALL_TIMEOUT_SECONDS)
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            if attempt == AI_MAX_RETRIES or not _is_retryable(e):
+                raise
+            # Full jitter, so callers that failed together do not retry together
+            delay = AI_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.random()
+            print(f"OpenAI call failed ({e!r}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+def _complete_async(client, **params):
+    return cached_completion_async(lambda **p: _create_completion(client, **p), **params)
+
+def _smart_fix_request(error_message: str) -> dict:
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You are an ETL assistant."},
+            {"role": "user", "content": f"Fix suggestion for error: {normalize_text(error_message)}"}
+        ],
+        "max_tokens": 100
+    }
+
+def _config_request(prompt: str) -> dict:
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system", 
+                "content": """You are an ETL workflow parser. Convert natural language descriptions 
+                into structured ETL workflow configuration. Return a JSON object with:
+                {
+                    "workflow": {
+                        "name": "descriptive name",
+                        "description": "original prompt",
+                        "steps": [
+                            {"id": 1, "description": "step description", "action": "extract|transform|load"}
+                        ],
+                        "created": "ISO timestamp",
+                        "version": "1.0"
+                    }
+                }
+                Actions should be: extract (read/import data), transform (clean/calculate/filter), load (save/export)"""
+            },
+            {"role": "user", "content": f"Parse this ETL workflow: {normalize_text(prompt)}"}
+        ],
+        "max_tokens": 500
+    }
+
+def _parse_config_response(ai_response: str, prompt: str, format: str) -> str:
+    # Try to parse and validate JSON response
+    try:
+        parsed = json.loads(ai_response)
+        return json.dumps(parsed, indent=2) if format == "json" else ai_response
+    except json.JSONDecodeError:
+        # Fallback to regex parsing
+        print("AI response was not valid JSON, falling back to regex")
+        from .etl_parser import generate_config
+        return generate_config(prompt, format)
+
+def _suggestions_request(columns: list, prompt: str) -> dict:
+    columns_str = ", ".join(normalize_text(col) for col in columns)
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a data transformation expert. Suggest pandas operations based on column names and user requests."
+            },
+            {
+                "role": "user",
+                "content": f"Available columns: {columns_str}\nUser request: {normalize_text(prompt)}\nSuggest specific transformations:"
+            }
+        ],
+        "max_tokens": 200
+    }
+
 def get_smart_fix(error_message: str) -> str:
     """Get smart fix suggestion using OpenAI"""
     client = get_openai_client()
@@ -31,18 +176,24 @@ def get_smart_fix(error_message: str) -> str:
         return "OpenAI not available. Please check your API key configuration."
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an ETL assistant."},
-                {"role": "user", "content": f"Fix suggestion for error: {error_message}"}
-            ],
-            max_tokens=100
-        )
-        return response.choices[0].message.content.strip()
+        with timed("openai", "smart_fix", trace_memory=False):
+            return cached_completion(client, **_smart_fix_request(error_message))
     except Exception as e:
         return f"Failed to generate fix: {e}"
 
+async def get_smart_fix_async(error_message: str) -> str:
+    """Async variant of get_smart_fix"""
+    client = get_async_openai_client()
+
+    if not client:
+        return "OpenAI not available. Please check your API key configuration."
+
+    try:
+        with timed("openai", "smart_fix", trace_memory=False):
+            return await _complete_async(client, **_smart_fix_request(error_message))
+    except Exception as e:
+        return f"Failed to generate fix: {e!r}"
+
 def generate_config_with_ai(prompt: str, format: str = "json") -> str:
     """Use OpenAI to generate ETL configuration from natural language"""
     client = get_openai_client()
@@ -53,49 +204,33 @@ def generate_config_with_ai(prompt: str, format: str = "json") -> str:
         return generate_config(prompt, format)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": """You are an ETL workflow parser. Convert natural language descriptions 
-                    into structured ETL workflow configuration. Return a JSON object with:
-                    {
-                        "workflow": {
-                            "name": "descriptive name",
-                            "description": "original prompt",
-                            "steps": [
-                                {"id": 1, "description": "step description", "action": "extract|transform|load"}
-                            ],
-                            "created": "ISO timestamp",
-                            "version": "1.0"
-                        }
-                    }
-                    Actions should be: extract (read/import data), transform (clean/calculate/filter), load (save/export)"""
-                },
-                {"role": "user", "content": f"Parse this ETL workflow: {prompt}"}
-            ],
-            max_tokens=500
-        )
-        
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Try to parse and validate JSON response
-        try:
-            parsed = json.loads(ai_response)
-            return json.dumps(parsed, indent=2) if format == "json" else ai_response
-        except json.JSONDecodeError:
-            # Fallback to regex parsing
-            print("AI response was not valid JSON, falling back to regex")
-            from .etl_parser import generate_config
-            return generate_config(prompt, format)
-            
+        with timed("openai", "generate_config", trace_memory=False):
+            ai_response = cached_completion(client, **_config_request(prompt))
+        return _parse_config_response(ai_response, prompt, format)
     except Exception as e:
         print(f"OpenAI API error: {e}, falling back to regex parsing")
         # Fallback to regex-based parsing
         from .etl_parser import generate_config
         return generate_config(prompt, format)
 
+async def generate_config_with_ai_async(prompt: str, format: str = "json") -> str:
+    """Async variant of generate_config_with_ai"""
+    client = get_async_openai_client()
+
+    if not client:
+        print("OpenAI not available, falling back to regex parsing")
+        from .etl_parser import generate_config
+        return generate_config(prompt, format)
+
+    try:
+        with timed("openai", "generate_config", trace_memory=False):
+            ai_response = await _complete_async(client, **_config_request(prompt))
+        return _parse_config_response(ai_response, prompt, format)
+    except Exception as e:
+        print(f"OpenAI API error: {e!r}, falling back to regex parsing")
+        from .etl_parser import generate_config
+        return generate_config(prompt, format)
+
 def get_transformation_suggestions(columns: list, prompt: str) -> str:
     """Get AI suggestions for data transformations"""
     client = get_openai_client()
@@ -104,25 +239,24 @@ def get_transformation_suggestions(columns: list, prompt: str) -> str:
         return "OpenAI not configured. Using rule-based transformations."
     
     try:
-        columns_str = ", ".join(columns)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a data transformation expert. Suggest pandas operations based on column names and user requests."
-                },
-                {
-                    "role": "user",
-                    "content": f"Available columns: {columns_str}\nUser request: {prompt}\nSuggest specific transformations:"
-                }
-            ],
-            max_tokens=200
-        )
-        return response.choices[0].message.content.strip()
+        with timed("openai", "suggestions", trace_memory=False):
+            return cached_completion(client, **_suggestions_request(columns, prompt))
     except Exception as e:
         return f"AI suggestion error: {e}"
 
+async def get_transformation_suggestions_async(columns: list, prompt: str) -> str:
+    """Async variant of get_transformation_suggestions"""
+    client = get_async_openai_client()
+
+    if not client:
+        return "OpenAI not configured. Using rule-based transformations."
+
+    try:
+        with timed("openai", "suggestions", trace_memory=False):
+            return await _complete_async(client, **_suggestions_request(columns, prompt))
+    except Exception as e:
+        return f"AI suggestion error: {e!r}"
+
 def is_openai_available() -> bool:
     """Check if OpenAI is available and configured"""
     return get_openai_client() is not None
\ No newline at end of file
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+import pandas as pd
+from .plan import Stage
+from .streaming import ROW_LOCAL_STAGES, _bind_stage, _split_at_mean_fill, partial_aggregate, merge_partials
+from .transformer import detect_numeric_columns, resolve_groupby, run_stages
+
+# Row-local stages of large frames run on row partitions across a process pool
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+# Smaller frames run serially: process startup and copying would outweigh the gain
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "250000"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Lazy initialization of the partition worker pool"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn avoids forking a process that already runs server threads
+            context = multiprocessing.get_context("spawn")
+            _pool = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS, mp_context=context)
+    return _pool
+
+def shutdown_parallel():
+    """Stop the partition worker pool"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _export(obj) -> tuple:
+    """
+    Write obj to a new shared memory block: a protocol 5 pickle whose array buffers
+    are stored out-of-band after it. Returns a small picklable handle to the block.
+    """
+    buffers = []
+    payload = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+    block = shared_memory.SharedMemory(create=True, size=max(len(payload) + sum(view.nbytes for view in views), 1))
+    try:
+        block.buf[:len(payload)] = payload
+        position = len(payload)
+        for view in views:
+            block.buf[position:position + view.nbytes] = view
+            position += view.nbytes
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    name = block.name
+    block.close()
+    return name, len(payload), [view.nbytes for view in views]
+
+def _import(handle: tuple, unlink: bool = False):
+    """
+    Rebuild an exported object. Buffers are copied out of the block with one memcpy each:
+    results can share buffers with their input (group keys, untouched columns), and
+    views would keep the block mapped for as long as any of them lives.
+    """
+    name, payload_size, sizes = handle
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        buffers = []
+        position = payload_size
+        for size in sizes:
+            buffers.append(bytearray(block.buf[position:position + size]))
+            position += size
+        return pickle.loads(bytes(block.buf[:payload_size]), buffers=buffers)
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+
+def _unlink(handle: tuple):
+    """Remove an exported block if it still exists"""
+    try:
+        block = shared_memory.SharedMemory(name=handle[0])
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+def _partition_means(handle: tuple, prefix: tuple) -> tuple:
+    """Worker: column sums and counts of a partition as it looks at a mean-based fill"""
+    df = run_stages(_import(handle), prefix)
+    sums = {col: df[col].sum() for col in detect_numeric_columns(df)}
+    counts = {col: df[col].count() for col in sums}
+    return sums, counts
+
+def _transform_partition(handle: tuple, stages: tuple, grouping: Stage = None) -> tuple:
+    """
+    Worker: run row-local stages on a partition. With a grouping stage that applies,
+    returns ("partial", partial aggregate, spec); otherwise ("rows", handle of the result).
+    """
+    df = run_stages(_import(handle), stages)
+    if grouping is not None:
+        spec = resolve_groupby(df.columns, *grouping.ops[0].params)
+        if spec is not None:
+            return "partial", partial_aggregate(df, spec), spec
+    return "rows", _export(df), None
+
+def _concat_partitions(parts: list) -> pd.DataFrame:
+    """Concatenate partition results in order, keeping categoricals whose categories differ per partition"""
+    parts = [part.copy(deep=False) for part in parts]
+    for col in parts[0].columns:
+        if not all(isinstance(part[col].dtype, pd.CategoricalDtype) for part in parts):
+            continue
+        categories = parts[0][col].cat.categories
+        if all(part[col].cat.categories.equals(categories) for part in parts):
+            continue
+        union = pd.api.types.union_categoricals([part[col] for part in parts], sort_categories=True).categories
+        for part in parts:
+            part[col] = part[col].cat.set_categories(union)
+    return pd.concat(parts)
+
+def partitioned_run_length(stages: tuple, start: int, rows: int) -> int:
+    """
+    Number of stages from stages[start] that run_partitioned should take: a run of
+    row-local stages, plus a directly following grouping stage. 0 means run serially.
+    """
+    if rows < PARALLEL_MIN_ROWS or PARALLEL_WORKERS < 2:
+        return 0
+
+    end = start
+    while end < len(stages) and stages[end].name in ROW_LOCAL_STAGES:
+        end += 1
+    if end < len(stages) and stages[end].name == "grouping":
+        end += 1
+    # A lone grouping stage is not worth a round trip of the whole frame
+    return end - start if end - start > 1 or stages[start].name != "grouping" else 0
+
+def run_partitioned(df: pd.DataFrame, stages: tuple) -> pd.DataFrame:
+    """
+    Run row-local stages (optionally ending with a grouping stage) on row partitions in
+    the worker pool. Partitions travel through shared memory and are recombined in
+    order; grouping merges per-partition partial aggregates.
+    Matches run_stages on the whole frame.
+    """
+    grouping = stages[-1] if stages[-1].name == "grouping" else None
+    row_local = stages[:-1] if grouping is not None else stages
+
+    # Pin what must be identical across partitions: the timestamp and global means
+    now = datetime.now()
+    pool = _get_pool()
+    partitions = max(min(PARALLEL_WORKERS, len(df) // max(PARALLEL_MIN_ROWS // PARALLEL_WORKERS, 1)), 1)
+    bounds = [len(df) * i // partitions for i in range(partitions + 1)]
+    handles = []
+    try:
+        for i in range(partitions):
+            handles.append(_export(df.iloc[bounds[i]:bounds[i + 1]]))
+
+        means = None
+        prefix = _split_at_mean_fill(row_local)
+        if prefix is not None:
+            sums, counts = {}, {}
+            for part_sums, part_counts in pool.map(_partition_means, handles, [prefix] * len(handles)):
+                for col in part_sums:
+                    sums[col] = sums.get(col, 0) + part_sums[col]
+                    counts[col] = counts.get(col, 0) + part_counts[col]
+            means = {col: sums[col] / counts[col] if counts[col] else float("nan") for col in sums}
+        row_local = tuple(_bind_stage(stage, now, means) for stage in row_local)
+
+        futures = [pool.submit(_transform_partition, handle, row_local, grouping) for handle in handles]
+        results = []
+        parts = []
+        try:
+            for future in futures:
+                results.append(future.result())
+            for kind, result, _ in results:
+                if kind == "rows":
+                    parts.append(_import(result, unlink=True))
+        finally:
+            # Result blocks not imported yet, e.g. when another partition failed
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    kind, result, _ = future.result()
+                    if kind == "rows":
+                        _unlink(result)
+    finally:
+        for handle in handles:
+            _unlink(handle)
+
+    if results and results[0][0] == "partial":
+        return merge_partials([partial for _, partial, _ in results], results[0][2])
+    return _concat_partitions(parts)
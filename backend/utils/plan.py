@@ -0,0 +1,151 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+# Stages run in this order; it mirrors the original apply_* call order in transform_data.
+# Joins come first, so every later stage can use the columns a lookup table adds.
+STAGE_ORDER = ("joining", "math", "cleaning", "filtering", "columns", "dates", "grouping", "sorting")
+
+class Op(NamedTuple):
+    """A single typed transformation operation"""
+    kind: str
+    params: tuple = ()
+
+class Stage(NamedTuple):
+    """An ordered group of operations that used to be one apply_* function"""
+    name: str
+    ops: tuple
+
+    @property
+    def is_noop(self) -> bool:
+        return not self.ops
+
+class Plan(NamedTuple):
+    """Compiled, immutable transformation plan for a prompt"""
+    prompt: str
+    stages: tuple
+
+    def stage(self, name: str) -> Stage:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    @property
+    def active_stages(self) -> tuple:
+        return tuple(stage for stage in self.stages if not stage.is_noop)
+
+    @property
+    def is_noop(self) -> bool:
+        return not self.active_stages
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a prompt the way every stage reads it"""
+    return (prompt or "").lower().strip()
+
+def _compile_joining(prompt: str) -> tuple:
+    ops = []
+    # "join orders with departments on dept_id" keeps matched rows; "enrich" and "left join" keep all
+    for match in re.finditer(r"\b(left join|inner join|join|enrich)\b(?: \w+)? with (\w+)(?: on (\w+))?", prompt):
+        verb, table, key = match.groups()
+        ops.append(Op("join", (table, key, "inner" if verb in ("join", "inner join") else "left")))
+    return tuple(ops)
+
+def _compile_math(prompt: str) -> tuple:
+    ops = []
+    if any(word in prompt for word in ["total", "sum", "add up", "calculate sum"]):
+        ops.append(Op("total"))
+    if any(word in prompt for word in ["average", "mean", "avg"]):
+        ops.append(Op("average"))
+    if re.search(r"revenue|total.*value|amount", prompt):
+        ops.append(Op("revenue"))
+    calc_match = re.search(r"calculate (\w+)\s*=\s*(\w+)\s*([-+*/])\s*(\w+)", prompt)
+    if calc_match:
+        ops.append(Op("calculate", calc_match.groups()))
+    return tuple(ops)
+
+def _compile_cleaning(prompt: str) -> tuple:
+    ops = []
+    if any(word in prompt for word in ["clean", "standardize", "format", "proper case"]):
+        ops.append(Op("clean_strings"))
+    if any(phrase in prompt for phrase in ["remove null", "drop null", "exclude null", "filter null"]):
+        ops.append(Op("drop_nulls"))
+    if any(phrase in prompt for phrase in ["fill null", "replace null", "handle null"]):
+        ops.append(Op("fill_nulls", ("mean" in prompt,)))
+    case_match = re.search(r"(uppercase|lowercase|upper case|lower case) (\w+)", prompt)
+    if case_match:
+        case_type, col_name = case_match.groups()
+        ops.append(Op("change_case", ("upper" in case_type, col_name)))
+    return tuple(ops)
+
+def _compile_filtering(prompt: str) -> tuple:
+    ops = []
+    filter_match = re.search(r"filter (\w+)\s*([<>=!]+)\s*([\w\d.]+)", prompt)
+    if filter_match:
+        ops.append(Op("filter_value", filter_match.groups()))
+    if any(phrase in prompt for phrase in ["active only", "filter active", "active customers", "active records"]):
+        ops.append(Op("filter_active"))
+    return tuple(ops)
+
+def _compile_columns(prompt: str) -> tuple:
+    ops = []
+    rename_match = re.search(r"rename (\w+) to (\w+)", prompt)
+    if rename_match:
+        ops.append(Op("rename", rename_match.groups()))
+    if any(phrase in prompt for phrase in ["full name", "combine names", "full_name"]):
+        ops.append(Op("full_name"))
+    if any(word in prompt for word in ["category", "classify", "group into"]):
+        if "performance" in prompt:
+            ops.append(Op("performance_category"))
+        if any(word in prompt for word in ["inventory", "stock", "low stock"]):
+            ops.append(Op("stock_status"))
+    return tuple(ops)
+
+def _compile_dates(prompt: str) -> tuple:
+    ops = []
+    date_match = re.search(r"convert (\w+) to datetime", prompt)
+    if date_match:
+        ops.append(Op("to_datetime", (date_match.group(1),)))
+    if any(phrase in prompt for phrase in ["add timestamp", "current time", "processing time"]):
+        ops.append(Op("add_timestamp"))
+    return tuple(ops)
+
+def _compile_grouping(prompt: str) -> tuple:
+    group_match = re.search(r"group by (\w+)(?:\s+and\s+)?(?:(sum|mean|count|max|min|average)\s+(\w+))?", prompt)
+    if group_match:
+        return (Op("groupby", group_match.groups()),)
+    return ()
+
+def _compile_sorting(prompt: str) -> tuple:
+    sort_match = re.search(r"sort by (\w+)(?:\s+(asc|desc|ascending|descending))?", prompt)
+    if sort_match:
+        col_name, order = sort_match.groups()
+        ascending = True if not order or order in ['asc', 'ascending'] else False
+        return (Op("sort", (col_name, ascending)),)
+    return ()
+
+_STAGE_COMPILERS = {
+    "joining": _compile_joining,
+    "math": _compile_math,
+    "cleaning": _compile_cleaning,
+    "filtering": _compile_filtering,
+    "columns": _compile_columns,
+    "dates": _compile_dates,
+    "grouping": _compile_grouping,
+    "sorting": _compile_sorting,
+}
+
+@lru_cache(maxsize=256)
+def _compile(normalized_prompt: str) -> Plan:
+    stages = tuple(
+        Stage(name, _STAGE_COMPILERS[name](normalized_prompt))
+        for name in STAGE_ORDER
+    )
+    return Plan(normalized_prompt, stages)
+
+def compile_plan(prompt: str) -> Plan:
+    """
+    Compile a natural-language prompt into an ordered transformation plan.
+    Plans are cached by normalized prompt, so repeated prompts are parsed once.
+    """
+    return _compile(normalize_prompt(prompt))
@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple
+import pandas as pd
+from .plan import Plan
+from .streaming import ROW_LOCAL_STAGES
+from .transformer import clean_column_names, run_stages, top_rows
+from .excel import SheetRange, is_excel, is_converted, read_excel_file
+from .compact import compact_frame, COMPACT_INGEST
+from .result_store import PREVIEW_ROWS
+
+# Preview mode runs the pipeline on at most this many rows of an upload
+PREVIEW_SAMPLE_ROWS = int(os.getenv("PREVIEW_SAMPLE_ROWS", "5000"))
+# Uploads of previews are kept for an explicit full run for this long
+PREVIEW_UPLOAD_TTL_SECONDS = float(os.getenv("PREVIEW_UPLOAD_TTL_SECONDS", "900"))
+PREVIEW_UPLOAD_MAX_ENTRIES = int(os.getenv("PREVIEW_UPLOAD_MAX_ENTRIES", "16"))
+
+_uploads = OrderedDict()
+_lock = threading.Lock()
+
+class Sample(NamedTuple):
+    """
+    The rows a preview runs on. method is "complete" (every row of the upload),
+    "head" (its first rows) or "sample" (random rows, in upload order).
+    total_rows is None when only the head was read.
+    """
+    df: pd.DataFrame
+    method: str
+    total_rows: int = None
+
+def sample_frame(df: pd.DataFrame, rows: int = PREVIEW_SAMPLE_ROWS) -> Sample:
+    """A random sample of an already parsed frame; seeded, so repeated previews agree"""
+    if len(df) <= rows:
+        return Sample(df, "complete", len(df))
+    return Sample(df.sample(rows, random_state=0).sort_index(), "sample", len(df))
+
+def read_head(path: str, filename: str, digest: str = None, sheet_range: SheetRange = None,
+              rows: int = PREVIEW_SAMPLE_ROWS) -> Sample:
+    """Parse only the first rows of an upload (one more than needed, to tell if there are more)"""
+    if is_excel(filename):
+        sheet_range = sheet_range or SheetRange()
+        limit = rows + 1 if sheet_range.max_rows is None else min(sheet_range.max_rows, rows + 1)
+        # Without a converted sheet, skip the conversion: it would parse the whole workbook
+        cached = digest if is_converted(digest, sheet_range.sheet) else None
+        df = read_excel_file(path, filename, cached, sheet_range._replace(max_rows=limit))
+    else:
+        df = pd.read_csv(path, nrows=rows + 1)
+    if COMPACT_INGEST:
+        df = compact_frame(df)
+    if len(df) > rows:
+        return Sample(df.iloc[:rows], "head")
+    return Sample(df, "complete", len(df))
+
+def preview_transform(df: pd.DataFrame, plan: Plan, limit: int = PREVIEW_ROWS) -> tuple:
+    """
+    Run a plan for its first limit rows: like execute_plan, but a final sort selects the
+    top rows with nlargest/nsmallest instead of ordering the whole frame.
+    Returns (first rows, row count of the complete result).
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(), 0
+
+    stages = plan.active_stages
+    sort = stages[-1] if stages and stages[-1].name == "sorting" else None
+    try:
+        result = run_stages(clean_column_names(df.copy(deep=False)), stages[:-1] if sort else stages)
+        rows = len(result)
+        if sort is not None:
+            result = top_rows(result, *sort.ops[0].params, limit)
+        result = result.head(limit)
+    except Exception as e:
+        print(f"Error in preview transformation: {e}")
+        result, rows = df.head(limit), len(df)  # transform_data returns the input when it fails
+    return result.reset_index(drop=True), rows
+
+def preview_accuracy(plan: Plan, sample: Sample, rows: int, limit: int = PREVIEW_ROWS) -> dict:
+    """
+    Whether a preview shows what the full run would: exact is true when its rows are the
+    first rows of the full result; grouped results are marked exact or approximate.
+    """
+    stages = plan.active_stages
+    complete = sample.method == "complete"
+    # Row-local plans produce their first rows from the first rows of the input,
+    # unless a fill uses means over the whole column
+    row_local = all(stage.name in ROW_LOCAL_STAGES for stage in stages) and not any(
+        op.kind == "fill_nulls" and op.params[0] for stage in stages for op in stage.ops
+    )
+    exact = complete or (sample.method == "head" and row_local and rows >= limit)
+    grouped = any(stage.name == "grouping" for stage in stages)
+    return {
+        "exact": exact,
+        "grouping": ("exact" if complete else "approximate") if grouped else None,
+        "transformed_rows_exact": complete,
+    }
+
+def _evict_expired(now: float):
+    """Drop expired uploads and their files; caller must hold the lock"""
+    expired = [preview_id for preview_id, entry in _uploads.items() if entry["expires_at"] <= now]
+    for preview_id in expired:
+        _remove(_uploads.pop(preview_id))
+
+def _remove(entry: dict):
+    for path in (entry["path"], *(lookup.path for lookup in entry["lookups"])):
+        if os.path.exists(path):
+            os.remove(path)
+
+def retain_upload(path: str, filename: str, digest: str, sheet_range: SheetRange, prompt: str,
+                  target_format: str, preview_id: str = None, lookups: tuple = ()) -> str:
+    """Keep a preview's spooled upload and lookup tables for a later full run; returns its preview ID"""
+    preview_id = preview_id or uuid.uuid4().hex
+    now = time.monotonic()
+    with _lock:
+        _evict_expired(now)
+        _uploads[preview_id] = {
+            "path": path, "filename": filename, "digest": digest, "sheet_range": sheet_range,
+            "prompt": prompt, "target_format": target_format, "lookups": lookups,
+            "expires_at": now + PREVIEW_UPLOAD_TTL_SECONDS
+        }
+        # Oldest uploads go first once the store is full
+        while len(_uploads) > PREVIEW_UPLOAD_MAX_ENTRIES:
+            _remove(_uploads.popitem(last=False)[1])
+    return preview_id
+
+def claim_upload(preview_id: str):
+    """
+    Take a retained upload for its full run, or None if missing or expired.
+    The caller owns the file from then on.
+    """
+    with _lock:
+        _evict_expired(time.monotonic())
+        return _uploads.pop(preview_id, None)
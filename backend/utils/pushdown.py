@@ -0,0 +1,242 @@
+import os
+from typing import NamedTuple
+import pandas as pd
+from .metrics import count_fallback
+from .plan import Plan, Stage
+from .transformer import (
+    clean_column_names, run_stages,
+    DATE_WORDS, QUANTITY_WORDS, PRICE_WORDS, STATUS_WORD, FIRST_NAME_WORDS, LAST_NAME_WORDS,
+    PERFORMANCE_WORDS, STOCK_WORDS
+)
+
+# Read only the columns a prompt needs and apply its row filters while reading
+PUSHDOWN_ENABLED = os.getenv("PUSHDOWN_ENABLED", "true").lower() in ("1", "true", "yes")
+
+class Pushdown(NamedTuple):
+    """
+    What a prompt needs from an upload: the source columns to read (None for all) and
+    filtering ops that can run on each chunk as it is read. text_columns are filter
+    columns a cleaning op may rewrite first, so their filters only run early on numbers.
+    """
+    columns: tuple = None
+    filters: tuple = ()
+    text_columns: tuple = ()
+
+    @property
+    def is_noop(self) -> bool:
+        return self.columns is None and not self.filters
+
+def _column(name: str, deps: frozenset, source: str = None, certain: bool = True) -> dict:
+    return {"name": name, "source": source, "deps": deps, "certain": certain, "modified": False, "text": False}
+
+def _matches(current: list, words: tuple) -> list:
+    return [col for col in current if any(word in col["name"] for word in words)]
+
+def _first(current: list, words: tuple) -> tuple:
+    """
+    The column a kernel would pick (the first match), and whether that pick is certain:
+    columns added by kernels that check dtypes may not exist at run time.
+    """
+    matches = _matches(current, words)
+    if not matches:
+        return None, True
+    return matches[0], matches[0]["certain"]
+
+def _deps(columns: list) -> frozenset:
+    return frozenset().union(*(col["deps"] for col in columns))
+
+def _derive(current: list, name: str, deps: frozenset, certain: bool):
+    """Add a computed column, or overwrite an existing one as kernels do"""
+    for col in current:
+        if col["name"] == name:
+            col.update(deps=col["deps"] | deps, modified=True, source=None)
+            return
+    current.append(_column(name, deps, certain=certain))
+
+def plan_pushdown(plan: Plan, source_columns) -> Pushdown:
+    """
+    Simulate a plan on column names only, to find which source columns can affect its
+    result and which filters can run before the earlier stages.
+
+    Every transformed frame keeps all columns unless a grouping stage reduces it, so
+    columns are only pruned for plans with a grouping that is certain to apply. Ops that
+    pick the first matching column keep every match, so pruning cannot change the pick.
+    """
+    source_columns = list(source_columns)
+    if not all(isinstance(col, str) for col in source_columns):
+        return Pushdown()
+    cleaned = [col.strip().lower().replace(" ", "_") for col in source_columns]
+    if len(set(cleaned)) != len(cleaned):
+        return Pushdown()
+
+    current = [_column(name, frozenset([source]), source) for name, source in zip(cleaned, source_columns)]
+    all_sources = frozenset(source_columns)
+    reads = set()
+    needs_all = False
+    grouped = False
+    filled = False
+    filters = []
+    text_columns = []
+
+    for stage in plan.active_stages:
+        for op in stage.ops:
+            if op.kind == "join":
+                # Lookup columns are added after the upload's, so kernels still pick upload columns first
+                if op.params[1] is None:
+                    needs_all = True  # joined on whichever column the lookup shares
+                else:
+                    reads.update(_deps(_matches(current, (op.params[1],))))
+            elif op.kind in ("total", "average"):
+                _derive(current, "total_amount" if op.kind == "total" else "average_value", all_sources, False)
+            elif op.kind == "revenue":
+                _derive(current, "revenue", _deps(_matches(current, QUANTITY_WORDS) + _matches(current, PRICE_WORDS)), False)
+            elif op.kind == "calculate":
+                new_col, col1, _, col2 = op.params
+                _derive(current, new_col, _deps([col for col in current if col["name"] in (col1, col2)]), False)
+            elif op.kind == "clean_strings":
+                for col in current:
+                    col["text"] = True
+            elif op.kind == "change_case":
+                for col in _matches(current, (op.params[1],)):
+                    col["text"] = True
+            elif op.kind == "fill_nulls":
+                filled = True
+                for col in current:
+                    col["modified"] = True
+            elif op.kind == "drop_nulls":
+                # Rows with a null in any column are dropped
+                needs_all = True
+            elif op.kind in ("filter_value", "filter_active"):
+                words = (op.params[0],) if op.kind == "filter_value" else (STATUS_WORD,)
+                reads.update(_deps(_matches(current, words)))
+                col, certain = _first(current, words)
+                if col is not None and certain and col["source"] is not None and not col["modified"] and not filled \
+                        and not any(word in col["name"] for word in DATE_WORDS):
+                    filters.append(op)
+                    if col["text"]:
+                        text_columns.append(col["name"])
+            elif op.kind == "rename":
+                reads.update(_deps(_matches(current, (op.params[0],))))
+                col, certain = _first(current, (op.params[0],))
+                if not certain:
+                    needs_all = True
+                elif col is not None:
+                    col["name"] = op.params[1]
+            elif op.kind == "full_name":
+                first, last = _matches(current, FIRST_NAME_WORDS), _matches(current, LAST_NAME_WORDS)
+                certain = any(col["certain"] for col in first) and any(col["certain"] for col in last)
+                _derive(current, "full_name", _deps(first + last), certain)
+            elif op.kind == "performance_category":
+                _derive(current, "performance_category", _deps(_matches(current, PERFORMANCE_WORDS)), False)
+            elif op.kind == "stock_status":
+                _derive(current, "stock_status", _deps(_matches(current, STOCK_WORDS)), False)
+            elif op.kind == "to_datetime":
+                matches = _matches(current, (op.params[0],))
+                reads.update(_deps(matches))
+                for col in matches:
+                    col["modified"] = True
+            elif op.kind == "add_timestamp":
+                _derive(current, "processed_at", frozenset(), True)
+            elif op.kind == "groupby":
+                group_name, agg_func, agg_name = op.params
+                group, group_certain = _first(current, (group_name,))
+                agg, agg_certain = _first(current, (agg_name,)) if agg_func and agg_name else (None, True)
+                if group is None or (agg_func and agg_name and agg is None) or not (group_certain and agg_certain):
+                    # Without a grouping that surely applies, the result keeps every column
+                    needs_all = True
+                    continue
+                reads.update(_deps(_matches(current, (group_name,))))
+                if agg is not None:
+                    reads.update(_deps(_matches(current, (agg_name,))))
+                grouped = True
+                current = [group, _column("aggregate", frozenset())]
+            elif op.kind == "sort":
+                reads.update(_deps(_matches(current, (op.params[0],))))
+
+    columns = None
+    if grouped and not needs_all and len(reads) < len(source_columns):
+        columns = tuple(col for col in source_columns if col in reads)
+    return Pushdown(columns, tuple(filters), tuple(text_columns))
+
+def _compatible(a, b) -> bool:
+    """Whether chunks of these dtypes concatenate to the dtype a single read would infer"""
+    if a == b:
+        return True
+    numeric = (pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in (a, b))
+    return all(numeric)
+
+# Comparisons that give the same rows on raw text as on the categoricals compaction makes
+_EQUALITY_OPERATORS = ("=", "==", "eq", "!=", "<>", "ne")
+
+def _can_filter(chunk: pd.DataFrame, op, text_columns: tuple) -> bool:
+    """
+    Whether a filter keeps the same rows on this raw chunk as the transform would keep
+    later. Skipping one is always safe: the filtering stage runs again on what is read.
+    """
+    words = (op.params[0],) if op.kind == "filter_value" else (STATUS_WORD,)
+    matches = [col for col in chunk.columns if any(word in col for word in words)]
+    if not matches:
+        return False
+    series = chunk[matches[0]]
+    if op.kind == "filter_value" and pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        # The kernel skips a filter whose value is not a number, so it is not pushed either
+        try:
+            float(op.params[2])
+        except ValueError:
+            return False
+        return True
+    if matches[0] in text_columns or not pd.api.types.is_string_dtype(series):
+        return False
+    return op.kind == "filter_active" or op.params[1] in _EQUALITY_OPERATORS
+
+def _filter_chunk(chunk: pd.DataFrame, pushdown: Pushdown) -> pd.DataFrame:
+    renamed = clean_column_names(chunk.copy(deep=False))
+    filters = tuple(op for op in pushdown.filters if _can_filter(renamed, op, pushdown.text_columns))
+    if not filters:
+        return chunk
+    kept = run_stages(renamed, (Stage("filtering", filters),))
+    return chunk.loc[kept.index]
+
+def read_pushdown(read_chunks, read_all, pushdown: Pushdown, report: dict = None) -> pd.DataFrame:
+    """
+    Read an upload restricted to pushdown.columns, applying pushdown.filters chunk by chunk.
+    read_chunks(columns) iterates raw chunks; read_all(columns) reads everything at once.
+
+    If chunks disagree on a column's type, so that their concatenation could differ from
+    one read, filtering is abandoned and the columns are read in one go.
+    """
+    columns = list(pushdown.columns) if pushdown.columns is not None else None
+    if not pushdown.filters:
+        df = read_all(columns)
+        if report is not None:
+            report.update(rows_scanned=len(df), rows_kept=len(df))
+        return df
+
+    kept = []
+    dtypes = None
+    rows = 0
+    chunks = read_chunks(columns)
+    try:
+        for chunk in chunks:
+            if dtypes is None:
+                dtypes = chunk.dtypes
+                first_row = chunk.head(1)
+            elif not all(_compatible(dtypes[col], dtype) for col, dtype in chunk.dtypes.items()):
+                count_fallback("pushdown", "mixed_types")
+                df = read_all(columns)
+                if report is not None:
+                    report.update(rows_scanned=len(df), rows_kept=len(df), fallback="mixed types")
+                return df
+            rows += len(chunk)
+            kept.append(_filter_chunk(chunk, pushdown))
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+    if kept and not any(len(chunk) for chunk in kept):
+        # transform_data short-cuts empty input; keep one row for the filtering stage to remove
+        kept = [first_row]
+    df = pd.concat(kept, ignore_index=True) if kept else read_all(columns).iloc[:0]
+    if report is not None:
+        report.update(rows_scanned=rows, rows_kept=len(df))
+    return df
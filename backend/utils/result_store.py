@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import pandas as pd
+
+# Results are kept server-side so responses only carry a preview
+RESULT_TTL_SECONDS = float(os.getenv("RESULT_TTL_SECONDS", "900"))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "32"))
+PREVIEW_ROWS = 10
+MAX_PAGE_ROWS = 10000
+
+_results = OrderedDict()
+_lock = threading.Lock()
+
+def _release(entry: dict):
+    """
+    Free disk-backed datasets (e.g. streamed results) held by an entry; caller must hold
+    the lock. While downloads still read them, they are freed when the last one ends.
+    """
+    if entry["readers"]:
+        entry["evicted"] = True
+        return
+    for dataset in entry["datasets"].values():
+        if hasattr(dataset, "close"):
+            dataset.close()
+
+def _evict_expired(now: float):
+    """Drop expired entries; caller must hold the lock"""
+    expired = [result_id for result_id, entry in _results.items() if entry["expires_at"] <= now]
+    for result_id in expired:
+        _release(_results.pop(result_id))
+
+def store_result(datasets: dict) -> str:
+    """Store named dataframes (e.g. original/transformed) and return a result ID"""
+    result_id = uuid.uuid4().hex
+    now = time.monotonic()
+    with _lock:
+        _evict_expired(now)
+        _results[result_id] = {"datasets": datasets, "expires_at": now + RESULT_TTL_SECONDS, "readers": 0}
+        # Oldest results go first once the store is full
+        while len(_results) > RESULT_STORE_MAX_ENTRIES:
+            _release(_results.popitem(last=False)[1])
+    return result_id
+
+def _lookup(result_id: str):
+    """The live entry of a result ID, kept alive for another TTL window; caller must hold the lock"""
+    now = time.monotonic()
+    _evict_expired(now)
+    entry = _results.get(result_id)
+    if entry is not None:
+        entry["expires_at"] = now + RESULT_TTL_SECONDS
+        _results.move_to_end(result_id)
+    return entry
+
+def get_result(result_id: str):
+    """Return the stored datasets for a result ID, or None if missing or expired"""
+    with _lock:
+        entry = _lookup(result_id)
+        return entry["datasets"] if entry is not None else None
+
+def hold_result(result_id: str):
+    """
+    get_result for a reader that may outlive the call, like a streamed download: the
+    datasets stay open, even if the result is evicted meanwhile, until the returned
+    release function is called (calling it again does nothing).
+    Returns (datasets, release), or None if the result is missing or expired.
+    """
+    with _lock:
+        entry = _lookup(result_id)
+        if entry is None:
+            return None
+        entry["readers"] += 1
+    released = []
+
+    def release():
+        with _lock:
+            if released:
+                return
+            released.append(True)
+            entry["readers"] -= 1
+            if entry.get("evicted"):
+                _release(entry)
+    return entry["datasets"], release
+
+def delete_result(result_id: str) -> bool:
+    """Remove a stored result"""
+    with _lock:
+        entry = _results.pop(result_id, None)
+        if entry is None:
+            return False
+        _release(entry)
+    return True
+
+def describe_schema(df: pd.DataFrame) -> list:
+    """Column names and dtypes of a dataframe"""
+    return [{"name": str(col), "dtype": str(dtype)} for col, dtype in df.dtypes.items()]
+
+def get_page(df: pd.DataFrame, offset: int = 0, limit: int = 100) -> dict:
+    """
+    Slice a page of rows out of a stored dataframe or disk-backed SpilledFrame.
+    The rows are returned as a dataframe under "page", for the caller to serialize.
+    """
+    offset = max(offset, 0)
+    limit = min(max(limit, 0), MAX_PAGE_ROWS)
+    page = df.iloc[offset:offset + limit] if isinstance(df, pd.DataFrame) else df.slice(offset, limit)
+    next_offset = offset + len(page)
+    return {
+        "offset": offset,
+        "limit": limit,
+        "total_rows": len(df),
+        "next_offset": next_offset if next_offset < len(df) else None,
+        "page": page,
+    }
@@ -0,0 +1,232 @@
+import datetime
+import io
+import json
+import math
+import os
+from json.encoder import encode_basestring
+import numpy as np
+import pandas as pd
+from .ingest import is_pyarrow_available
+
+# Rows per NDJSON chunk / Arrow record batch / Parquet row group of streamed results
+SERIALIZE_BATCH_ROWS = int(os.getenv("SERIALIZE_BATCH_ROWS", "10000"))
+
+FORMATS = {
+    "json": "application/json",
+    "columns": "application/vnd.etl.columns+json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+BINARY_FORMATS = ("arrow", "parquet")
+_MEDIA_TYPES = {media_type: name for name, media_type in FORMATS.items()}
+_MEDIA_TYPES.update({"application/jsonl": "ndjson", "application/x-parquet": "parquet"})
+
+_SECOND_UNITS = {"ms": 10 ** 3, "us": 10 ** 6, "ns": 10 ** 9}
+
+def negotiate_format(requested: str = None, accept: str = None) -> str:
+    """
+    Response format from an explicit ?format= value or the Accept header.
+    Returns None for an unknown explicit format; Accept falls back to json.
+    """
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+
+    candidates = []
+    for position, item in enumerate((accept or "").split(",")):
+        media_type, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = _MEDIA_TYPES.get(media_type.strip().lower())
+        if name is not None and quality > 0:
+            candidates.append((-quality, position, name))
+    return min(candidates)[2] if candidates else "json"
+
+def is_format_available(name: str) -> bool:
+    """Binary formats need the optional pyarrow package"""
+    return name not in BINARY_FORMATS or is_pyarrow_available()
+
+def _encode_scalar(value) -> str:
+    """JSON text of a single Python value, encoded the way FastAPI would"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return encode_basestring(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else "null"
+    if isinstance(value, datetime.timedelta):
+        return repr(value.total_seconds())
+    if isinstance(value, (datetime.date, datetime.time)):
+        return encode_basestring(value.isoformat())
+    return encode_basestring(str(value))
+
+def _datetime_texts(values: np.ndarray) -> np.ndarray:
+    """
+    ISO 8601 strings of a naive datetime64 array. Like Timestamp.isoformat, fractions
+    are only written for values that have them: microseconds, or nanoseconds if set.
+    """
+    unit, _ = np.datetime_data(values.dtype)
+    missing = np.isnat(values)
+    ticks = values.view("i8")
+    texts = np.datetime_as_string(values, unit="s").astype(object)
+    per_second = _SECOND_UNITS.get(unit, 1)
+    if per_second > 1:
+        fraction = (ticks % per_second != 0) & ~missing
+        nanos = fraction & (ticks % 1000 != 0) if unit == "ns" else np.zeros_like(fraction)
+        for mask, text_unit in ((fraction & ~nanos, "us"), (nanos, "ns")):
+            if mask.any():
+                texts[mask] = np.datetime_as_string(values[mask], unit=text_unit)
+    texts = np.char.add(np.char.add('"', texts.astype(str)), '"').astype(object)
+    texts[missing] = "null"
+    return texts
+
+def _json_texts(series: pd.Series) -> np.ndarray:
+    """
+    JSON text of every value of a column, computed from its buffers: numbers and
+    dates are formatted vectorized, categoricals per category, and everything
+    else once per distinct value.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        labels = _json_texts(pd.Series(dtype.categories))
+        # Code -1 (missing) picks the trailing null
+        return np.append(labels, "null").astype(object)[series.cat.codes.to_numpy()]
+
+    if isinstance(dtype, np.dtype):
+        values = series.to_numpy()
+        if dtype.kind == "b":
+            return np.where(values, "true", "false").astype(object)
+        if dtype.kind in "iu":
+            return values.astype(str).astype(object)
+        if dtype.kind == "f":
+            texts = values.astype(str).astype(object)
+            texts[~np.isfinite(values)] = "null"
+            return texts
+        if dtype.kind == "M":
+            return _datetime_texts(values)
+
+    # Strings, mixed objects, timezone-aware dates and nullable extension types
+    codes, uniques = pd.factorize(series)
+    labels = np.array([_encode_scalar(value) for value in uniques] + ["null"], dtype=object)
+    return labels[codes]
+
+def _row_texts(df: pd.DataFrame) -> list:
+    """One JSON object text per row, filled from per-column texts without building dicts"""
+    if len(df.columns) == 0:
+        return ["{}"] * len(df)
+    template = "{" + ",".join(encode_basestring(str(col)).replace("%", "%%") + ":%s" for col in df.columns) + "}"
+    columns = [_json_texts(df.iloc[:, i]) for i in range(len(df.columns))]
+    return [template % row for row in zip(*columns)]
+
+def records_json(df: pd.DataFrame) -> str:
+    """Rows as a JSON array of objects, the layout of to_dict(orient="records")"""
+    return "[" + ",".join(_row_texts(df)) + "]"
+
+def json_records(df: pd.DataFrame) -> list:
+    """JSON-safe records (NaN as None, dates as ISO strings) for small frames such as previews"""
+    return json.loads(records_json(df))
+
+def columns_json(df: pd.DataFrame) -> str:
+    """Rows in a column-oriented layout: {"columns": [...], "dtypes": [...], "values": {column: [values]}}"""
+    names = [encode_basestring(str(col)) for col in df.columns]
+    data = ",".join(
+        f"{name}:[{','.join(_json_texts(df.iloc[:, i]))}]" for i, name in enumerate(names)
+    )
+    dtypes = ",".join(encode_basestring(str(dtype)) for dtype in df.dtypes)
+    return f'{{"columns":[{",".join(names)}],"dtypes":[{dtypes}],"values":{{{data}}}}}'
+
+def envelope_json(meta: dict, key: str, body: str) -> str:
+    """meta encoded as a JSON object with an already encoded body added under key"""
+    return json.dumps(meta)[:-1] + f",{encode_basestring(key)}:{body}}}"
+
+def iter_frames(dataset, offset: int = 0, limit: int = None, batch_rows: int = SERIALIZE_BATCH_ROWS):
+    """
+    Batches of rows [offset, offset + limit) of a dataframe or disk-backed SpilledFrame.
+    Always yields at least one (possibly empty) batch, so writers see the schema.
+    """
+    end = len(dataset) if limit is None else min(offset + limit, len(dataset))
+    if isinstance(dataset, pd.DataFrame):
+        blocks = (dataset.iloc[offset:end],)
+    else:
+        blocks = dataset.iter_range(offset, end - offset)
+
+    emitted = False
+    for block in blocks:
+        for start in range(0, len(block), batch_rows):
+            emitted = True
+            yield block.iloc[start:start + batch_rows]
+    if not emitted:
+        yield dataset.head(0)
+
+def iter_ndjson(frames):
+    """NDJSON body chunks: one JSON object per row, one chunk per batch"""
+    for frame in frames:
+        if len(frame):
+            yield ("\n".join(_row_texts(frame)) + "\n").encode()
+
+def _arrow_table(frame: pd.DataFrame, schema=None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if schema is not None:
+        return table.cast(schema)
+    fields = []
+    for field in table.schema:
+        if pa.types.is_dictionary(field.type):
+            # Dictionary index widths follow each batch's category count; fix one for the stream
+            field = pa.field(field.name, pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_null(field.type):
+            # Object columns with no values in this batch; such columns normally hold text
+            field = pa.field(field.name, pa.string())
+        fields.append(field)
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+def iter_arrow(frames):
+    """Arrow IPC stream chunks: the schema, then one record batch per frame"""
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = schema = None
+    for frame in frames:
+        table = _arrow_table(frame, schema)
+        if writer is None:
+            schema = table.schema
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_table(table)
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+def write_parquet(frames, path: str):
+    """Write batches to a Parquet file, one row group per batch"""
+    import pyarrow.parquet as pq
+
+    writer = schema = None
+    try:
+        for frame in frames:
+            table = _arrow_table(frame, schema)
+            if writer is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
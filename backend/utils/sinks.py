@@ -0,0 +1,348 @@
+import gzip
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import NamedTuple
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from .plan import normalize_prompt
+from .serialization import iter_frames, iter_ndjson, _arrow_table
+
+# Results a prompt asks to save are written under this directory instead of only being served
+SINK_DIR = os.getenv("SINK_DIR", os.path.join(tempfile.gettempdir(), "etl-outputs"))
+# Rows per Parquet row group, and per batch handed to the writer thread
+SINK_BATCH_ROWS = int(os.getenv("SINK_BATCH_ROWS", "100000"))
+# Batches waiting for the writer thread; the producer blocks beyond this
+SINK_QUEUE_BATCHES = int(os.getenv("SINK_QUEUE_BATCHES", "4"))
+# Each partition keeps a file open, so their number is bounded
+SINK_MAX_PARTITIONS = int(os.getenv("SINK_MAX_PARTITIONS", "1024"))
+SINK_PARQUET_COMPRESSION = os.getenv("SINK_PARQUET_COMPRESSION", "snappy")
+SINK_GZIP_LEVEL = int(os.getenv("SINK_GZIP_LEVEL", "6"))
+
+# Plain CSV is only written on request (e.g. by the batch CLI): prompts "load" CSV uploads
+SINK_FORMATS = ("parquet", "csv.gz", "ndjson", "csv")
+# Hive's name for the partition of null values
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# A prompt asks for a sink with a load verb and one of these format names
+_LOAD_VERBS = r"\b(?:load|write|export|save|store|output)\b"
+_FORMAT_PATTERNS = (
+    ("csv.gz", r"\bcsv\.gz\b|\bgzip(?:ped)? csv\b|\bcompressed csv\b"),
+    ("parquet", r"\bparquet\b"),
+    ("ndjson", r"\bndjson\b|\bjsonl\b|\bjson lines\b"),
+)
+
+class SinkSpec(NamedTuple):
+    """Where a prompt asks its result to be written: a format and an optional partition column"""
+    format: str
+    partition_by: str = None
+
+@lru_cache(maxsize=256)
+def _parse_sink(prompt: str):
+    if not re.search(_LOAD_VERBS, prompt):
+        return None
+    for name, pattern in _FORMAT_PATTERNS:
+        if re.search(pattern, prompt):
+            partition_match = re.search(r"partition(?:ed)? by (\w+)", prompt)
+            return SinkSpec(name, partition_match.group(1) if partition_match else None)
+    return None
+
+def parse_sink(prompt: str):
+    """The SinkSpec of a prompt like "save as parquet partitioned by region", or None"""
+    return _parse_sink(normalize_prompt(prompt))
+
+def _partition_dir(column: str, value) -> str:
+    """Hive-style directory name of a partition"""
+    if pd.isna(value):
+        return f"{column}={NULL_PARTITION}"
+    return f"{column}={quote(str(value), safe='')}"
+
+def _partition_rows(series: pd.Series):
+    """(value, row positions) of each distinct value, nulls included, in order of appearance"""
+    codes, values = pd.factorize(series, use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return zip(values, np.split(order, bounds)) if len(codes) else ()
+
+class _ParquetPart:
+    """
+    One Parquet file; frames are buffered into row groups of batch_rows rows.
+    The schema comes from the first row group, except that a column with no values yet
+    takes the type of the first batch that has some, rewriting the row groups before it.
+    """
+
+    def __init__(self, path: str, batch_rows: int):
+        self.path = path
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._writer = self._schema = None
+        self._valued = set()  # columns with values written so far
+        self._pending = []
+        self._pending_rows = 0
+
+    def write(self, frame: pd.DataFrame):
+        self._pending.append(frame)
+        self._pending_rows += len(frame)
+        if self._pending_rows >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        import pyarrow.parquet as pq
+
+        frame = pd.concat(self._pending) if len(self._pending) > 1 else self._pending[0]
+        self._pending, self._pending_rows = [], 0
+        table = _arrow_table(frame)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=SINK_PARQUET_COMPRESSION)
+        elif not table.schema.equals(self._schema):
+            table = self._conform(table)
+        self._writer.write_table(table, row_group_size=self.batch_rows)
+        self._valued.update(name for name in table.column_names if table.column(name).null_count < len(table))
+        self.rows += len(frame)
+
+    def _conform(self, table):
+        """Cast a batch to the file's schema, first retyping columns that only had nulls so far"""
+        import pyarrow as pa
+
+        schema = self._schema
+        for i, field in enumerate(schema):
+            column = table.column(field.name)
+            if column.type == field.type or field.name in self._valued or column.null_count == len(column):
+                continue
+            # Nulls read as float (or text) in pandas; integers after them stay float, as in a single read
+            if not (pa.types.is_floating(field.type) and pa.types.is_integer(column.type)):
+                schema = schema.set(i, field.with_type(column.type))
+        if schema is not self._schema:
+            self._rewrite(schema)
+        return table.cast(self._schema)
+
+    def _rewrite(self, schema):
+        """Rewrite the row groups written so far under a new schema"""
+        import pyarrow.parquet as pq
+
+        self._writer.close()
+        previous = self.path + ".previous"
+        os.replace(self.path, previous)
+        try:
+            self._writer = pq.ParquetWriter(self.path, schema, compression=SINK_PARQUET_COMPRESSION)
+            self._schema = schema
+            with pq.ParquetFile(previous) as source:
+                for i in range(source.num_row_groups):
+                    self._writer.write_table(source.read_row_group(i).cast(schema), row_group_size=self.batch_rows)
+        finally:
+            os.remove(previous)
+
+    def close(self):
+        try:
+            if self._pending:
+                self._flush()
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+
+class _CsvPart:
+    compressed = False
+
+    def __init__(self, path: str, batch_rows: int):
+        self.path = path
+        self.rows = 0
+        if self.compressed:
+            self._file = gzip.open(path, "wt", compresslevel=SINK_GZIP_LEVEL, newline="")
+        else:
+            self._file = open(path, "w", newline="")
+
+    def write(self, frame: pd.DataFrame):
+        # The header is written with the first frame, even an empty one
+        frame.to_csv(self._file, index=False, header=self._file.tell() == 0)
+        self.rows += len(frame)
+
+    def close(self):
+        self._file.close()
+
+class _CsvGzipPart(_CsvPart):
+    compressed = True
+
+class _NdjsonPart:
+    def __init__(self, path: str, batch_rows: int):
+        self.path = path
+        self.rows = 0
+        self._file = open(path, "wb")
+
+    def write(self, frame: pd.DataFrame):
+        for chunk in iter_ndjson((frame,)):
+            self._file.write(chunk)
+        self.rows += len(frame)
+
+    def close(self):
+        self._file.close()
+
+_PARTS = {
+    "parquet": (_ParquetPart, ".parquet"),
+    "csv.gz": (_CsvGzipPart, ".csv.gz"),
+    "ndjson": (_NdjsonPart, ".ndjson"),
+    "csv": (_CsvPart, ".csv"),
+}
+
+class SinkWriter:
+    """
+    Writes a result to SINK_DIR (or directory) on a background thread, so encoding and writing overlap
+    with producing the next frames. put() blocks once SINK_QUEUE_BATCHES frames wait.
+
+    Output is written under a temporary name and renamed into place by close(), so
+    readers only ever see complete outputs. Without a partition column the result is
+    one file; with one, a directory with a column=value subdirectory per partition.
+    Parquet files leave the partition column out, as Hive-partitioned readers expect.
+    """
+
+    def __init__(self, spec: SinkSpec, name: str = None, batch_rows: int = SINK_BATCH_ROWS, directory: str = None):
+        if spec.format not in _PARTS:
+            raise ValueError(f"Unsupported sink format: {spec.format}. Use one of {', '.join(SINK_FORMATS)}")
+        if spec.format == "parquet":
+            from .ingest import is_pyarrow_available
+            if not is_pyarrow_available():
+                raise ValueError("The parquet sink requires pyarrow")
+        self.spec = spec
+        self.batch_rows = batch_rows
+        self._part_class, extension = _PARTS[spec.format]
+        name = name or uuid.uuid4().hex
+        directory = directory or SINK_DIR
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name if spec.partition_by else name + extension)
+        self._extension = extension
+        self._tmp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+        if spec.partition_by:
+            os.makedirs(self._tmp_path)
+        self._parts = {}
+        self._column = None
+        self._error = None
+        self._start = time.perf_counter()
+        self._queue = queue.Queue(maxsize=max(SINK_QUEUE_BATCHES, 1))
+        self._thread = threading.Thread(target=self._run, name="sink-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, frame: pd.DataFrame):
+        """Queue a frame (which must not be modified afterwards) for writing"""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+
+    def write(self, dataset):
+        """Queue every row of a dataframe or SpilledFrame, in batches"""
+        for frame in iter_frames(dataset, batch_rows=self.batch_rows):
+            self.put(frame)
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            if self._error is not None:
+                continue  # keep draining, so put() never blocks on a failed writer
+            try:
+                self._write(frame)
+            except Exception as e:
+                self._error = e
+
+    def _write(self, frame: pd.DataFrame):
+        if not self.spec.partition_by:
+            self._part(None, self._tmp_path).write(frame)
+            return
+        if frame.empty:
+            return  # partitions are only made for rows
+
+        if self._column is None:
+            matches = [col for col in frame.columns if self.spec.partition_by in str(col)]
+            if not matches:
+                raise ValueError(f"Partition column not found: {self.spec.partition_by}")
+            self._column = matches[0]
+        keep = frame.drop(columns=[self._column]) if self.spec.format == "parquet" else frame
+        for value, rows in _partition_rows(frame[self._column]):
+            directory = _partition_dir(self._column, value)
+            if directory not in self._parts and len(self._parts) >= SINK_MAX_PARTITIONS:
+                raise ValueError(f"More than {SINK_MAX_PARTITIONS} partitions of {self._column}")
+            path = os.path.join(self._tmp_path, directory, f"part-00000{self._extension}")
+            self._part(directory, path).write(keep.iloc[rows])
+
+    def _part(self, key, path: str):
+        part = self._parts.get(key)
+        if part is None:
+            if key is not None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            part = self._parts[key] = self._part_class(path, self.batch_rows)
+        return part
+
+    def _stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        for part in self._parts.values():
+            try:
+                part.close()
+            except Exception as e:
+                self._error = self._error or e
+
+    def close(self) -> dict:
+        """Finish writing and publish the output; returns a description of what was written"""
+        self._stop()
+        if self._error is None and not self._parts and not self.spec.partition_by:
+            self._error = ValueError("No frames were written")
+        if self._error is not None:
+            self._remove_tmp()
+            raise self._error
+        replaced = None
+        if os.path.isdir(self.path):
+            # A directory cannot be renamed over another; move the previous output aside first
+            replaced = f"{self._tmp_path}.replaced"
+            os.rename(self.path, replaced)
+        # Atomic rename, so a reader never sees a partly written output
+        os.replace(self._tmp_path, self.path)
+        if replaced is not None:
+            shutil.rmtree(replaced, ignore_errors=True)
+
+        files = []
+        for key, part in sorted(self._parts.items(), key=lambda item: str(item[0])):
+            path = self.path if key is None else os.path.join(self.path, key, os.path.basename(part.path))
+            files.append({"path": path, "rows": part.rows, "bytes": os.path.getsize(path)})
+        seconds = time.perf_counter() - self._start
+        print(f"Wrote {sum(f['rows'] for f in files)} rows to {self.path} in {seconds:.2f}s")
+        return {
+            "format": self.spec.format,
+            "path": self.path,
+            "partition_by": self._column,
+            "partitions": len(files) if self.spec.partition_by else None,
+            "rows": sum(f["rows"] for f in files),
+            "bytes": sum(f["bytes"] for f in files),
+            "files": files,
+            "seconds": seconds,
+        }
+
+    def abort(self):
+        """Stop writing and remove everything written so far"""
+        self._stop()
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        if os.path.isdir(self._tmp_path):
+            shutil.rmtree(self._tmp_path, ignore_errors=True)
+        elif os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+
+def write_sink(dataset, spec: SinkSpec, name: str = None) -> dict:
+    """Write a whole dataframe or SpilledFrame to a sink; returns SinkWriter.close()'s description"""
+    with SinkWriter(spec, name) as writer:
+        writer.write(dataset)
+        return writer.close()
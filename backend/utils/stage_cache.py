@@ -0,0 +1,42 @@
+import hashlib
+import os
+from .lru import ByteLRU
+from .dataset_cache import frame_nbytes
+
+# Intermediate stage results keyed by (dataset hash, every stage up to and including this one)
+STAGE_CACHE_BYTES = int(os.getenv("STAGE_CACHE_BYTES", str(256 * 1024 ** 2)))
+
+# Operations whose output differs between runs; results from them on are never cached
+NON_DETERMINISTIC_OPS = ("add_timestamp",)
+
+_cache = ByteLRU(STAGE_CACHE_BYTES, frame_nbytes)
+
+def stage_keys(dataset_key: str, stages: tuple) -> list:
+    """
+    Cache key for the output of each stage, chained so a key covers the whole prefix.
+    Stops at the first stage with a non-deterministic operation.
+    """
+    keys = []
+    chain = hashlib.sha256(dataset_key.encode())
+    for stage in stages:
+        if any(op.kind in NON_DETERMINISTIC_OPS for op in stage.ops):
+            break
+        chain.update(repr((stage.name, stage.ops)).encode())
+        keys.append(chain.copy().hexdigest())
+    return keys
+
+def find_cached_prefix(keys: list):
+    """Return (number of stages covered, frame) for the longest cached prefix, or (0, None)"""
+    for i in reversed(range(len(keys))):
+        if keys[i] in _cache:
+            df = _cache.get(keys[i])
+            if df is not None:
+                return i + 1, df
+    return 0, None
+
+def put_stage(key: str, df):
+    """Cache a stage result; callers must not mutate the frame afterwards"""
+    _cache.put(key, df)
+
+def stage_cache_stats() -> dict:
+    return _cache.stats()
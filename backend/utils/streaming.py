@@ -0,0 +1,394 @@
+import os
+import pickle
+import tempfile
+import threading
+import weakref
+from itertools import chain
+from datetime import datetime
+import pandas as pd
+from .plan import compile_plan, Op, Stage
+from .transformer import clean_column_names, detect_numeric_columns, resolve_groupby, run_stages, widen_integers
+
+# Stages that only look at one row at a time and can run chunk by chunk
+ROW_LOCAL_STAGES = ("math", "cleaning", "filtering", "columns", "dates")
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "100000"))
+# Maximum number of sorted runs merged in one pass of the external sort
+MERGE_FAN_IN = 16
+
+def _read_csv(source, **kwargs):
+    if hasattr(source, "seek"):
+        source.seek(0)
+        return pd.read_csv(source, **kwargs)
+    return pd.read_csv(source, memory_map=True, **kwargs)
+
+def _is_text(dtype) -> bool:
+    return not pd.api.types.is_numeric_dtype(dtype)
+
+def _text_dtypes(source, first: pd.DataFrame, chunksize: int) -> dict:
+    """
+    Columns to read as str in every chunk: those with text in the first chunk, and those
+    with no values there (which pandas types float) that hold text further on.
+    Only the empty columns are scanned, up to the chunk where each first has values.
+    """
+    dtypes = {col: "str" for col, dtype in first.dtypes.items() if _is_text(dtype)}
+    unresolved = [col for col in first.columns if col not in dtypes and first[col].isna().all()]
+    if unresolved:
+        with _read_csv(source, chunksize=chunksize, usecols=unresolved) as reader:
+            for chunk in reader:
+                for col in [col for col in unresolved if chunk[col].notna().any()]:
+                    if _is_text(chunk[col].dtype):
+                        dtypes[col] = "str"
+                    unresolved.remove(col)
+                if not unresolved:
+                    break
+    return dtypes
+
+def iter_csv_chunks(source, chunksize: int = STREAM_CHUNK_ROWS, usecols: list = None):
+    """
+    Read a CSV path (through a memory map) or file object in chunks, optionally only usecols.
+    Pandas infers each chunk's dtypes on its own, so text columns are pinned to str:
+    a column empty or number-like in one chunk is still text there, as in a single read.
+    """
+    first = _read_csv(source, nrows=chunksize, usecols=usecols)
+    if len(first) < chunksize:
+        yield first
+        return
+    with _read_csv(source, chunksize=chunksize, usecols=usecols, dtype=_text_dtypes(source, first, chunksize)) as reader:
+        yield from reader
+
+def _kind(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    return "text" if _is_text(dtype) else "number"
+
+def typed_chunks(chunks):
+    """
+    Chunks checked against the first chunk's dtypes. A number or bool column that turns to
+    text further on would be transformed (and filtered, or filters skipped) one way in the
+    earlier chunks and another way in the later ones, so it fails the run rather than
+    giving a result a single read would not.
+    """
+    kinds = None
+    for chunk in chunks:
+        if kinds is None:
+            kinds = {col: _kind(dtype) for col, dtype in chunk.dtypes.items()}
+        for col, dtype in chunk.dtypes.items():
+            first = kinds.get(col)
+            if first in ("number", "bool") and _kind(dtype) != first:
+                raise ValueError(f"Column {col} has {_kind(dtype)} after {first} values; it cannot be processed in chunks")
+        yield chunk
+
+class SpilledFrame:
+    """
+    Append-only, disk-backed sequence of dataframe blocks.
+    Holds only block offsets in memory, so it can represent frames larger than RAM.
+    """
+
+    def __init__(self, spill_dir: str = None):
+        fd, self.path = tempfile.mkstemp(prefix="etl-spill-", suffix=".pkl", dir=spill_dir)
+        self._file = os.fdopen(fd, "w+b")
+        # Remove the spill file even if close() is never called
+        self._finalizer = weakref.finalize(self, SpilledFrame._cleanup, self._file, self.path)
+        self._blocks = []  # (file position, start row, row count)
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.dtypes = pd.Series(dtype=object)
+        self.columns = pd.Index([])
+
+    def __len__(self):
+        return self._rows
+
+    def append(self, df: pd.DataFrame):
+        if not self._blocks:
+            self.dtypes = df.dtypes
+            self.columns = df.columns
+        if df.empty:
+            return
+        self._file.seek(0, os.SEEK_END)
+        self._blocks.append((self._file.tell(), self._rows, len(df)))
+        pickle.dump(df, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._rows += len(df)
+
+    def _load(self, position: int) -> pd.DataFrame:
+        # Pages can be read concurrently from the threadpool
+        with self._lock:
+            self._file.seek(position)
+            return pickle.load(self._file)
+
+    def iter_blocks(self):
+        for position, _, _ in self._blocks:
+            yield self._load(position)
+
+    def iter_range(self, offset: int, limit: int):
+        """Rows [offset, offset + limit) block by block, loading each overlapping block once"""
+        end = offset + limit
+        for position, start, count in self._blocks:
+            if start + count <= offset or start >= end:
+                continue
+            yield self._load(position).iloc[max(offset - start, 0):end - start]
+
+    def slice(self, offset: int, limit: int) -> pd.DataFrame:
+        """Load only the blocks overlapping [offset, offset + limit)"""
+        end = offset + limit
+        parts = []
+        for position, start, count in self._blocks:
+            if start + count <= offset or start >= end:
+                continue
+            block = self._load(position)
+            parts.append(block.iloc[max(offset - start, 0):end - start])
+        if not parts:
+            return pd.DataFrame(columns=self.columns).astype(self.dtypes.to_dict())
+        result = pd.concat(parts)
+        result.index = pd.RangeIndex(offset, offset + len(result))
+        return result
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.slice(0, n)
+
+    @staticmethod
+    def _cleanup(file, path: str):
+        if not file.closed:
+            file.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def close(self):
+        self._finalizer()
+
+def _bind_stage(stage: Stage, now: datetime, means: dict) -> Stage:
+    """Pin values that must be identical across chunks (timestamp, global means)"""
+    ops = []
+    for op in stage.ops:
+        if op.kind == "add_timestamp":
+            op = Op(op.kind, (now,))
+        elif op.kind == "fill_nulls" and op.params[0]:
+            op = Op(op.kind, (True, means))
+        ops.append(op)
+    return Stage(stage.name, tuple(ops))
+
+def _split_at_mean_fill(stages: tuple):
+    """Return the stages that run before a mean-based null fill, or None if there is none"""
+    prefix = []
+    for stage in stages:
+        for i, op in enumerate(stage.ops):
+            if op.kind == "fill_nulls" and op.params[0]:
+                prefix.append(Stage(stage.name, stage.ops[:i]))
+                return tuple(prefix)
+        prefix.append(stage)
+    return None
+
+def _compute_means(read_chunks, prefix: tuple) -> dict:
+    """First pass: global column means of the frame as it looks at the fill step"""
+    sums, counts = {}, {}
+    for chunk in read_chunks():
+        chunk = run_stages(clean_column_names(chunk), prefix)
+        for col in detect_numeric_columns(chunk):
+            sums[col] = sums.get(col, 0) + chunk[col].sum()
+            counts[col] = counts.get(col, 0) + chunk[col].count()
+    return {col: sums[col] / counts[col] if counts[col] else float("nan") for col in sums}
+
+def partial_aggregate(df: pd.DataFrame, spec: tuple) -> pd.DataFrame:
+    """Aggregate one chunk into mergeable partials (mean is kept as sum + count)"""
+    group_col, agg_col, agg_function = spec
+    if agg_col is None:
+        return df.groupby(group_col, observed=True).size().to_frame("count")
+    # Only sums (also behind means) are widened, as in _op_groupby: min and max keep the compacted dtype
+    values = widen_integers(df[agg_col]) if agg_function in ("sum", "mean") else df[agg_col]
+    grouped = values.groupby(df[group_col], observed=True)
+    if agg_function == "mean":
+        return grouped.agg(["sum", "count"])
+    return grouped.agg(agg_function).to_frame("value")
+
+def combine_partials(total: pd.DataFrame, partials: list, spec: tuple) -> pd.DataFrame:
+    """Fold partials into a running partial (total, or None for the first), keeping their form"""
+    if total is not None:
+        partials = [total] + partials
+    grouped = pd.concat(partials).groupby(level=0)
+    if spec[1] is not None and spec[2] in ("min", "max"):
+        return grouped.agg(spec[2])
+    # Counts, sums and the sum + count behind means all add up
+    return grouped.sum()
+
+def merge_partials(partials: list, spec: tuple) -> pd.DataFrame:
+    """Combine partial aggregates into the same frame apply_grouping_aggregation returns"""
+    group_col, agg_col, agg_function = spec
+    output_col = "count" if agg_col is None else f"{agg_function}_{agg_col}"
+    if not partials:
+        return pd.DataFrame(columns=[group_col, output_col])
+
+    grouped = pd.concat(partials).groupby(level=0)
+    if agg_col is None:
+        result = grouped["count"].sum()
+    elif agg_function == "mean":
+        totals = grouped.sum()
+        result = totals["sum"] / totals["count"]
+    elif agg_function == "count":
+        result = grouped["value"].sum()
+    else:
+        result = grouped["value"].agg(agg_function)
+
+    result = result.reset_index()
+    result.columns = [group_col, output_col]
+    return result
+
+def _merge_runs(runs: list, col: str, ascending: bool):
+    """
+    k-way merge of sorted runs, yielding sorted blocks; one block per run is in memory.
+    Equal keys come out by run, then by position in the run, so merging runs in input
+    order is a stable sort.
+    """
+    readers = [run.iter_blocks() for run in runs]
+    buffers = [next(reader, None) for reader in readers]
+
+    while any(buffer is not None for buffer in buffers):
+        # Everything up to the smallest (or largest) buffered tail key is safe to emit
+        tails = [buffer[col].iloc[-1] if buffer is not None else None for buffer in buffers]
+        bound = min(tail for tail in tails if tail is not None) if ascending \
+            else max(tail for tail in tails if tail is not None)
+        # The first run ending on the bound may hold more of it in its next block, so later
+        # runs hold back their rows equal to it until that run has moved past it
+        last = tails.index(bound)
+        ready = []
+        for i, buffer in enumerate(buffers):
+            if buffer is None:
+                continue
+            if i <= last:
+                take = buffer[col] <= bound if ascending else buffer[col] >= bound
+            else:
+                take = buffer[col] < bound if ascending else buffer[col] > bound
+            ready.append(buffer[take])
+            rest = buffer[~take]
+            buffers[i] = rest if len(rest) else next(readers[i], None)
+        yield pd.concat(ready).sort_values(by=col, ascending=ascending, kind="mergesort")
+
+def _write_run(blocks, block_rows: int, spill_dir: str) -> SpilledFrame:
+    run = SpilledFrame(spill_dir)
+    for block in blocks:
+        for start in range(0, len(block), block_rows):
+            run.append(block.iloc[start:start + block_rows])
+    return run
+
+def external_sort(chunks, col: str, ascending: bool, chunk_rows: int = STREAM_CHUNK_ROWS, spill_dir: str = None):
+    """
+    Sort a stream of chunks by one column with bounded memory.
+    Each chunk is sorted into a run on disk, then runs are merged MERGE_FAN_IN at a
+    time, so at most about chunk_rows rows are buffered during a merge.
+    Missing keys go last, as with DataFrame.sort_values.
+    """
+    block_rows = max(chunk_rows // MERGE_FAN_IN, 1)
+    runs = []
+    nulls = SpilledFrame(spill_dir)
+    try:
+        for chunk in chunks:
+            missing = chunk[col].isna()
+            if missing.any():
+                nulls.append(chunk[missing])
+                chunk = chunk[~missing]
+            if len(chunk):
+                chunk = chunk.sort_values(by=col, ascending=ascending, kind="mergesort")
+                runs.append(_write_run([chunk], block_rows, spill_dir))
+
+        # Too many runs to merge at once: merge adjacent groups of runs into longer runs
+        # first, keeping them in input order so ties stay in input order
+        while len(runs) > MERGE_FAN_IN:
+            merged = []
+            for start in range(0, len(runs), MERGE_FAN_IN):
+                group = runs[start:start + MERGE_FAN_IN]
+                merged.append(_write_run(_merge_runs(group, col, ascending), block_rows, spill_dir))
+                for run in group:
+                    run.close()
+            runs = merged
+
+        yield from _merge_runs(runs, col, ascending)
+        yield from nulls.iter_blocks()
+    finally:
+        for run in runs:
+            run.close()
+        nulls.close()
+
+def stream_transform(read_chunks, prompt: str, chunk_rows: int = STREAM_CHUNK_ROWS, spill_dir: str = None, stats: dict = None,
+                     lookups: tuple = None):
+    """
+    Streaming counterpart of transform_data for inputs larger than memory.
+
+    read_chunks is a zero-argument callable returning a fresh iterator of dataframe
+    chunks; it is called twice when the prompt asks for mean-based null filling.
+    Joins probe each chunk against small lookups and partition large ones to disk,
+    row-local stages run per chunk, grouping merges partial aggregates and sorting
+    uses an external merge sort. Yields transformed chunks with a continuous index.
+    """
+    plan = compile_plan(prompt)
+    if lookups:
+        # Imported here: the join executor builds on this module
+        from .joins import bind_lookups
+        plan = bind_lookups(plan, lookups)
+    joining = plan.stage("joining")
+    now = datetime.now()
+    row_local = tuple(stage for stage in plan.active_stages if stage.name in ROW_LOCAL_STAGES)
+    grouping = plan.stage("grouping")
+    sorting = plan.stage("sorting")
+    if stats is None:
+        stats = {}
+    stats["rows_in"] = 0
+
+    def counted_chunks():
+        for chunk in read_chunks():
+            stats["rows_in"] += len(chunk)
+            yield chunk
+
+    def joined_chunks(source=read_chunks):
+        chunks = (clean_column_names(chunk) for chunk in typed_chunks(source()))
+        if joining.is_noop:
+            return chunks
+        from .joins import join_chunks
+        return join_chunks(chunks, joining, spill_dir)
+
+    means = None
+    prefix = _split_at_mean_fill(row_local)
+    if prefix is not None:
+        means = _compute_means(joined_chunks, prefix)
+    row_local = tuple(_bind_stage(stage, now, means) for stage in row_local)
+
+    def transformed_chunks():
+        for chunk in joined_chunks(counted_chunks):
+            yield run_stages(chunk, row_local)
+
+    chunks = transformed_chunks()
+
+    if not grouping.is_noop:
+        first = next(chunks, None)
+        spec = resolve_groupby(first.columns, *grouping.ops[0].params) if first is not None else None
+        if spec is None:
+            chunks = chain([first] if first is not None else [], chunks)
+        else:
+            # Partials are folded into a running total as they arrive, so memory follows the
+            # number of groups rather than the number of chunks
+            total, pending, pending_rows = None, [], 0
+            for chunk in chain([first], chunks):
+                pending.append(partial_aggregate(chunk, spec))
+                pending_rows += len(pending[-1])
+                if pending_rows >= chunk_rows:
+                    total, pending, pending_rows = combine_partials(total, pending, spec), [], 0
+            if pending:
+                total = combine_partials(total, pending, spec)
+            # Grouped output has one row per group and is small enough to finish in memory
+            chunks = iter([run_stages(merge_partials([total], spec), (sorting,))])
+            sorting = Stage("sorting", ())
+
+    if not sorting.is_noop:
+        first = next(chunks, None)
+        if first is not None:
+            col_name, ascending = sorting.ops[0].params
+            matching_cols = [col for col in first.columns if col_name.lower() in col.lower()]
+            chunks = chain([first], chunks)
+            if matching_cols:
+                chunks = external_sort(chunks, matching_cols[0], ascending, chunk_rows, spill_dir)
+
+    offset = 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        chunk = chunk.copy(deep=False)
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
@@ -1,7 +1,9 @@
 import pandas as pd
-import re
 from datetime import datetime
 import numpy as np
+from .plan import compile_plan, Plan, Stage
+from .stage_cache import stage_keys, find_cached_prefix, put_stage
+from .metrics import timed
 
 def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and standardize column names"""
@@ -13,307 +15,487 @@ def detect_numeric_columns(df: pd.DataFrame) -> list:
     return df.select_dtypes(include=[np.number]).columns.tolist()
 
 def detect_string_columns(df: pd.DataFrame) -> list:
-    """Detect string/object columns in the dataframe"""
-    return df.select_dtypes(include=['object', 'string']).columns.tolist()
+    """Detect string/object columns in the dataframe, including categoricals of strings"""
+    return [
+        col for col, dtype in df.dtypes.items()
+        if dtype == 'object' or pd.api.types.is_string_dtype(dtype)
+        or (isinstance(dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(dtype.categories.dtype))
+    ]
+
+# Name fragments the kernels look for when picking columns
+DATE_WORDS = ('date', 'time', 'created', 'updated', 'timestamp')
+QUANTITY_WORDS = ('qty', 'quantity', 'count', 'units')
+PRICE_WORDS = ('price', 'cost', 'rate', 'amount')
+STATUS_WORD = 'status'
+FIRST_NAME_WORDS = ('first', 'fname')
+LAST_NAME_WORDS = ('last', 'lname', 'surname')
+PERFORMANCE_WORDS = ('score', 'rating', 'performance')
+STOCK_WORDS = ('stock', 'quantity', 'inventory')
+
+# attrs key of the dates compaction parsed for categorical date columns
+PARSED_DATES = "parsed_dates"
 
 def detect_date_columns(df: pd.DataFrame) -> list:
     """Detect potential date columns"""
     date_columns = []
     for col in df.columns:
-        if any(date_word in col.lower() for date_word in ['date', 'time', 'created', 'updated', 'timestamp']):
+        if any(date_word in col.lower() for date_word in DATE_WORDS):
             date_columns.append(col)
     return date_columns
 
+def _is_object_column(series: pd.Series) -> bool:
+    """Object columns, and categoricals compacted from them"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.categories.dtype == 'object'
+    return series.dtype == 'object'
+
+def _map_text(series: pd.Series, func) -> pd.Series:
+    """
+    Apply a vectorized string function to a column converted with astype(str).
+    The function runs once per distinct value and the results are mapped back by code;
+    categoricals are transformed once per category and stay categorical.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        # Mixed objects may hash equal but print differently (1 and True), so only
+        # all-string columns take the distinct-value path
+        if series.dtype == 'object' and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            return func(series.astype(str))
+        codes, uniques = pd.factorize(series)
+        labels = func(pd.Series(uniques).astype(str))
+        missing = codes == -1
+        if missing.any():
+            # Missing values keep their own spelling ('nan', 'None', ...) after astype(str)
+            codes[missing] = len(labels) + np.arange(missing.sum())
+            labels = pd.concat([labels, func(series[missing].astype(str))], ignore_index=True)
+        result = labels.take(codes)
+        result.index = series.index
+        result.name = series.name
+        return result
+    # The trailing label is what astype(str) makes of a missing value; code -1 selects it
+    labels = func(pd.Series([*series.cat.categories.astype(str), 'nan'], dtype=object))
+    label_codes, categories = pd.factorize(labels, sort=True)
+    codes = label_codes[series.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=series.index, name=series.name)
+
+def widen_integers(series: pd.Series) -> pd.Series:
+    """Upcast compacted integer columns so arithmetic cannot overflow"""
+    if pd.api.types.is_signed_integer_dtype(series.dtype) and series.dtype.itemsize < 8 \
+            and not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        return series.astype(np.int64)
+    return series
+
+def _op_join(df: pd.DataFrame, table: str, key: str, how: str, lookup=None, prepared=None) -> pd.DataFrame:
+    if lookup is None:
+        raise ValueError(f"No lookup table uploaded for {table}")
+    # Imported here: the join executor builds on this module
+    from .joins import join_frame
+    return join_frame(df, lookup, key, how, prepared)
+
+def _op_total(df: pd.DataFrame) -> pd.DataFrame:
+    numeric_cols = detect_numeric_columns(df)
+    if len(numeric_cols) >= 2:
+        df["total_amount"] = df[numeric_cols].sum(axis=1)
+    elif len(numeric_cols) == 1:
+        df["total_amount"] = widen_integers(df[numeric_cols[0]])
+    return df
+
+def _op_average(df: pd.DataFrame) -> pd.DataFrame:
+    numeric_cols = detect_numeric_columns(df)
+    if len(numeric_cols) >= 2:
+        df["average_value"] = df[numeric_cols].mean(axis=1)
+    return df
+
+def _op_revenue(df: pd.DataFrame) -> pd.DataFrame:
+    # Look for quantity and price columns
+    qty_cols = [col for col in df.columns if any(word in col.lower() for word in QUANTITY_WORDS)]
+    price_cols = [col for col in df.columns if any(word in col.lower() for word in PRICE_WORDS)]
+
+    if qty_cols and price_cols:
+        qty_col = qty_cols[0]
+        price_col = price_cols[0]
+        if pd.api.types.is_numeric_dtype(df[qty_col]) and pd.api.types.is_numeric_dtype(df[price_col]):
+            df["revenue"] = widen_integers(df[qty_col]) * widen_integers(df[price_col])
+    return df
+
+def _op_calculate(df: pd.DataFrame, new_col: str, col1: str, op: str, col2: str) -> pd.DataFrame:
+    if col1 in df.columns and col2 in df.columns:
+        try:
+            left, right = widen_integers(df[col1]), widen_integers(df[col2])
+            if op == "+": df[new_col] = left + right
+            elif op == "-": df[new_col] = left - right
+            elif op == "*": df[new_col] = left * right
+            elif op == "/": df[new_col] = left / right.replace(0, np.nan)
+        except Exception:
+            pass
+    return df
+
+def _op_clean_strings(df: pd.DataFrame) -> pd.DataFrame:
+    for col in detect_string_columns(df):
+        if _is_object_column(df[col]):
+            # Remove extra spaces and capitalize properly, once per distinct value
+            df[col] = _map_text(df[col], lambda s: s.str.strip().str.title())
+    return df
+
+def _op_drop_nulls(df: pd.DataFrame) -> pd.DataFrame:
+    initial_rows = len(df)
+    df = df.dropna()
+    print(f"Removed {initial_rows - len(df)} rows with null values")
+    return df
+
+def _op_fill_nulls(df: pd.DataFrame, use_mean: bool, means: dict = None) -> pd.DataFrame:
+    numeric_cols = detect_numeric_columns(df)
+    string_cols = detect_string_columns(df)
+
+    # Fill numeric nulls with 0 or mean (precomputed means are used when running per chunk)
+    for col in numeric_cols:
+        if use_mean:
+            fill_value = means.get(col, np.nan) if means is not None else df[col].mean()
+        else:
+            fill_value = 0
+        df[col] = df[col].fillna(fill_value)
+
+    # Fill string nulls with "Unknown"
+    for col in string_cols:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and "Unknown" not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories("Unknown")
+        df[col] = df[col].fillna("Unknown")
+    return df
+
+def _op_change_case(df: pd.DataFrame, upper: bool, col_name: str) -> pd.DataFrame:
+    matching_cols = [col for col in df.columns if col_name.lower() in col.lower()]
+    for col in matching_cols:
+        if _is_object_column(df[col]):
+            if upper:
+                df[col] = _map_text(df[col], lambda s: s.str.upper())
+            else:
+                df[col] = _map_text(df[col], lambda s: s.str.lower())
+    return df
+
+def _op_filter_value(df: pd.DataFrame, col_name: str, operator: str, value: str) -> pd.DataFrame:
+    matching_cols = [col for col in df.columns if col_name.lower() in col.lower()]
+    if not matching_cols:
+        return df
+
+    col = matching_cols[0]
+    try:
+        series = df[col]
+        # Try to convert value to appropriate type
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            value = float(value)
+        if isinstance(series.dtype, pd.CategoricalDtype) and operator not in ["=", "==", "eq", "!=", "<>", "ne"]:
+            # Unordered categoricals only support equality; compare the underlying values
+            series = series.astype(series.cat.categories.dtype)
+
+        if operator in [">", "gt"]:
+            df = df[series > value]
+        elif operator in ["<", "lt"]:
+            df = df[series < value]
+        elif operator in ["=", "==", "eq"]:
+            df = df[series == value]
+        elif operator in ["!=", "<>", "ne"]:
+            df = df[series != value]
+        elif operator in [">=", "gte"]:
+            df = df[series >= value]
+        elif operator in ["<=", "lte"]:
+            df = df[series <= value]
+    except Exception as e:
+        print(f"Error filtering {col}: {e}")
+    return df
+
+def _op_filter_active(df: pd.DataFrame) -> pd.DataFrame:
+    status_cols = [col for col in df.columns if STATUS_WORD in col.lower()]
+    if status_cols:
+        col = status_cols[0]
+        df = df[df[col].str.lower().str.contains('active', na=False)]
+    return df
+
+def _op_rename(df: pd.DataFrame, old_name: str, new_name: str) -> pd.DataFrame:
+    matching_cols = [col for col in df.columns if old_name.lower() in col.lower()]
+    if matching_cols:
+        df.rename(columns={matching_cols[0]: new_name}, inplace=True)
+    return df
+
+def _op_full_name(df: pd.DataFrame) -> pd.DataFrame:
+    first_name_cols = [col for col in df.columns if any(word in col.lower() for word in FIRST_NAME_WORDS)]
+    last_name_cols = [col for col in df.columns if any(word in col.lower() for word in LAST_NAME_WORDS)]
+
+    if first_name_cols and last_name_cols:
+        first_col = first_name_cols[0]
+        last_col = last_name_cols[0]
+        df['full_name'] = df[first_col].astype(str) + ' ' + df[last_col].astype(str)
+    return df
+
+def _op_performance_category(df: pd.DataFrame) -> pd.DataFrame:
+    perf_cols = [col for col in df.columns if any(word in col.lower() for word in PERFORMANCE_WORDS)]
+    if perf_cols:
+        col = perf_cols[0]
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df['performance_category'] = pd.cut(
+                df[col],
+                bins=[0, 3.5, 4.0, 5.0],
+                labels=['Needs Improvement', 'Good', 'Excellent'],
+                include_lowest=True
+            )
+    return df
+
+def _op_stock_status(df: pd.DataFrame) -> pd.DataFrame:
+    stock_cols = [col for col in df.columns if any(word in col.lower() for word in STOCK_WORDS)]
+    if stock_cols:
+        col = stock_cols[0]
+        if pd.api.types.is_numeric_dtype(df[col]):
+            # NaN compares False, so missing levels are 'Normal Stock' as with a per-row check
+            df['stock_status'] = pd.Series(
+                np.where(df[col] < 100, 'Low Stock', 'Normal Stock'), index=df.index
+            )
+    return df
+
+def _to_datetime(df: pd.DataFrame, col: str) -> pd.Series:
+    """pd.to_datetime of a column, reusing the dates compaction parsed when its categories are unchanged"""
+    series = df[col]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.tolist()
+        # Matched on categories rather than name: columns are renamed after compaction
+        for parsed in df.attrs.get(PARSED_DATES, {}).values():
+            if parsed["categories"] == categories:
+                values = pd.to_datetime(pd.Series(parsed["values"], dtype=object), format="ISO8601").astype(parsed["dtype"])
+                return pd.Series(values.array.take(series.cat.codes.to_numpy(), allow_fill=True),
+                                 index=series.index, name=series.name)
+        # pd.to_datetime would map the categories and keep a categorical of dates
+        series = series.astype(series.cat.categories.dtype)
+    return pd.to_datetime(series, errors='coerce')
+
+def _op_to_datetime(df: pd.DataFrame, col_name: str) -> pd.DataFrame:
+    matching_cols = [col for col in df.columns if col_name.lower() in col.lower()]
+    if matching_cols:
+        col = matching_cols[0]
+        df[col] = _to_datetime(df, col)
+    return df
+
+def _op_add_timestamp(df: pd.DataFrame, now: datetime = None) -> pd.DataFrame:
+    df['processed_at'] = now if now is not None else datetime.now()
+    return df
+
+# Map aggregation functions
+AGG_MAPPING = {
+    'sum': 'sum',
+    'mean': 'mean',
+    'average': 'mean',
+    'count': 'count',
+    'max': 'max',
+    'min': 'min'
+}
+
+def resolve_groupby(columns, group_col_name: str, agg_func: str, agg_col_name: str):
+    """
+    Resolve a groupby operation against actual column names.
+    Returns (group_col, agg_col, agg_function), with agg_col None for a plain count,
+    or None when the operation does not apply to these columns.
+    """
+    group_cols = [col for col in columns if group_col_name.lower() in col.lower()]
+    if not group_cols:
+        return None
+
+    if agg_func and agg_col_name:
+        agg_cols = [col for col in columns if agg_col_name.lower() in col.lower()]
+        if not agg_cols:
+            return None
+        return group_cols[0], agg_cols[0], AGG_MAPPING.get(agg_func, 'sum')
+    return group_cols[0], None, None
+
+def _op_groupby(df: pd.DataFrame, group_col_name: str, agg_func: str, agg_col_name: str) -> pd.DataFrame:
+    spec = resolve_groupby(df.columns, group_col_name, agg_func, agg_col_name)
+    if spec is None:
+        return df
+
+    group_col, agg_col, agg_function = spec
+    # observed=True: categorical keys only yield groups present in the data
+    if agg_col is not None:
+        values = widen_integers(df[agg_col]) if agg_function == 'sum' else df[agg_col]
+        df = values.groupby(df[group_col], observed=True).agg(agg_function).reset_index()
+        df.columns = [group_col, f"{agg_function}_{agg_col}"]
+    else:
+        # Simple groupby count
+        df = df.groupby(group_col, observed=True).size().reset_index(name='count')
+    return df
+
+def _op_sort(df: pd.DataFrame, col_name: str, ascending: bool) -> pd.DataFrame:
+    matching_cols = [col for col in df.columns if col_name.lower() in col.lower()]
+    if matching_cols:
+        # Stable, so ties keep their row order whether or not the column was compacted to a categorical
+        df = df.sort_values(by=matching_cols[0], ascending=ascending, kind="stable")
+    return df
+
+def top_rows(df: pd.DataFrame, col_name: str, ascending: bool, limit: int) -> pd.DataFrame:
+    """
+    The first limit rows of _op_sort's result, by top-k selection instead of a full sort.
+    Rows missing the sort value come last, as with sort_values.
+    """
+    matching_cols = [col for col in df.columns if col_name.lower() in col.lower()]
+    if not matching_cols:
+        return df.head(limit)
+    series = df[matching_cols[0]]
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        # nlargest/nsmallest only rank numbers
+        return df.sort_values(by=matching_cols[0], ascending=ascending, kind="stable").head(limit)
+    series = series.reset_index(drop=True)
+    top = series.nsmallest(limit) if ascending else series.nlargest(limit)
+    missing = series.index[series.isna()][:limit - len(top)]
+    return df.iloc[top.index.append(missing)]
+
+# Operation kernels: kind -> (function, mutates_in_place)
+# Mutating kernels only ever replace whole columns or labels, never write into
+# existing arrays, so a shallow copy is enough to protect the caller's frame.
+_KERNELS = {
+    "join": (_op_join, False),
+    "total": (_op_total, True),
+    "average": (_op_average, True),
+    "revenue": (_op_revenue, True),
+    "calculate": (_op_calculate, True),
+    "clean_strings": (_op_clean_strings, True),
+    "drop_nulls": (_op_drop_nulls, False),
+    "fill_nulls": (_op_fill_nulls, True),
+    "change_case": (_op_change_case, True),
+    "filter_value": (_op_filter_value, False),
+    "filter_active": (_op_filter_active, False),
+    "rename": (_op_rename, True),
+    "full_name": (_op_full_name, True),
+    "performance_category": (_op_performance_category, True),
+    "stock_status": (_op_stock_status, True),
+    "to_datetime": (_op_to_datetime, True),
+    "add_timestamp": (_op_add_timestamp, True),
+    "groupby": (_op_groupby, False),
+    "sort": (_op_sort, False),
+}
+
+def _execute_stage(df: pd.DataFrame, stage: Stage, owned: bool) -> tuple:
+    """Run one stage, copying the frame only before the first mutating operation"""
+    for op in stage.ops:
+        kernel, mutates = _KERNELS[op.kind]
+        if mutates and not owned:
+            df = df.copy(deep=False)
+            owned = True
+        result = kernel(df, *op.params)
+        if result is not df:
+            owned = False
+        df = result
+    return df, owned
+
+def run_stages(df: pd.DataFrame, stages) -> pd.DataFrame:
+    """Run compiled stages in order; the input frame is never modified"""
+    result, owned = df, False
+    for stage in stages:
+        result, owned = _execute_stage(result, stage, owned)
+    return df.copy(deep=False) if result is df else result
+
+def run_stage(df: pd.DataFrame, stage: Stage) -> pd.DataFrame:
+    """Run a single compiled stage; the input frame is never modified"""
+    return run_stages(df, (stage,))
+
+def execute_plan(df: pd.DataFrame, plan: Plan, on_stage=None, dataset_key: str = None, stats: dict = None) -> pd.DataFrame:
+    """
+    Execute a compiled plan against a dataframe.
+    No-op stages are skipped and the frame is only copied when a stage mutates it.
+    on_stage(stage_name, completed, total) is called after each stage that runs.
+
+    With a dataset_key (content hash of df), stage results are memoized and a re-run
+    resumes from the longest cached prefix of stages. stats, if given, receives the
+    names of reused and computed stages.
+    """
+    stages = plan.active_stages
+    keys = stage_keys(dataset_key, stages) if dataset_key else []
+    start, df_transformed = find_cached_prefix(keys)
+    # Cached frames are shared, so the first mutation after a hit must copy
+    owned = False
+
+    if df_transformed is None:
+        df_transformed = clean_column_names(df.copy(deep=False))
+        owned = True
+    if on_stage is not None and start:
+        on_stage(stages[start - 1].name, start, len(stages))
+
+    # Imported here: the parallel executor builds on this module
+    from .parallel import partitioned_run_length, run_partitioned
+
+    i = start
+    while i < len(stages):
+        # Large frames run consecutive row-local stages on partitions across processes
+        count = partitioned_run_length(stages, i, len(df_transformed))
+        run = stages[i:i + max(count, 1)]
+        with timed("stage", "+".join(stage.name for stage in run), rows_in=len(df_transformed)) as record:
+            if count:
+                df_transformed, owned = run_partitioned(df_transformed, run), True
+            else:
+                df_transformed, owned = _execute_stage(df_transformed, run[0], owned)
+            record["rows_out"] = len(df_transformed)
+        i += len(run)
+        if i - 1 < len(keys):
+            put_stage(keys[i - 1], df_transformed)
+            owned = False
+        if on_stage is not None:
+            on_stage(stages[i - 1].name, i, len(stages))
+
+    if stats is not None:
+        stats["stages_reused"] = [stage.name for stage in stages[:start]]
+        stats["stages_computed"] = [stage.name for stage in stages[start:]]
+
+    # Reset index to ensure clean output
+    if not owned:
+        df_transformed = df_transformed.copy(deep=False)
+    df_transformed.index = pd.RangeIndex(len(df_transformed))
+    return df_transformed
+
+def apply_joins(df: pd.DataFrame, prompt: str, lookups: tuple = None) -> pd.DataFrame:
+    """Join the lookup tables the prompt names"""
+    from .joins import bind_lookups
+    return run_stage(df, bind_lookups(compile_plan(prompt), lookups).stage("joining"))
+
 def apply_mathematical_operations(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply mathematical operations based on prompt"""
-    df_copy = df.copy()
-    
-    # Calculate totals/sums
-    if any(word in prompt.lower() for word in ["total", "sum", "add up", "calculate sum"]):
-        numeric_cols = detect_numeric_columns(df_copy)
-        if len(numeric_cols) >= 2:
-            df_copy["total_amount"] = df_copy[numeric_cols].sum(axis=1)
-        elif len(numeric_cols) == 1:
-            df_copy["total_amount"] = df_copy[numeric_cols[0]]
-    
-    # Calculate averages
-    if any(word in prompt.lower() for word in ["average", "mean", "avg"]):
-        numeric_cols = detect_numeric_columns(df_copy)
-        if len(numeric_cols) >= 2:
-            df_copy["average_value"] = df_copy[numeric_cols].mean(axis=1)
-    
-    # Calculate revenue (quantity * price patterns)
-    revenue_match = re.search(r"revenue|total.*value|amount", prompt.lower())
-    if revenue_match:
-        # Look for quantity and price columns
-        qty_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['qty', 'quantity', 'count', 'units'])]
-        price_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['price', 'cost', 'rate', 'amount'])]
-        
-        if qty_cols and price_cols:
-            qty_col = qty_cols[0]
-            price_col = price_cols[0]
-            if pd.api.types.is_numeric_dtype(df_copy[qty_col]) and pd.api.types.is_numeric_dtype(df_copy[price_col]):
-                df_copy["revenue"] = df_copy[qty_col] * df_copy[price_col]
-    
-    # Specific calculation patterns (calculate new = col1 op col2)
-    calc_match = re.search(r"calculate (\w+)\s*=\s*(\w+)\s*([-+*/])\s*(\w+)", prompt.lower())
-    if calc_match:
-        new_col, col1, op, col2 = calc_match.groups()
-        if col1 in df_copy.columns and col2 in df_copy.columns:
-            try:
-                if op == "+": df_copy[new_col] = df_copy[col1] + df_copy[col2]
-                elif op == "-": df_copy[new_col] = df_copy[col1] - df_copy[col2]
-                elif op == "*": df_copy[new_col] = df_copy[col1] * df_copy[col2]
-                elif op == "/": df_copy[new_col] = df_copy[col1] / df_copy[col2].replace(0, np.nan)
-            except Exception:
-                pass
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("math"))
 
 def apply_data_cleaning(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply data cleaning operations"""
-    df_copy = df.copy()
-    
-    # Clean string columns
-    if any(word in prompt.lower() for word in ["clean", "standardize", "format", "proper case"]):
-        string_cols = detect_string_columns(df_copy)
-        for col in string_cols:
-            if df_copy[col].dtype == 'object':
-                # Remove extra spaces and capitalize properly
-                df_copy[col] = df_copy[col].astype(str).str.strip()
-                df_copy[col] = df_copy[col].str.title()  # Proper case
-    
-    # Remove null values
-    if any(phrase in prompt.lower() for phrase in ["remove null", "drop null", "exclude null", "filter null"]):
-        initial_rows = len(df_copy)
-        df_copy = df_copy.dropna()
-        print(f"Removed {initial_rows - len(df_copy)} rows with null values")
-    
-    # Fill null values
-    if any(phrase in prompt.lower() for phrase in ["fill null", "replace null", "handle null"]):
-        numeric_cols = detect_numeric_columns(df_copy)
-        string_cols = detect_string_columns(df_copy)
-        
-        # Fill numeric nulls with 0 or mean
-        for col in numeric_cols:
-            if "mean" in prompt.lower():
-                df_copy[col].fillna(df_copy[col].mean(), inplace=True)
-            else:
-                df_copy[col].fillna(0, inplace=True)
-        
-        # Fill string nulls with "Unknown"
-        for col in string_cols:
-            df_copy[col].fillna("Unknown", inplace=True)
-    
-    # Text case transformations
-    case_match = re.search(r"(uppercase|lowercase|upper case|lower case) (\w+)", prompt.lower())
-    if case_match:
-        case_type, col_name = case_match.groups()
-        matching_cols = [col for col in df_copy.columns if col_name.lower() in col.lower()]
-        
-        for col in matching_cols:
-            if df_copy[col].dtype == 'object':
-                if "upper" in case_type:
-                    df_copy[col] = df_copy[col].astype(str).str.upper()
-                else:
-                    df_copy[col] = df_copy[col].astype(str).str.lower()
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("cleaning"))
 
 def apply_filtering(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply filtering operations"""
-    df_copy = df.copy()
-    
-    # Filter by value patterns (filter column operator value)
-    filter_match = re.search(r"filter (\w+)\s*([<>=!]+)\s*([\w\d.]+)", prompt.lower())
-    if filter_match:
-        col_name, operator, value = filter_match.groups()
-        matching_cols = [col for col in df_copy.columns if col_name.lower() in col.lower()]
-        
-        if matching_cols:
-            col = matching_cols[0]
-            try:
-                # Try to convert value to appropriate type
-                if df_copy[col].dtype in ['int64', 'float64']:
-                    value = float(value)
-                
-                if operator in [">", "gt"]:
-                    df_copy = df_copy[df_copy[col] > value]
-                elif operator in ["<", "lt"]:
-                    df_copy = df_copy[df_copy[col] < value]
-                elif operator in ["=", "==", "eq"]:
-                    df_copy = df_copy[df_copy[col] == value]
-                elif operator in ["!=", "<>", "ne"]:
-                    df_copy = df_copy[df_copy[col] != value]
-                elif operator in [">=", "gte"]:
-                    df_copy = df_copy[df_copy[col] >= value]
-                elif operator in ["<=", "lte"]:
-                    df_copy = df_copy[df_copy[col] <= value]
-            except Exception as e:
-                print(f"Error filtering {col}: {e}")
-    
-    # Filter by status/category
-    if any(phrase in prompt.lower() for phrase in ["active only", "filter active", "active customers", "active records"]):
-        status_cols = [col for col in df_copy.columns if 'status' in col.lower()]
-        if status_cols:
-            col = status_cols[0]
-            df_copy = df_copy[df_copy[col].str.lower().str.contains('active', na=False)]
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("filtering"))
 
 def apply_grouping_aggregation(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply grouping and aggregation operations"""
-    df_copy = df.copy()
-    
-    # Group by patterns (group by column and aggregate column)
-    group_match = re.search(r"group by (\w+)(?:\s+and\s+)?(?:(sum|mean|count|max|min|average)\s+(\w+))?", prompt.lower())
-    if group_match:
-        group_col_name, agg_func, agg_col_name = group_match.groups()
-        
-        # Find matching columns
-        group_cols = [col for col in df_copy.columns if group_col_name.lower() in col.lower()]
-        
-        if group_cols:
-            group_col = group_cols[0]
-            
-            if agg_func and agg_col_name:
-                agg_cols = [col for col in df_copy.columns if agg_col_name.lower() in col.lower()]
-                if agg_cols:
-                    agg_col = agg_cols[0]
-                    
-                    # Map aggregation functions
-                    agg_mapping = {
-                        'sum': 'sum',
-                        'mean': 'mean', 
-                        'average': 'mean',
-                        'count': 'count',
-                        'max': 'max',
-                        'min': 'min'
-                    }
-                    
-                    agg_function = agg_mapping.get(agg_func, 'sum')
-                    df_copy = df_copy.groupby(group_col)[agg_col].agg(agg_function).reset_index()
-                    df_copy.columns = [group_col, f"{agg_function}_{agg_col}"]
-            else:
-                # Simple groupby count
-                df_copy = df_copy.groupby(group_col).size().reset_index(name='count')
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("grouping"))
 
 def apply_sorting(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply sorting operations"""
-    df_copy = df.copy()
-    
-    # Sort by column patterns
-    sort_match = re.search(r"sort by (\w+)(?:\s+(asc|desc|ascending|descending))?", prompt.lower())
-    if sort_match:
-        col_name, order = sort_match.groups()
-        matching_cols = [col for col in df_copy.columns if col_name.lower() in col.lower()]
-        
-        if matching_cols:
-            col = matching_cols[0]
-            ascending = True if not order or order in ['asc', 'ascending'] else False
-            df_copy = df_copy.sort_values(by=col, ascending=ascending)
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("sorting"))
 
 def apply_column_operations(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply column-related operations"""
-    df_copy = df.copy()
-    
-    # Rename columns
-    rename_match = re.search(r"rename (\w+) to (\w+)", prompt.lower())
-    if rename_match:
-        old_name, new_name = rename_match.groups()
-        matching_cols = [col for col in df_copy.columns if old_name.lower() in col.lower()]
-        if matching_cols:
-            old_col = matching_cols[0]
-            df_copy = df_copy.rename(columns={old_col: new_name})
-    
-    # Add full name column
-    if any(phrase in prompt.lower() for phrase in ["full name", "combine names", "full_name"]):
-        first_name_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['first', 'fname'])]
-        last_name_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['last', 'lname', 'surname'])]
-        
-        if first_name_cols and last_name_cols:
-            first_col = first_name_cols[0]
-            last_col = last_name_cols[0]
-            df_copy['full_name'] = df_copy[first_col].astype(str) + ' ' + df_copy[last_col].astype(str)
-    
-    # Add category/classification columns
-    if any(word in prompt.lower() for word in ["category", "classify", "group into"]):
-        # Add performance categories
-        if "performance" in prompt.lower():
-            perf_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['score', 'rating', 'performance'])]
-            if perf_cols:
-                col = perf_cols[0]
-                if pd.api.types.is_numeric_dtype(df_copy[col]):
-                    df_copy['performance_category'] = pd.cut(
-                        df_copy[col], 
-                        bins=[0, 3.5, 4.0, 5.0], 
-                        labels=['Needs Improvement', 'Good', 'Excellent'],
-                        include_lowest=True
-                    )
-        
-        # Add inventory status
-        if any(word in prompt.lower() for word in ["inventory", "stock", "low stock"]):
-            stock_cols = [col for col in df_copy.columns if any(word in col.lower() for word in ['stock', 'quantity', 'inventory'])]
-            if stock_cols:
-                col = stock_cols[0]
-                if pd.api.types.is_numeric_dtype(df_copy[col]):
-                    df_copy['stock_status'] = df_copy[col].apply(
-                        lambda x: 'Low Stock' if x < 100 else 'Normal Stock'
-                    )
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("columns"))
 
 def apply_date_operations(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
     """Apply date-related operations"""
-    df_copy = df.copy()
-    
-    # Convert to datetime
-    date_match = re.search(r"convert (\w+) to datetime", prompt.lower())
-    if date_match:
-        col_name = date_match.group(1)
-        matching_cols = [col for col in df_copy.columns if col_name.lower() in col.lower()]
-        if matching_cols:
-            col = matching_cols[0]
-            df_copy[col] = pd.to_datetime(df_copy[col], errors='coerce')
-    
-    # Add timestamp
-    if any(phrase in prompt.lower() for phrase in ["add timestamp", "current time", "processing time"]):
-        df_copy['processed_at'] = datetime.now()
-    
-    return df_copy
+    return run_stage(df, compile_plan(prompt).stage("dates"))
 
-def transform_data(df: pd.DataFrame, prompt: str) -> pd.DataFrame:
+def transform_data(df: pd.DataFrame, prompt: str, on_stage=None, dataset_key: str = None, stats: dict = None,
+                   lookups: tuple = None) -> pd.DataFrame:
     """
-    Main transformation function that applies various transformations based on the prompt
+    Main transformation function that applies various transformations based on the prompt.
+    lookups are the tables the prompt's joins name (see joins.Lookup).
     """
     if df is None or df.empty:
         return pd.DataFrame()
     
     try:
-        # Start with a copy of the original dataframe
-        df_transformed = df.copy()
-        
-        # Clean column names first
-        df_transformed = clean_column_names(df_transformed)
-        
-        # Apply transformations in logical order
-        df_transformed = apply_mathematical_operations(df_transformed, prompt)
-        df_transformed = apply_data_cleaning(df_transformed, prompt)
-        df_transformed = apply_filtering(df_transformed, prompt)
-        df_transformed = apply_column_operations(df_transformed, prompt)
-        df_transformed = apply_date_operations(df_transformed, prompt)
-        df_transformed = apply_grouping_aggregation(df_transformed, prompt)
-        df_transformed = apply_sorting(df_transformed, prompt)
-        
-        # Reset index to ensure clean output
-        df_transformed = df_transformed.reset_index(drop=True)
-        
-        return df_transformed
+        # The prompt is compiled once into a cached plan of typed operations
+        plan = compile_plan(prompt)
+        if lookups:
+            from .joins import bind_lookups
+            plan = bind_lookups(plan, lookups)
+        return execute_plan(df, plan, on_stage, dataset_key, stats)
     
     except Exception as e:
         print(f"Error in data transformation: {e}")
+        if stats is not None:
+            stats["failed"] = True
         return df  # Return original data if transformation fails
\ No newline at end of file
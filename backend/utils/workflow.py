@@ -0,0 +1,647 @@
+import asyncio
+import os
+import pandas as pd
+from .etl_parser import generate_config, generate_dag, config_steps
+from .plan import Op, Stage, compile_plan, normalize_prompt
+from .transformer import transform_data, clean_column_names, run_stage
+from .openai_helper import (
+    generate_config_with_ai, get_transformation_suggestions,
+    generate_config_with_ai_async, get_transformation_suggestions_async
+)
+from .result_store import store_result, describe_schema, PREVIEW_ROWS
+from .streaming import stream_transform, iter_csv_chunks, SpilledFrame
+from .jobs import report_progress
+from .ingest import read_dataset, read_csv_file, uses_pyarrow_csv
+from .excel import SheetRange, EXCEL_EXTENSIONS, is_excel, is_converted, iter_excel_chunks, read_excel_file
+from .dataset_cache import dataset_key, get_dataset, put_dataset, has_dataset, frame_nbytes
+from .compact import compact_frame, COMPACT_INGEST, COMPACT_VERSION
+from .metrics import timed, collect_timings, count_fallback, observe
+from .serialization import json_records
+from .pushdown import Pushdown, PUSHDOWN_ENABLED, plan_pushdown, read_pushdown
+from .preview import sample_frame, read_head, preview_transform, preview_accuracy
+from .dag import Node, run_dag, render_mermaid
+from .sinks import SinkWriter, parse_sink, write_sink
+from .joins import bind_lookups, prepare_lookup, remove_lookups
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+def upload_key(filename: str, digest: str, sheet_range: SheetRange = None, pushdown: Pushdown = None) -> str:
+    """Dataset cache key for an uploaded file's content, type and ingest options"""
+    variant = [os.path.splitext(filename)[1].lower(), f"compact-{COMPACT_VERSION}" if COMPACT_INGEST else "raw"]
+    if is_excel(filename) and sheet_range is not None and sheet_range != SheetRange():
+        variant.extend(sheet_range)
+    if pushdown is not None and not pushdown.is_noop:
+        variant.append(pushdown)
+    return dataset_key(digest, *variant)
+
+def read_preview(path: str, filename: str, digest: str = None, sheet_range: SheetRange = None) -> pd.DataFrame:
+    """The first PREVIEW_ROWS rows of an upload, with all its columns"""
+    if is_excel(filename):
+        sheet_range = sheet_range or SheetRange()
+        rows = PREVIEW_ROWS if sheet_range.max_rows is None else min(sheet_range.max_rows, PREVIEW_ROWS)
+        # Only read from a converted sheet: converting it here would parse the whole workbook for a few
+        # rows. Small chunks stop the parse once the rows are read.
+        cached = digest if is_converted(digest, sheet_range.sheet) else None
+        return read_excel_file(path, filename, cached, sheet_range._replace(max_rows=rows), chunk_rows=max(rows, 1))
+    return pd.read_csv(path, nrows=PREVIEW_ROWS)
+
+def _read_pushdown(path: str, filename: str, digest: str, sheet_range: SheetRange, pushdown: Pushdown,
+                   stats: dict) -> pd.DataFrame:
+    if is_excel(filename):
+        def read_chunks(columns):
+            return iter_excel_chunks(path, filename, digest, sheet_range, columns=columns)
+
+        def read_all(columns):
+            return read_excel_file(path, filename, digest, sheet_range, columns)
+    else:
+        def read_chunks(columns):
+            if uses_pyarrow_csv():
+                # The multithreaded reader beats the C engine's chunks; the projection bounds memory
+                return iter((read_csv_file(path, usecols=columns),))
+            return iter_csv_chunks(path, usecols=columns)
+
+        def read_all(columns):
+            return read_csv_file(path, usecols=columns)
+    return read_pushdown(read_chunks, read_all, pushdown, stats)
+
+def _parse_upload(path: str, filename: str, report: dict = None, digest: str = None,
+                  sheet_range: SheetRange = None, pushdown: Pushdown = None) -> pd.DataFrame:
+    stats = {}
+    with timed("ingest", "parse") as record:
+        if pushdown is not None:
+            df = _read_pushdown(path, filename, digest, sheet_range, pushdown, stats)
+            record["rows_in"] = stats["rows_scanned"]
+        elif is_excel(filename):
+            df = read_excel_file(path, filename, digest, sheet_range)
+        else:
+            df = read_dataset(path, filename)
+        record["rows_out"] = len(df)
+    if COMPACT_INGEST:
+        with timed("ingest", "compact", rows_in=len(df)) as record:
+            df = compact_frame(df, report)
+            record["rows_out"] = len(df)
+    if pushdown is not None:
+        # Kept with the frame (and its cached copy) for the original row count
+        df.attrs["rows_scanned"] = stats["rows_scanned"]
+    return df
+
+def load_dataset(path: str, filename: str, digest: str = None, report: dict = None,
+                 sheet_range: SheetRange = None, pushdown: Pushdown = None) -> pd.DataFrame:
+    """
+    Parse an uploaded file, reusing the cached frame when the same content was parsed before.
+    report, if given, receives the frame's memory before and after compaction.
+    sheet_range selects the sheet and rows of Excel uploads; pushdown restricts the
+    columns and rows that are read.
+    """
+    if digest is None:
+        return _parse_upload(path, filename, report, sheet_range=sheet_range, pushdown=pushdown)
+
+    key = upload_key(filename, digest, sheet_range, pushdown)
+    with timed("ingest", "dataset_cache") as record:
+        df = get_dataset(key)
+        record["rows_out"] = len(df) if df is not None else 0
+    if df is None:
+        df = _parse_upload(path, filename, report, digest, sheet_range, pushdown)
+        put_dataset(key, df)
+    elif report is not None:
+        report.update({"cached": True, "bytes_after": frame_nbytes(df)})
+    return df
+
+def load_upload(path: str, filename: str, prompt: str, digest: str = None, report: dict = None,
+                sheet_range: SheetRange = None) -> tuple:
+    """
+    load_dataset for a prompt, reading only the columns and rows the prompt needs when
+    the complete upload is not cached already.
+    Returns (df, dataset key, upload): upload is None when df is the complete upload,
+    otherwise (preview, row count, load) of the upload, load() parsing all of it.
+    """
+    pushdown = None
+    if PUSHDOWN_ENABLED and filename.endswith((".csv", *EXCEL_EXTENSIONS)) \
+            and not (digest is not None and has_dataset(upload_key(filename, digest, sheet_range))):
+        preview = read_preview(path, filename, digest, sheet_range)
+        pushdown = plan_pushdown(compile_plan(prompt), preview.columns)
+        if pushdown.is_noop:
+            pushdown = None
+
+    df = load_dataset(path, filename, digest, report, sheet_range, pushdown)
+    key = upload_key(filename, digest, sheet_range, pushdown) if digest is not None else None
+    if pushdown is None:
+        return df, key, None
+    if report is not None:
+        report["pushdown"] = {
+            "columns": list(pushdown.columns) if pushdown.columns is not None else None,
+            "filters": len(pushdown.filters),
+            "rows_scanned": df.attrs.get("rows_scanned"),
+            "rows_kept": len(df),
+        }
+
+    def load_complete():
+        return load_dataset(path, filename, digest, None, sheet_range)
+    return df, key, (preview, df.attrs.get("rows_scanned", len(df)), load_complete)
+
+def run_streaming_transform(source, prompt: str, filename: str = None, digest: str = None,
+                            sheet_range: SheetRange = None, lookups: tuple = None):
+    """
+    Transform a CSV, or an Excel sheet, chunk by chunk into a disk-backed result,
+    joined to the lookup tables the prompt names.
+    Returns (original preview, result, original row count, sink output or None); chunks
+    are written to the sink the prompt asks for while later ones are transformed.
+    """
+    stats = {}
+    preview = []
+    columns = None
+    if PUSHDOWN_ENABLED and isinstance(source, str):
+        # Only the columns the prompt needs are read; the preview still shows every column
+        preview.append(read_preview(source, filename or source, digest, sheet_range))
+        columns = plan_pushdown(compile_plan(prompt), preview[0].columns).columns
+
+    def read_chunks():
+        if filename is None or not is_excel(filename):
+            return iter_csv_chunks(source, usecols=columns)
+        return iter_excel_chunks(source, filename, digest, sheet_range, columns=columns)
+
+    def chunks_with_preview():
+        for chunk in read_chunks():
+            if not preview:
+                preview.append(chunk.head(PREVIEW_ROWS))
+            yield chunk
+
+    transformed = SpilledFrame()
+    spec = parse_sink(prompt)
+    writer = SinkWriter(spec) if spec is not None else None
+    output = None
+    try:
+        with timed("stream", "transform") as record:
+            for chunk in stream_transform(chunks_with_preview, prompt, stats=stats, lookups=lookups):
+                transformed.append(chunk)
+                if writer is not None:
+                    writer.put(chunk)
+            record.update(rows_in=stats["rows_in"], rows_out=len(transformed))
+        if writer is not None:
+            if not len(transformed):
+                writer.put(transformed.slice(0, 0))  # the schema of an empty result
+            with timed("load", spec.format) as record:
+                output = writer.close()
+                record["rows_out"] = output["rows"]
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        transformed.close()
+        raise
+    if preview:
+        return preview[0], transformed, stats["rows_in"], output
+    if hasattr(source, "seek"):
+        source.seek(0)
+    original_preview = pd.read_csv(source, nrows=PREVIEW_ROWS)
+    return original_preview, transformed, stats["rows_in"], output
+
+def _transform(df: pd.DataFrame, prompt: str, upload: tuple = None, on_stage=None, dataset_key: str = None,
+               stats: dict = None, lookups: tuple = None) -> pd.DataFrame:
+    """transform_data, redone on the complete upload if it fails on a pushed-down read"""
+    transformed = transform_data(df, prompt, on_stage=on_stage, dataset_key=dataset_key, stats=stats, lookups=lookups)
+    if upload is not None and stats.get("failed"):
+        transformed = _retransform_complete(upload[2], prompt, on_stage=on_stage, stats=stats, lookups=lookups)
+    return transformed
+
+def _retransform_complete(load, prompt: str, on_stage=None, stats: dict = None, lookups: tuple = None) -> pd.DataFrame:
+    """
+    transform_data on the complete upload, load(), after it failed on a pushed-down read.
+    A failed transform returns its input, which should be the complete upload, not the filtered part.
+    """
+    count_fallback("pushdown", "transform_failed")
+    return transform_data(load(), prompt, on_stage=on_stage, stats=stats, lookups=lookups)
+
+def load_output(transformed, prompt: str):
+    """Write a result to the sink its prompt asks for; returns the sink's output description or None"""
+    spec = parse_sink(prompt)
+    if spec is None or transformed is None:
+        return None
+    with timed("load", spec.format, rows_in=len(transformed)) as record:
+        output = write_sink(transformed, spec)
+        record["rows_out"] = output["rows"]
+    return output
+
+def run_workflow(prompt: str, target_format: str = "json", df: pd.DataFrame = None, use_ai: bool = False,
+                 streamed: tuple = None, on_stage=None, dataset_key: str = None, upload: tuple = None,
+                 lookups: tuple = None) -> dict:
+    """
+    Generate the config, DAG, transformed data and AI suggestions for a prompt.
+    upload is load_upload's (preview, row count, load) when df holds only part of the upload;
+    lookups are the tables the prompt's joins name.
+    """
+    # Generate configuration in backend
+    if use_ai:
+        config = generate_config_with_ai(prompt, target_format)
+    else:
+        config = generate_config(prompt, target_format)
+
+    # Generate DAG diagram
+    dag = generate_dag(prompt)
+
+    # Transform data if file provided
+    transformed = output = None
+    transform_stats = {}
+    if df is not None:
+        transformed = _transform(df, prompt, upload, on_stage, dataset_key, transform_stats, lookups)
+        output = load_output(transformed, prompt)
+
+    # Streamed results stay on disk; only the original preview is kept
+    original = df
+    original_rows = len(df) if df is not None else 0
+    if streamed is not None:
+        original, transformed, original_rows, output = streamed
+    elif upload is not None:
+        original, original_rows, _ = upload
+
+    # Get AI transformation suggestions if available
+    ai_suggestions = None
+    if use_ai and original is not None:
+        ai_suggestions = get_transformation_suggestions(original.columns.tolist(), prompt)
+
+    return {
+        "config": config,
+        "dag": dag,
+        "original": original,
+        "transformed": transformed,
+        "original_rows": original_rows,
+        "streamed": streamed is not None,
+        "partial": upload is not None,
+        "output": output,
+        "stages_reused": transform_stats.get("stages_reused", []),
+        "ai_suggestions": ai_suggestions,
+        "ai_used": use_ai
+    }
+
+async def run_workflow_async(prompt: str, target_format: str = "json", df: pd.DataFrame = None, use_ai: bool = False,
+                             streamed: tuple = None, dataset_key: str = None, upload: tuple = None,
+                             lookups: tuple = None) -> dict:
+    """
+    Same result as run_workflow, but the AI calls and the transform (in a worker thread)
+    run concurrently, so AI-mode latency is the slowest of them rather than their sum.
+    """
+    original = df
+    original_rows = len(df) if df is not None else 0
+    if streamed is not None:
+        original, _, original_rows, _ = streamed
+    elif upload is not None:
+        original, original_rows, _ = upload
+
+    async def build_config():
+        if use_ai:
+            return await generate_config_with_ai_async(prompt, target_format)
+        return generate_config(prompt, target_format)
+
+    async def transform():
+        if streamed is not None:
+            return streamed[1], streamed[3]
+        if df is None:
+            return None, None
+        transformed = await asyncio.to_thread(_transform, df, prompt, upload, dataset_key=dataset_key,
+                                              stats=transform_stats, lookups=lookups)
+        return transformed, await asyncio.to_thread(load_output, transformed, prompt)
+
+    async def suggest():
+        if use_ai and original is not None:
+            return await get_transformation_suggestions_async(original.columns.tolist(), prompt)
+        return None
+
+    transform_stats = {}
+    config, (transformed, output), ai_suggestions = await asyncio.gather(build_config(), transform(), suggest())
+
+    return {
+        "config": config,
+        "dag": generate_dag(prompt),
+        "original": original,
+        "transformed": transformed,
+        "original_rows": original_rows,
+        "streamed": streamed is not None,
+        "partial": upload is not None,
+        "output": output,
+        "stages_reused": transform_stats.get("stages_reused", []),
+        "ai_suggestions": ai_suggestions,
+        "ai_used": use_ai
+    }
+
+def _stage_node(stages: tuple, first: bool, prepared_joins: tuple = ()):
+    """
+    Node function running plan stages, as execute_plan would. Like transform_data, a
+    failing stage does not fail the run: it passes on its input marked with the stage's
+    name, which later stages pass through (see run_dag_workflow).
+    The node's inputs after the frame are the prepared lookups of the joins numbered in
+    prepared_joins (see _lookup_node); other joins prepare their own.
+    """
+    def run(df: pd.DataFrame, *prepared) -> pd.DataFrame:
+        if "failed_stage" in df.attrs:
+            return df
+        if first:
+            if df.empty:
+                return pd.DataFrame()  # as transform_data returns for empty input
+            df = clean_column_names(df.copy(deep=False))
+        elif df.shape == (0, 0):
+            return df
+        # Imported here like in execute_plan: the parallel executor builds on the transformer
+        from .parallel import partitioned_run_length, run_partitioned
+        ready = dict(zip(prepared_joins, prepared))
+        for stage in stages:
+            if stage.name == "joining":
+                stage = Stage(stage.name, tuple(Op(op.kind, (*op.params, ready.get(i))) for i, op in enumerate(stage.ops)))
+            try:
+                if partitioned_run_length((stage,), 0, len(df)):
+                    df = run_partitioned(df, (stage,))
+                else:
+                    df = run_stage(df, stage)
+            except Exception as e:
+                print(f"Error in data transformation: {e}")
+                failed = df.copy(deep=False)
+                failed.attrs["failed_stage"] = stage.name
+                return failed
+        return df
+    return run
+
+def _lookup_node(lookup, key: str, path: str, filename: str, digest: str, sheet_range: SheetRange):
+    """Node function preparing a join's lookup (see joins.prepare_lookup), or None if it cannot be"""
+    def run():
+        columns = clean_column_names(read_preview(path, filename, digest, sheet_range)).columns
+        try:
+            return prepare_lookup(lookup, key, columns)
+        except Exception:
+            return None  # the join raises the same error, and its stage falls back
+    return run
+
+def _step_owners(steps: list, stages: tuple) -> list:
+    """
+    The config step each plan stage comes from: the first step whose own description
+    compiles to that stage, or None when none does on its own (e.g. a phrase the step
+    split cut in two).
+    """
+    return [
+        next((step for step in steps if not compile_plan(step["description"]).stage(stage.name).is_noop), None)
+        for stage in stages
+    ]
+
+def _mentions(step: dict, *names) -> bool:
+    description = step["description"].lower()
+    return any(name.lower() in description for name in names)
+
+def workflow_nodes(prompt: str, steps: list, path: str, filename: str, digest: str = None,
+                   sheet_range: SheetRange = None, ingest: dict = None, lookups: tuple = None) -> tuple:
+    """
+    The DAG of a workflow run on an upload, derived from its config's steps.
+
+    The upload and every lookup a join names are independent extract nodes, so lookups
+    are indexed (or partitioned) while the upload is parsed. Plan stages keep their
+    order, since each transforms the previous one's output; consecutive stages that come
+    from the same step are one transform node named after it, and the join stage also
+    depends on its lookups' nodes. A sink the prompt asks for is a final "load" node.
+    Returns (nodes, ID of the node with the transformed frame).
+    """
+    def extract() -> pd.DataFrame:
+        return load_upload(path, filename, prompt, digest, ingest, sheet_range)[0]
+
+    plan = bind_lookups(compile_plan(prompt), lookups)
+    extract_steps = [step for step in steps if step.get("action") == "extract"]
+    upload_step = next((step for step in extract_steps if not any(
+        _mentions(step, lookup.name, lookup.filename) for lookup in lookups or ())), None)
+    nodes = [Node("extract", upload_step["description"] if upload_step else f"Extract {filename}", "extract", extract)]
+
+    # One extract node per join with an uploaded lookup, by the join's position in its stage
+    lookup_nodes = {}
+    for i, op in enumerate(plan.stage("joining").ops):
+        table, key, _, lookup = op.params
+        if lookup is None:
+            continue
+        node_id = f"extract_{lookup.name}" + (f"_{i + 1}" if f"extract_{lookup.name}" in lookup_nodes.values() else "")
+        step = next((step for step in extract_steps if _mentions(step, lookup.name, lookup.filename)), None)
+        label = step["description"] if step is not None else f"Extract {lookup.filename}"
+        nodes.append(Node(node_id, label, "extract", _lookup_node(lookup, key, path, filename, digest, sheet_range)))
+        lookup_nodes[i] = node_id
+
+    # Runs of consecutive stages from the same step
+    groups = []
+    stages = plan.active_stages
+    for stage, owner in zip(stages, _step_owners(steps, stages)):
+        if groups and owner is not None and groups[-1][0] is owner:
+            groups[-1][1].append(stage)
+        else:
+            groups.append((owner, [stage]))
+
+    previous = "extract"
+    for i, (owner, group) in enumerate(groups):
+        node_id = f"step_{owner.get('id', i + 1)}" if owner is not None else f"transform_{group[0].name}"
+        if any(node.id == node_id for node in nodes):
+            node_id += f"_{group[0].name}"
+        ops = ", ".join(f"join {op.params[0]}" if op.kind == "join" else op.kind for stage in group for op in stage.ops)
+        label = f"{owner['description'] if owner is not None else group[0].name.capitalize()}: {ops}"
+        prepared_joins = tuple(lookup_nodes) if any(stage.name == "joining" for stage in group) else ()
+        deps = (previous,) + tuple(lookup_nodes[j] for j in prepared_joins)
+        nodes.append(Node(node_id, label, "transform", _stage_node(tuple(group), i == 0, prepared_joins), deps))
+        previous = node_id
+
+    spec = parse_sink(prompt)
+    if spec is not None:
+        raw = previous == "extract"
+
+        def load(df: pd.DataFrame) -> dict:
+            if "failed_stage" in df.attrs:
+                return None  # run_dag_workflow writes the untransformed result instead
+            return write_sink(clean_column_names(df.copy(deep=False)) if raw else df, spec)
+
+        load_step = next((step for step in steps if step.get("action") == "load"), None)
+        label = load_step["description"] if load_step is not None else f"Load {spec.format}"
+        if spec.partition_by:
+            label += f" partitioned by {spec.partition_by}"
+        nodes.append(Node("load", label, "load", load, (previous,)))
+    return nodes, previous
+
+def run_dag_workflow(prompt: str, target_format: str = "json", path: str = None, filename: str = None,
+                     use_ai: bool = False, digest: str = None, sheet_range: SheetRange = None, on_node=None,
+                     lookups: tuple = None) -> dict:
+    """
+    run_workflow, executed as a DAG of extract and transform nodes (see workflow_nodes).
+    With a digest, node outputs are checkpointed, so re-running the same upload and
+    prompt after a failure resumes from the last nodes that completed. The "dag"
+    diagram shows the executed graph with each node's timing.
+    """
+    if use_ai:
+        config = generate_config_with_ai(prompt, target_format)
+    else:
+        config = generate_config(prompt, target_format)
+
+    ingest = {}
+    # An AI config's steps may not parse; the generated config's always do
+    steps = config_steps(config) or config_steps(generate_config(prompt))
+    nodes, last = workflow_nodes(prompt, steps, path, filename, digest, sheet_range, ingest, lookups)
+    run_key = None
+    if digest is not None:
+        run_key = dataset_key(digest, "dag", upload_key(filename, digest, sheet_range), normalize_prompt(prompt),
+                              PUSHDOWN_ENABLED, *(lookup.digest for lookup in lookups or ()))
+    targets = ("extract", last) + tuple(node.id for node in nodes if node.action == "load")
+    outputs, report = run_dag(nodes, run_key, targets=tuple(dict.fromkeys(targets)), on_node=on_node)
+
+    df = outputs["extract"]
+    transformed = pd.DataFrame() if df.empty else outputs[last]
+    # A pushed-down read holds only part of the upload; its preview shows the rest
+    partial = "rows_scanned" in df.attrs
+    failed_stage = transformed.attrs.get("failed_stage")
+    output = outputs.get("load")
+    if failed_stage is not None:
+        # As in _transform: the untransformed upload, or the transform redone on all of it after a pushed-down read
+        transformed = df
+        if partial:
+            transformed = _retransform_complete(lambda: load_dataset(path, filename, digest, None, sheet_range), prompt,
+                                                lookups=lookups)
+        output = load_output(transformed, prompt)
+    else:
+        if transformed is df:
+            transformed = clean_column_names(df.copy(deep=False))
+        transformed.index = pd.RangeIndex(len(transformed))
+    original = read_preview(path, filename, digest, sheet_range) if partial else df
+
+    ai_suggestions = None
+    if use_ai:
+        ai_suggestions = get_transformation_suggestions(original.columns.tolist(), prompt)
+
+    return {
+        "config": config,
+        "dag": render_mermaid(report),
+        "dag_run": {"nodes": report, "resumed": any(entry["status"] == "resumed" for entry in report),
+                    "failed_stage": failed_stage},
+        "original": original,
+        "transformed": transformed,
+        "original_rows": df.attrs.get("rows_scanned", len(df)),
+        "streamed": False,
+        "partial": partial,
+        "output": output,
+        "stages_reused": [],
+        "ingest": ingest or None,
+        "ai_suggestions": ai_suggestions,
+        "ai_used": use_ai
+    }
+
+def run_preview(prompt: str, target_format: str = "json", path: str = None, filename: str = None,
+                digest: str = None, sheet_range: SheetRange = None, lookups: tuple = None) -> dict:
+    """
+    Preview mode: run the pipeline on a sample of the upload and return only the preview
+    rows. A cached parse of the upload is sampled at random; otherwise only its head is read.
+    The response's "preview" entry says how the sample was taken and whether it is exact.
+    """
+    plan = bind_lookups(compile_plan(prompt), lookups)
+    key = upload_key(filename, digest, sheet_range) if digest is not None else None
+    with timed("preview", "sample") as record:
+        if key is not None and has_dataset(key):
+            sample = sample_frame(get_dataset(key))
+        else:
+            sample = read_head(path, filename, digest, sheet_range)
+        record["rows_out"] = len(sample.df)
+    with timed("preview", "transform", rows_in=len(sample.df)) as record:
+        transformed, transformed_rows = preview_transform(sample.df, plan)
+        record["rows_out"] = transformed_rows
+
+    return {
+        "success": True,
+        "config": generate_config(prompt, target_format),
+        "dag": generate_dag(prompt),
+        "result_id": None,
+        "transformed_data": json_records(transformed),
+        "original_data": json_records(sample.df.head(PREVIEW_ROWS)),
+        "transformed_rows": transformed_rows,
+        "original_rows": sample.total_rows if sample.total_rows is not None else len(sample.df),
+        "stages_reused": [],
+        "ingest": None,
+        "schema": {
+            "original": describe_schema(sample.df),
+            "transformed": describe_schema(transformed)
+        },
+        "preview": {
+            "method": sample.method,
+            "rows_sampled": len(sample.df),
+            "total_rows": sample.total_rows,
+            **preview_accuracy(plan, sample, transformed_rows)
+        },
+        "ai_suggestions": None,
+        "ai_used": False
+    }
+
+def build_response(workflow: dict, include_timings: bool = False) -> dict:
+    """Keep full results server-side and build the preview response"""
+    with timed("response", "build"):
+        response = _build_response(workflow)
+    if include_timings:
+        response["timings"] = workflow.get("timings") or []
+    return response
+
+def build_job_response(workflow: dict, include_timings: bool = False) -> dict:
+    """build_response for a workflow that ran in a worker process, whose metrics stayed there"""
+    for record in workflow.get("timings") or []:
+        observe(record)
+    return build_response(workflow, include_timings)
+
+def _build_response(workflow: dict) -> dict:
+    original = workflow["original"]
+    transformed = workflow["transformed"]
+
+    result_id = None
+    if workflow["streamed"] or workflow.get("partial"):
+        # Only a preview of the original data was kept
+        result_id = store_result({"transformed": transformed})
+    elif original is not None:
+        result_id = store_result({"original": original, "transformed": transformed})
+
+    return {
+        "success": True,
+        "config": workflow["config"],
+        "dag": workflow["dag"],
+        "result_id": result_id,
+        "transformed_data": json_records(transformed.head(PREVIEW_ROWS)) if transformed is not None else [],
+        "original_data": json_records(original.head(PREVIEW_ROWS)) if original is not None else [],
+        "transformed_rows": len(transformed) if transformed is not None else 0,
+        "original_rows": workflow["original_rows"],
+        "stages_reused": workflow["stages_reused"],
+        "ingest": workflow.get("ingest"),
+        "output": workflow.get("output"),
+        "dag_run": workflow.get("dag_run"),
+        "schema": {
+            "original": describe_schema(original) if original is not None else [],
+            "transformed": describe_schema(transformed) if transformed is not None else []
+        },
+        "ai_suggestions": workflow["ai_suggestions"],
+        "ai_used": workflow["ai_used"]
+    }
+
+def run_workflow_job(status, path: str, filename: str, prompt: str, target_format: str = "json", use_ai: bool = False,
+                     digest: str = None, sheet_range: SheetRange = None, use_dag: bool = False,
+                     lookups: tuple = None) -> dict:
+    """Process-pool entry point for background workflow jobs; removes the spooled upload and lookups when done"""
+    try:
+        timings = collect_timings()
+        if use_dag and path:
+            def on_node(entry: dict, completed: int, total: int):
+                report_progress(status, 0.05 + 0.9 * completed / total, f"{entry['action']}: {entry['id']}")
+
+            report_progress(status, 0.05, "running DAG")
+            workflow = run_dag_workflow(prompt, target_format, path, filename, use_ai, digest, sheet_range, on_node,
+                                        lookups)
+            workflow["timings"] = timings
+            report_progress(status, 0.95, "storing results")
+            return workflow
+
+        df = key = upload = None
+        ingest = {}
+        if path:
+            report_progress(status, 0.05, "parsing")
+            df, key, upload = load_upload(path, filename, prompt, digest, ingest, sheet_range)
+
+        def on_stage(stage_name: str, completed: int, total: int):
+            report_progress(status, 0.1 + 0.8 * completed / total, f"transform: {stage_name}")
+
+        report_progress(status, 0.1, "transforming")
+        workflow = run_workflow(prompt, target_format, df, use_ai, on_stage=on_stage, dataset_key=key, upload=upload,
+                                lookups=lookups)
+        workflow["ingest"] = ingest or None
+        workflow["timings"] = timings
+        report_progress(status, 0.95, "storing results")
+        return workflow
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+        remove_lookups(lookups)